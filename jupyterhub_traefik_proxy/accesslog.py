@@ -0,0 +1,173 @@
+"""Per-route statistics from traefik's JSON access log
+
+Traefik writes one JSON object per request to its access log,
+with the name of the router that handled the request,
+its duration and its status code.
+:func:`follow_access_log` reads the log as it is written,
+and :class:`AccessLogStats` aggregates it by route in memory.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import asyncio
+import json
+import os
+from bisect import bisect_left
+
+from . import traefik_utils
+
+
+class AccessLogStats:
+    """Request count, status and duration histograms of traefik routes
+
+    Routes are identified by their traefik router name,
+    and only the routers of `provider_name` are counted.
+    At most `max_routes` routes are tracked;
+    requests to other routes are counted under the routespec `None`,
+    so memory is bounded whatever the number of routes.
+    """
+
+    def __init__(self, provider_name, buckets, max_routes=1000):
+        self.provider_name = provider_name
+        # upper bounds of duration buckets, in seconds, ending with +Inf
+        self.buckets = sorted(buckets)
+        if not self.buckets or self.buckets[-1] != float("inf"):
+            self.buckets.append(float("inf"))
+        self.max_routes = max_routes
+        # routespec: {"requests": n, "status": {"2xx": n}, "durations": [n by bucket]}
+        self._routes = {}
+        self.skipped = 0
+
+    def _routespec(self, router):
+        """The routespec of a traefik router name, or None if it's not a route's"""
+        if not router:
+            return None
+        name, _, provider = router.rpartition("@")
+        if provider != self.provider_name or not name.startswith("router_"):
+            return None
+        return traefik_utils.routespec_from_alias(name, "router")
+
+    def add(self, entry):
+        """Count an access log entry, as a dict"""
+        routespec = self._routespec(entry.get("RouterName"))
+        if routespec is None:
+            # e.g. the api, or requests matching no route
+            self.skipped += 1
+            return
+        if routespec not in self._routes and len(self._routes) >= self.max_routes:
+            routespec = None
+        stats = self._routes.get(routespec)
+        if stats is None:
+            stats = self._routes[routespec] = {
+                "requests": 0,
+                "status": {},
+                "durations": [0] * len(self.buckets),
+            }
+        stats["requests"] += 1
+        status = entry.get("DownstreamStatus")
+        status_class = f"{status // 100}xx" if isinstance(status, int) else "other"
+        stats["status"][status_class] = stats["status"].get(status_class, 0) + 1
+        # Duration is in nanoseconds
+        duration = entry.get("Duration", 0) / 1e9
+        stats["durations"][bisect_left(self.buckets, duration)] += 1
+
+    def add_line(self, line):
+        """Count a line of the JSON access log"""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            self.skipped += 1
+            return
+        if isinstance(entry, dict):
+            self.add(entry)
+        else:
+            self.skipped += 1
+
+    def reset(self):
+        """Forget all requests counted so far"""
+        self._routes.clear()
+        self.skipped = 0
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """Return the statistics of each route, by routespec
+
+        Each route has:
+
+        - `requests`: the number of requests
+        - `status`: the number of requests by status class (e.g. `"2xx"`)
+        - `duration_quantiles`: estimated request duration in seconds by quantile
+
+        Requests to routes beyond `max_routes` are under the routespec `None`.
+        """
+        summary = {}
+        for routespec, stats in self._routes.items():
+            cumulative = 0
+            buckets = []
+            for le, count in zip(self.buckets, stats["durations"]):
+                cumulative += count
+                buckets.append((le, cumulative))
+            summary[routespec] = {
+                "requests": stats["requests"],
+                "status": dict(stats["status"]),
+                "duration_quantiles": {
+                    q: traefik_utils.histogram_quantile(q, buckets) for q in quantiles
+                },
+            }
+        return summary
+
+
+async def follow_access_log(path, stats, interval=1, from_start=False):
+    """Read an access log file as it is written, counting its lines in `stats`
+
+    Runs until cancelled. Waits for the file to exist, and reopens it
+    when it is rotated (replaced or truncated).
+    Only lines written after the file is first opened are counted,
+    unless `from_start` is True.
+    Reads are done in a thread, to not block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    f = None
+    partial_line = ""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, encoding="utf8", errors="replace")
+                except FileNotFoundError:
+                    await asyncio.sleep(interval)
+                    # a new file is read from its start
+                    from_start = True
+                    continue
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                partial_line = ""
+
+            while True:
+                data = await loop.run_in_executor(None, f.read, 1 << 20)
+                if not data:
+                    break
+                lines = (partial_line + data).split("\n")
+                partial_line = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        stats.add_line(line)
+
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if st is None or st.st_ino != os.fstat(f.fileno()).st_ino:
+                # rotated: finish with this file, then read the new one from its start
+                f.close()
+                f = None
+                from_start = True
+            elif st.st_size < f.tell():
+                # truncated
+                f.seek(0)
+                partial_line = ""
+            else:
+                await asyncio.sleep(interval)
+    finally:
+        if f is not None:
+            f.close()
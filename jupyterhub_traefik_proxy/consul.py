@@ -18,11 +18,14 @@ Route Specification:
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import asyncio
 import base64
 import string
+from bisect import bisect_left
+from itertools import islice
 from urllib.parse import urlparse
 
-from traitlets import Any, Unicode, default
+from traitlets import Any, Integer, Unicode, default
 
 from .kv_proxy import TKvProxy
 
@@ -71,6 +74,16 @@ class TraefikConsulProxy(TKvProxy):
         deprecated_for="consul_password",
     )
 
+    consul_max_txn_ops = Integer(
+        64,
+        config=True,
+        help="""The maximum number of operations in a single consul transaction.
+
+        Consul allows at most 64.
+        Larger batches are split into several transactions.
+        """,
+    )
+
     consul = Any()
 
     @default("consul")
@@ -146,6 +159,10 @@ class TraefikConsulProxy(TKvProxy):
         else:
             self.log.debug("Successfully uploaded payload to KV store")
 
+    @property
+    def _kv_max_txn_ops(self):
+        return self.consul_max_txn_ops
+
     async def _kv_atomic_delete(self, *to_delete):
         payload = []
 
@@ -173,11 +190,65 @@ class TraefikConsulProxy(TKvProxy):
                 }
             ]
         )
-        kv_list = [
+        kv_list = (
             (
                 item["KV"]["Key"],
                 base64.b64decode(item["KV"]["Value"] or '').decode("utf8"),
             )
             for item in response["Results"]
-        ]
+        )
         return self.unflatten_dict_from_kv(kv_list, root_key=prefix)
+
+    async def _kv_get(self, key):
+        _, item = await self.consul.kv.get(key)
+        if not item or item["Value"] is None:
+            return None
+        return item["Value"].decode("utf8")
+
+    async def _kv_get_batch(self, keys):
+        """Read several trees with get-tree verbs in one transaction
+
+        'get-tree' matches every key starting with its prefix,
+        and route aliases can be prefixes of each other
+        (e.g. the hub route's alias is a prefix of every path route's),
+        so only trees, whose keys end with the separator, are read with it.
+        'get' fails the whole transaction for a missing key,
+        so single keys are read concurrently with their own requests.
+        """
+        trees = [key for key in keys if key.endswith(self.kv_separator)]
+        singles = [key for key in keys if not key.endswith(self.kv_separator)]
+        values = dict(
+            zip(singles, await asyncio.gather(*(self._kv_get(key) for key in singles)))
+        )
+
+        chunk_size = self.consul_max_txn_ops
+        kv_dict = {}
+        for start in range(0, len(trees), chunk_size):
+            response = await self.consul.txn.put(
+                payload=[
+                    {"KV": {"Verb": "get-tree", "Key": key}}
+                    for key in trees[start : start + chunk_size]
+                ]
+            )
+            for item in response["Results"] or []:
+                kv_dict[item["KV"]["Key"]] = base64.b64decode(
+                    item["KV"]["Value"] or ''
+                ).decode("utf8")
+
+        # sorted keys, to find the keys under each prefix with bisect
+        sorted_keys = sorted(kv_dict)
+        results = []
+        for key in keys:
+            if not key.endswith(self.kv_separator):
+                results.append(values[key])
+                continue
+            kv_list = []
+            for k in islice(sorted_keys, bisect_left(sorted_keys, key), None):
+                if not k.startswith(key):
+                    break
+                kv_list.append((k, kv_dict[k]))
+            if kv_list:
+                results.append(self.unflatten_dict_from_kv(kv_list, root_key=key))
+            else:
+                results.append({})
+        return results
@@ -18,14 +18,21 @@ Route Specification:
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from urllib.parse import urlparse
 
 from tornado.concurrent import run_on_executor
-from traitlets import Any, Bool, List, Unicode, default
+from traitlets import Any, Bool, Enum, Integer, List, Unicode, default
 
+from . import traefik_utils
 from .kv_proxy import TKvProxy
 
+# set while reading routes in order to write them,
+# which must always see the latest revision
+_latest_reads = ContextVar("latest_reads", default=False)
+
 
 class TraefikEtcdProxy(TKvProxy):
     """JupyterHub Proxy implementation using traefik and etcd"""
@@ -82,6 +89,38 @@ class TraefikEtcdProxy(TKvProxy):
         help="URL for the etcd endpoint.",
     )
 
+    etcd_urls = List(
+        Unicode(),
+        config=True,
+        help="""URLs of all the members of an etcd cluster.
+
+        If set, overrides :attr:`etcd_url`.
+        Each proxy connects to one member chosen at random,
+        which spreads the load of several Hubs across the cluster,
+        and fails over to the next member when one becomes unavailable.
+        Traefik is given all the endpoints as well.
+
+        Requires the etcdpy package.
+        """,
+    )
+
+    etcd_read_consistency = Enum(
+        ["linearizable", "serializable"],
+        default_value="linearizable",
+        config=True,
+        help="""The consistency of reads of routes from etcd.
+
+        Linearizable reads (etcd's default) go through the cluster leader,
+        and always see the latest writes.
+        Serializable reads are served by the etcd member the proxy is connected to,
+        which takes load off the leader but may return slightly stale routes,
+        e.g. when `check_routes` polls routes frequently.
+
+        Reads made before writing a route (e.g. to skip unchanged routes)
+        are always linearizable.
+        """,
+    )
+
     etcd_username = Unicode(
         "",
         config=True,
@@ -106,6 +145,71 @@ class TraefikEtcdProxy(TKvProxy):
         deprecated_for="etcd_password",
     )
 
+    etcd_max_txn_ops = Integer(
+        128,
+        config=True,
+        help="""The maximum number of operations in a single etcd transaction.
+
+        Should match etcd's `--max-txn-ops` (default: 128).
+        Larger batches are split into several transactions.
+        """,
+    )
+
+    etcd_page_size = Integer(
+        1000,
+        config=True,
+        help="""The maximum number of keys to read from etcd in a single range request.
+
+        Large trees, e.g. all routes, are read in pages of this size,
+        which keeps each response below grpc's maximum message size
+        and bounds the memory used while reading.
+        All pages of a read are taken from the same etcd revision.
+
+        Set to 0 to read each tree in a single request.
+        """,
+    )
+
+    etcd_compare_and_swap = Bool(
+        False,
+        config=True,
+        help="""Write each route with a compare-and-swap transaction.
+
+        Use when several Hubs share the same prefixes,
+        e.g. blue/green deployments during upgrades.
+        The keys of a route are read with their revisions,
+        and the write only succeeds if none of them changed in the meantime.
+        Keys that are no longer part of the route are deleted in the same transaction.
+        On conflict, the route is read again and the write retried,
+        up to :attr:`etcd_cas_retries` times.
+        """,
+    )
+
+    etcd_cas_retries = Integer(
+        5,
+        config=True,
+        help="""How many times to retry writing a route after a compare-and-swap conflict.""",
+    )
+
+    etcd_route_lease_ttl = Integer(
+        0,
+        config=True,
+        help="""Attach routes to an etcd lease with this time-to-live (in seconds).
+
+        The proxy keeps the lease alive,
+        with a single keepalive request for all routes every `ttl / 3` seconds.
+        If the Hub goes away, its routes are deleted by etcd when the lease expires,
+        instead of staying until a later `check_routes`.
+        The id of the lease is stored under :attr:`kv_jupyterhub_prefix`,
+        so a restarted Hub resumes the same lease if it hasn't expired yet.
+        The ttl should be comfortably longer than a restart of the Hub.
+
+        Only the keys of routes (their traefik config and jupyterhub records) are leased.
+        The api router and TLS config, written when the proxy starts, are not.
+
+        0 (default) disables leases: routes stay until they are deleted.
+        """,
+    )
+
     etcd = Any()
 
     @default("etcd")
@@ -117,6 +221,8 @@ class TraefikEtcdProxy(TKvProxy):
             raise ImportError(
                 "Please install etcd3 or etcdpy package to use traefik-proxy with etcd3"
             )
+        if self.etcd_urls:
+            return self._multi_endpoint_client()
         kwargs = {
             'host': etcd_service.hostname,
             'port': etcd_service.port,
@@ -134,58 +240,483 @@ class TraefikEtcdProxy(TKvProxy):
             )
         return etcd3.client(**kwargs)
 
+    def _multi_endpoint_client(self):
+        try:
+            from etcd3 import Endpoint, MultiEndpointEtcd3Client
+        except ImportError:
+            raise ImportError(
+                "Please install etcdpy package to use traefik-proxy with several etcd endpoints"
+            )
+        credentials = None
+        if self.etcd_client_ca_cert:
+            credentials = MultiEndpointEtcd3Client.get_secure_creds(
+                self.etcd_client_ca_cert,
+                self.etcd_client_cert_key,
+                self.etcd_client_cert_crt,
+            )
+        endpoints = []
+        for url in self.etcd_urls:
+            url = urlparse(url)
+            endpoints.append(
+                Endpoint(
+                    url.hostname,
+                    url.port or 2379,
+                    secure=credentials is not None,
+                    creds=credentials,
+                    opts=self.grpc_options,
+                )
+            )
+        kwargs = {}
+        if self.etcd_password:
+            kwargs = {"user": self.etcd_username, "password": self.etcd_password}
+        return MultiEndpointEtcd3Client(endpoints=endpoints, failover=True, **kwargs)
+
+    async def stop(self):
+        # stop the keepalive before closing the client,
+        # whether or not we started traefik
+        if self._etcd_keepalive_task is not None:
+            self._etcd_keepalive_task.cancel()
+            self._etcd_keepalive_task = None
+        await super().stop()
+
     def _cleanup(self):
         super()._cleanup()
         self.etcd.close()
 
+    # the lease shared by all routes
+
+    _etcd_lease_id = None
+    _etcd_keepalive_task = None
+
+    _etcd_lease_lock = Any()
+
+    @default("_etcd_lease_lock")
+    def _default_lease_lock(self):
+        return asyncio.Lock()
+
+    @property
+    def _etcd_lease_key(self):
+        return self.kv_separator.join([self.kv_jupyterhub_prefix, "lease"])
+
+    @run_on_executor
+    def _etcd_resume_or_grant_lease(self):
+        """Return the id of the stored lease if it is still alive, or of a new one"""
+        value, _ = self._etcd_call(self.etcd.get, self._etcd_lease_key)
+        if value is not None:
+            lease_id = int(value)
+            if self._etcd_call(self._etcd_lease_ttl, lease_id) > 0:
+                self.log.info("Resuming etcd lease %x of routes", lease_id)
+                return lease_id
+        lease = self._etcd_call(self.etcd.lease, self.etcd_route_lease_ttl)
+        self._etcd_call(self.etcd.put, self._etcd_lease_key, str(lease.id))
+        self.log.info(
+            "Created etcd lease %x of routes, with a ttl of %is",
+            lease.id,
+            self.etcd_route_lease_ttl,
+        )
+        return lease.id
+
+    def _etcd_lease_ttl(self, lease_id):
+        """Return the remaining ttl of a lease (<= 0 if expired)
+
+        Unlike etcd3's get_lease_info, doesn't list the keys of the lease.
+        """
+        from etcd3.etcdrpc import LeaseTimeToLiveRequest
+
+        request = LeaseTimeToLiveRequest(ID=lease_id, keys=False)
+        return self._etcd_rpc("leasestub", "LeaseTimeToLive", request).TTL
+
+    @run_on_executor
+    def _etcd_refresh_lease(self, lease_id):
+        """Send one keepalive for a lease, returning its new ttl (<= 0 if expired)"""
+
+        def refresh():
+            # the keepalive is sent while iterating
+            for response in self.etcd.refresh_lease(lease_id):
+                return response.TTL
+            return 0
+
+        return self._etcd_call(refresh)
+
+    async def _etcd_route_lease(self):
+        """Return the id of the lease to attach routes to, or None"""
+        if not self.etcd_route_lease_ttl:
+            return None
+        async with self._etcd_lease_lock:
+            if self._etcd_lease_id is None:
+                self._etcd_lease_id = await self._etcd_resume_or_grant_lease()
+                if self._etcd_keepalive_task is None:
+                    self._etcd_keepalive_task = asyncio.ensure_future(
+                        self._etcd_keepalive()
+                    )
+        return self._etcd_lease_id
+
+    async def _etcd_keepalive(self):
+        """Keep the lease of all routes alive until the proxy stops"""
+        interval = max(self.etcd_route_lease_ttl / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            lease_id = self._etcd_lease_id
+            if lease_id is None:
+                continue
+            try:
+                ttl = await self._etcd_refresh_lease(lease_id)
+            except Exception as e:
+                self.log.error("Failed to refresh etcd lease %x: %s", lease_id, e)
+                continue
+            if ttl <= 0:
+                # the next route written gets a new lease,
+                # and check_routes adds back the routes that expired
+                self.log.warning(
+                    "etcd lease %x expired, and its routes were deleted", lease_id
+                )
+                if self._etcd_lease_id == lease_id:
+                    self._etcd_lease_id = None
+
     # low-level etcd APIs
+
+    def _etcd_call(self, method, *args, **kwargs):
+        """Call an etcd client method, retrying on the other endpoints if one fails
+
+        The client marks a failed endpoint and switches to another one,
+        but doesn't retry the request itself.
+        Our writes are idempotent, so they can be retried as well as reads.
+        """
+        from etcd3.exceptions import (
+            ConnectionFailedError,
+            ConnectionTimeoutError,
+            InternalServerError,
+        )
+
+        attempts = max(len(self.etcd_urls), 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                return method(*args, **kwargs)
+            except (
+                ConnectionFailedError,
+                ConnectionTimeoutError,
+                InternalServerError,
+            ) as e:
+                if attempt == attempts:
+                    raise
+                self.log.warning(
+                    "etcd endpoint failed (%s), retrying on another endpoint", e
+                )
+
+    def _etcd_read_kwargs(self):
+        """Extra arguments for range requests, according to etcd_read_consistency"""
+        if self.etcd_read_consistency == "serializable" and not _latest_reads.get():
+            return {"serializable": True}
+        return {}
+
     @run_on_executor
     def _etcd_transaction(self, success_actions):
-        status, response = self.etcd.transaction(
-            compare=[], success=success_actions, failure=[]
+        status, response = self._etcd_call(
+            self.etcd.transaction, compare=[], success=success_actions, failure=[]
         )
         if status != True:
             raise RuntimeError(f"etcd transaction failed: {status}: {response}")
         return response
 
     @run_on_executor
-    def _etcd_get(self, key):
-        value, _ = self.etcd.get(key)
+    def _etcd_get_revisions(self, keys):
+        """Read the mod revision of the keys under each key or prefix
+
+        Returns a list with a dict of mod revisions by key, for each key.
+        Always a linearizable read, since it is only used to write.
+        """
+        from etcd3.utils import prefix_range_end, to_bytes
+
+        get = self.etcd.transactions.get
+        ops = [
+            get(key, prefix_range_end(to_bytes(key)))
+            if key.endswith(self.kv_separator)
+            else get(key)
+            for key in keys
+        ]
+        _, responses = self._etcd_call(
+            self.etcd.transaction, compare=[], success=ops, failure=[]
+        )
+        return [
+            {meta.key.decode("utf8"): meta.mod_revision for _, meta in kvs}
+            for kvs in responses
+        ]
+
+    @run_on_executor
+    def _etcd_compare_and_swap(self, keys, revisions, to_set, lease=None):
+        """Replace the keys under each key or prefix with to_set,
+        if none was created or changed since their revisions were read
+
+        Returns whether the transaction succeeded.
+        """
+        from etcd3.utils import prefix_range_end, to_bytes
+
+        txn = self.etcd.transactions
+        compare = []
+        current = set()
+        for key, key_revisions in zip(keys, revisions):
+            range_end = None
+            if key.endswith(self.kv_separator):
+                range_end = prefix_range_end(to_bytes(key))
+            # any write since the read has a higher revision
+            # than all keys we read
+            latest = max(key_revisions.values(), default=0)
+            compare.append(txn.mod(key, range_end) < latest + 1)
+            current.update(key_revisions)
+
+        success = [txn.delete(key) for key in current if key not in to_set]
+        success.extend(txn.put(key, value, lease) for key, value in to_set.items())
+        succeeded, _ = self._etcd_call(
+            self.etcd.transaction, compare=compare, success=success, failure=[]
+        )
+        return succeeded
+
+    @run_on_executor
+    def _etcd_get(self, key, **kwargs):
+        value, _ = self._etcd_call(self.etcd.get, key, **kwargs)
         return value
 
     @run_on_executor
-    def _etcd_get_prefix(self, prefix):
+    def _etcd_get_range_page(self, range_start, range_end, revision=None, **kwargs):
+        """Read one page of at most etcd_page_size keys in a range"""
+        if self.etcd_page_size:
+            kwargs["limit"] = self.etcd_page_size
+        if revision:
+            kwargs["revision"] = revision
+        return self._etcd_call(
+            self.etcd.get_range_response, range_start, range_end, **kwargs
+        )
+
+    def _etcd_rpc(self, stub, method, request):
+        """Make a grpc request that etcd3's client doesn't offer
+
+        With the client's error handling,
+        which raises etcd3 exceptions and fails over to another endpoint.
+        """
+        import grpc
+
+        etcd = self.etcd
+        try:
+            return getattr(getattr(etcd, stub), method)(
+                request,
+                etcd.timeout,
+                credentials=etcd.call_credentials,
+                metadata=etcd.metadata,
+            )
+        except grpc.RpcError as e:
+            etcd._manage_grpc_errors(e)
+
+    def _etcd_serializable_txn(self, ranges):
+        """One transaction of serializable range reads
+
+        etcd serves a transaction of only serializable reads locally,
+        like a single serializable read.
+        etcd3's transactions can't make serializable reads,
+        so the request is built here.
+        """
+        from etcd3.etcdrpc import RangeRequest, RequestOp, TxnRequest
+        from etcd3.utils import to_bytes
+
+        request = TxnRequest(
+            success=[
+                RequestOp(
+                    request_range=RangeRequest(
+                        key=to_bytes(key),
+                        range_end=to_bytes(range_end) if range_end else b"",
+                        serializable=True,
+                    )
+                )
+                for key, range_end in ranges
+            ]
+        )
+        response = self._etcd_rpc("kvstub", "Txn", request)
+        return [
+            [(kv.value, kv) for kv in op_response.response_range.kvs]
+            for op_response in response.responses
+        ]
+
+    @run_on_executor
+    def _etcd_get_many(self, ranges):
+        """Read several keys or ranges in one serializable transaction
+
+        Returns lists of (value, KeyValue) pairs, like a transaction.
+        """
+        return self._etcd_call(self._etcd_serializable_txn, ranges)
+
+    async def _etcd_iter_prefix(self, prefix, **kwargs):
+        """Iterate over the keys under a prefix, one page at a time
+
+        Yields lists of etcd KeyValue messages.
+        All pages are read at the revision of the first page,
+        so together they are a consistent snapshot.
+        """
+        from etcd3.utils import prefix_range_end, to_bytes
+
         if not prefix.endswith(self.kv_separator):
             prefix += self.kv_separator
-        data = list(self.etcd.get_prefix(prefix))
-        return data
+        range_start = to_bytes(prefix)
+        range_end = prefix_range_end(range_start)
+        kwargs.update(self._etcd_read_kwargs())
+        revision = None
+        while True:
+            response = await self._etcd_get_range_page(
+                range_start, range_end, revision, **kwargs
+            )
+            if response.kvs:
+                yield response.kvs
+            if not response.more or not response.kvs:
+                break
+            # continue right after the last key we got
+            revision = response.header.revision
+            range_start = response.kvs[-1].key + b"\0"
 
     # key-value generic methods
 
     async def _kv_get_tree(self, prefix):
-        keys_values = [
-            (meta.key.decode("utf8"), value.decode("utf8"))
-            for value, meta in await self._etcd_get_prefix(prefix)
-        ]
-        return self.unflatten_dict_from_kv(keys_values, root_key=prefix)
+        # feed each page into the tree as it arrives,
+        # so only one page of the response is in memory at a time
+        builder = self._kv_tree_builder(root_key=prefix)
+        async for kvs in self._etcd_iter_prefix(prefix):
+            builder.add((kv.key.decode("utf8"), kv.value.decode("utf8")) for kv in kvs)
+        return builder.finish()
+
+    async def _kv_get(self, key):
+        value = await self._etcd_get(key, **self._etcd_read_kwargs())
+        if value is None:
+            return None
+        return value.decode("utf8")
+
+    async def _kv_get_batch(self, keys):
+        """Read several keys or trees in one transaction of range reads"""
+        from etcd3.utils import prefix_range_end, to_bytes
+
+        ranges = []
+        for key in keys:
+            if key.endswith(self.kv_separator):
+                ranges.append((key, prefix_range_end(to_bytes(key))))
+            else:
+                ranges.append((key, None))
+
+        serializable = bool(self._etcd_read_kwargs())
+        get = self.etcd.transactions.get
+        responses = []
+        chunk_size = self.etcd_max_txn_ops
+        for start in range(0, len(ranges), chunk_size):
+            chunk = ranges[start : start + chunk_size]
+            if serializable:
+                responses.extend(await self._etcd_get_many(chunk))
+            else:
+                responses.extend(
+                    await self._etcd_transaction(
+                        [get(key, range_end) for key, range_end in chunk]
+                    )
+                )
+
+        results = []
+        for key, kvs in zip(keys, responses):
+            if not key.endswith(self.kv_separator):
+                results.append(kvs[0][0].decode("utf8") if kvs else None)
+            elif not kvs:
+                results.append({})
+            else:
+                keys_values = (
+                    (meta.key.decode("utf8"), value.decode("utf8"))
+                    for value, meta in kvs
+                )
+                results.append(self.unflatten_dict_from_kv(keys_values, root_key=key))
+        return results
+
+    async def _route_is_current(self, routespec, target, data):
+        token = _latest_reads.set(True)
+        try:
+            return await super()._route_is_current(routespec, target, data)
+        finally:
+            _latest_reads.reset(token)
+
+    async def _migrate_jupyterhub_routes(self):
+        token = _latest_reads.set(True)
+        try:
+            return await super()._migrate_jupyterhub_routes()
+        finally:
+            _latest_reads.reset(token)
+
+    async def _migrate_route_records(self):
+        token = _latest_reads.set(True)
+        try:
+            return await super()._migrate_route_records()
+        finally:
+            _latest_reads.reset(token)
+
+    async def _preload_routes(self):
+        # reads the stored routes to decide which to write,
+        # so don't reuse a cached serializable read either
+        traefik_utils.clear_coalesced(self)
+        token = _latest_reads.set(True)
+        try:
+            return await super()._preload_routes()
+        finally:
+            _latest_reads.reset(token)
+
+    async def _setup_traefik_dynamic_config(self):
+        await super()._setup_traefik_dynamic_config()
+        # resume keeping the routes of a previous run alive
+        await self._etcd_route_lease()
+
+    async def _kv_set_route_keys(self, to_set):
+        await self._kv_atomic_set(to_set, lease=await self._etcd_route_lease())
+
+    async def _apply_route_config(self, routespec, target, data):
+        if not self.etcd_compare_and_swap:
+            return await super()._apply_route_config(routespec, target, data)
 
-    async def _kv_atomic_set(self, to_set):
+        lease = await self._etcd_route_lease()
+        to_set = self._flat_config_for_route(
+            routespec, target, data, jupyterhub=self.route_store.in_provider
+        )
+        traefik_keys, jupyterhub_keys = self._keys_for_route(routespec)
+        if not self.route_store.in_provider:
+            jupyterhub_keys = ()
+        keys = self._keys_to_delete(traefik_keys, jupyterhub_keys)
+        self.log.debug("Setting key-value config %s", to_set)
+        try:
+            for attempt in range(self.etcd_cas_retries + 1):
+                revisions = await self._etcd_get_revisions(keys)
+                if await self._etcd_compare_and_swap(keys, revisions, to_set, lease):
+                    return
+                self.log.info(
+                    "Route %s was changed while writing it, retrying", routespec
+                )
+            raise RuntimeError(
+                f"Route {routespec} kept changing while writing it,"
+                f" giving up after {attempt + 1} attempts"
+            )
+        finally:
+            traefik_utils.clear_coalesced(self)
+
+    async def _kv_atomic_set(self, to_set, lease=None):
         transactions = []
         for k, v in to_set.items():
-            transactions.append(self.etcd.transactions.put(k, v))
+            transactions.append(self.etcd.transactions.put(k, v, lease))
         await self._etcd_transaction(transactions)
 
+    @property
+    def _kv_max_txn_ops(self):
+        return self.etcd_max_txn_ops
+
     async def _kv_atomic_delete(self, *keys):
-        """Delete one or more keys from the kv store"""
+        """Delete one or more keys from the kv store
+
+        Trees are deleted with a single range delete each,
+        without listing their keys.
+        """
+        from etcd3.utils import prefix_range_end, to_bytes
 
         transactions = []
         delete = self.etcd.transactions.delete
 
         for key in keys:
             if key.endswith(self.kv_separator):
-                # it's a tree, we have to list sub-keys to delete them atomically
-                for _, meta in await self._etcd_get_prefix(key):
-                    transactions.append(delete(meta.key))
+                transactions.append(delete(key, prefix_range_end(to_bytes(key))))
             else:
                 transactions.append(delete(key))
         await self._etcd_transaction(transactions)
@@ -193,18 +724,18 @@ class TraefikEtcdProxy(TKvProxy):
     # traefik + etcd methods
     def _setup_traefik_static_config(self):
         self.log.debug("Setting up the etcd provider in the static config")
-        url = urlparse(self.etcd_url)
+        urls = [urlparse(url) for url in self.etcd_urls or [self.etcd_url]]
         self.static_config.update(
             {
                 "providers": {
                     "etcd": {
-                        "endpoints": [url.netloc],
+                        "endpoints": [url.netloc for url in urls],
                         "rootKey": self.kv_traefik_prefix,
                     }
                 }
             }
         )
-        if url.scheme == "https":
+        if urls[0].scheme == "https":
             # If etcd is running over TLS, then traefik needs to know
             tls_conf = {}
             if self.etcd_client_ca_cert is not None:
@@ -159,6 +159,23 @@ class TraefikFileProviderProxy(TraefikProxy):
 
             self._persist_dynamic_config()
 
+    async def _route_is_current(self, routespec, target, data):
+        """Compare a route with the in-memory dynamic config, without reading the file"""
+        traefik_config, jupyterhub_config = self._dynamic_config_for_route(
+            routespec, target, data
+        )
+        sections = list(traefik_config.items())
+        if self.route_store.in_provider:
+            sections.append(("jupyterhub", jupyterhub_config))
+        async with self.mutex:
+            for section, expected in sections:
+                current = self.dynamic_config.get(section, {})
+                for kind, items in expected.items():
+                    for alias, config in items.items():
+                        if current.get(kind, {}).get(alias) != config:
+                            return False
+        return True
+
     async def get_route(self, routespec):
         """Return the route info for a given routespec.
 
@@ -180,13 +197,36 @@ class TraefikFileProviderProxy(TraefikProxy):
             None: if there are no routes matching the given routespec
         """
         routespec = self.validate_routespec(routespec)
+        if not self.route_store.in_provider:
+            return await self.route_store.get(routespec)
+        async with self.mutex:
+            return self._get_route_unlocked(routespec)
+
+    def _get_route_unlocked(self, routespec):
+        """Get a route from the in-memory dynamic config
+
+        self.mutex must be held
+        """
         router_alias = traefik_utils.generate_alias(routespec, "router")
+        route = self.dynamic_config["jupyterhub"]["routes"].get(router_alias)
+        if not route:
+            return None
+        return {
+            "routespec": route["routespec"],
+            "data": route["data"],
+            "target": route["target"],
+        }
+
+    async def get_routes(self, routespecs):
+        """Return the route info for several routespecs at once
+
+        Looks up all routes while holding the lock only once.
+        """
+        routespecs = [self.validate_routespec(routespec) for routespec in routespecs]
+        if not self.route_store.in_provider:
+            return await self.route_store.get_many(routespecs)
         async with self.mutex:
-            route = self.dynamic_config["jupyterhub"]["routes"].get(router_alias)
-            if not route:
-                return None
             return {
-                "routespec": route["routespec"],
-                "data": route["data"],
-                "target": route["target"],
+                routespec: self._get_route_unlocked(routespec)
+                for routespec in routespecs
             }
@@ -19,40 +19,106 @@ Route Specification:
 # Distributed under the terms of the Modified BSD License.
 
 import asyncio
+import json
 from collections.abc import Mapping
-from functools import wraps
 from numbers import Number
 
-from traitlets import Unicode
+from traitlets import Any, Enum, Float, Unicode, observe
 
 from . import traefik_utils
 from .proxy import TraefikProxy
 
 
-def _one_at_a_time(method):
-    """decorator to limit an async method to be called only once
+class _KVTreeBuilder:
+    """Reconstruct a tree dict from flat key/value pairs, in one pass
 
-    If multiple concurrent calls to this method are made,
-    piggy-back on the outstanding call instead of queuing
-    or letting requests pile up.
-    """
-
-    @wraps(method)
-    async def locked_method(*args, **kwargs):
-        if getattr(method, "_shared_future", None) is not None:
-            f = method._shared_future
-            if f.done():
-                method._shared_future = None
-            else:
-                return await f
+    Pairs may be added in any order, and in several batches.
+    Keys are inserted into a trie of dicts as they arrive,
+    and containers with integer keys are converted to lists
+    by :meth:`finish`.
 
-        method._shared_future = f = asyncio.ensure_future(method(*args, **kwargs))
-        try:
-            return await f
-        finally:
-            method._shared_future = None
+    See :meth:`TKvProxy.unflatten_dict_from_kv`.
+    """
 
-    return locked_method
+    def __init__(self, sep, root_key="", log=None):
+        self.sep = sep
+        self.root_key = root_key
+        self.root = root_key.rstrip(sep)
+        self.root_prefix = self.root + sep
+        self.log = log
+        self.found = not self.root
+        self.root_value = None
+        self.tree = {}
+        # containers with integer keys, which are lists in the original dict.
+        # lists[depth] is a dict of id(container): (parent, label, container)
+        # so that they can be converted from the deepest up
+        self.lists = []
+
+    def add(self, kv_pairs):
+        """Add an iterable of (key, value) pairs to the tree"""
+        sep = self.sep
+        root = self.root
+        root_prefix = self.root_prefix
+        skip = len(root_prefix)
+        tree = self.tree
+        lists = self.lists
+
+        for key, value in kv_pairs:
+            if root:
+                if not key.startswith(root_prefix):
+                    if key == root:
+                        # a single value stored at the root key
+                        self.found = True
+                        self.root_value = value
+                    continue
+                key = key[skip:]
+            self.found = True
+
+            labels = key.split(sep)
+            leaf = labels.pop()
+            parent = label = None
+            d = tree
+            for depth, next_label in enumerate(labels):
+                if next_label.isdigit():
+                    while len(lists) <= depth:
+                        lists.append({})
+                    lists[depth][id(d)] = (parent, label, d)
+                child = d.get(next_label)
+                if child is None:
+                    child = d[next_label] = {}
+                parent, label, d = d, next_label, child
+            if leaf.isdigit():
+                depth = len(labels)
+                while len(lists) <= depth:
+                    lists.append({})
+                lists[depth][id(d)] = (parent, label, d)
+            d[leaf] = value
+
+    def finish(self):
+        """Return the reconstructed tree"""
+        if not self.found:
+            if self.log:
+                self.log.warning(f"Root key {self.root_key!r} not found")
+            return {}
+        tree = self.tree
+        if self.root_value is not None and not tree:
+            return self.root_value
+
+        # convert containers of integer keys to lists, deepest first,
+        # so lists are never nested in a dict that's already been replaced
+        for depth_lists in reversed(self.lists):
+            for parent, label, container in depth_lists.values():
+                try:
+                    items = [container[str(i)] for i in range(len(container))]
+                except KeyError:
+                    raise IndexError(
+                        f"Got invalid list keys {sorted(container)} for {label!r}, missing previous items"
+                    )
+                if parent is None:
+                    tree = items
+                else:
+                    parent[label] = items
+        return tree
 
 
 class TKvProxy(TraefikProxy):
@@ -81,6 +147,43 @@ class TKvProxy(TraefikProxy):
         help="""The separator used for the path in the KV store""",
     )
 
+    kv_jupyterhub_format = Enum(
+        ["flat", "json"],
+        default_value="flat",
+        config=True,
+        help="""How jupyterhub's route records are stored in the KV store.
+
+        - flat: one key per field of each route record,
+          e.g. `jupyterhub/routes/<alias>/target`.
+          This is the layout used by jupyterhub-traefik-proxy <= 1.0.
+        - json: one JSON-encoded value per route,
+          under `jupyterhub/routes/<alias>`.
+          This greatly reduces the number of keys in the KV store
+          and the cost of reading routes back.
+
+        Routes stored in the other format are still read transparently,
+        and are rewritten in the configured format when the proxy starts.
+        """,
+    )
+
+    # traefik watches the key-value store,
+    # so the dynamic config can be written while it starts
+    _dynamic_config_before_traefik = False
+
+    kv_read_cache_ttl = Float(
+        0,
+        config=True,
+        help="""Time (in seconds) for which the result of a read is reused.
+
+        Concurrent reads of the same routes always share one request to the KV store.
+        With a ttl, reads in the following window share it too,
+        e.g. a burst of `get_all_routes` calls from `check_routes`.
+        Reused results are dropped as soon as routes are added or deleted
+        by this proxy, but changes made by anything else
+        may not be seen for up to this long.
+        """,
+    )
+
     # these should be the only three methods a KV provider needs to define
 
     async def _kv_atomic_set(self, to_set: dict):
@@ -112,45 +215,420 @@ class TKvProxy(TraefikProxy):
         """
         raise NotImplementedError()
 
+    # optional methods, which KV providers may override to be more efficient
+
+    # the maximum number of keys to pass to one _kv_atomic_delete call
+    # when deleting many routes, or None for no limit
+    _kv_max_txn_ops = None
+
+    async def _kv_get(self, key):
+        """Return the value of a single key, or None if it is not set
+
+        The default implementation reads the whole parent tree.
+        """
+        parent, _, name = key.rpartition(self.kv_separator)
+        value = (await self._kv_get_tree(parent)).get(name)
+        if not isinstance(value, str):
+            return None
+        return value
+
+    async def _kv_get_batch(self, keys):
+        """Read several keys, in as few round trips as possible
+
+        Args:
+
+        keys (list):
+            keys to read.
+            Keys ending with `self.kv_separator` are read as a tree,
+            like `_kv_get_tree`, others as a single value, like `_kv_get`.
+
+        Returns:
+
+        results (list):
+            one result per key, in the same order.
+
+        The default implementation reads each key concurrently.
+        """
+        sep = self.kv_separator
+        return await asyncio.gather(
+            *(
+                self._kv_get_tree(key[: -len(sep)])
+                if key.endswith(sep)
+                else self._kv_get(key)
+                for key in keys
+            )
+        )
+
+    @traefik_utils.coalesce(ttl="kv_read_cache_ttl")
+    async def _kv_read_tree(self, prefix):
+        """_kv_get_tree, coalescing concurrent and recent reads of the same prefix"""
+        return await self._kv_get_tree(prefix)
+
     # now: implement methods required by TraefikProxy base class
 
+    def _jupyterhub_route_key(self, router_alias):
+        """Return the KV key of the jupyterhub record for a route"""
+        return self.kv_separator.join(
+            [self.kv_jupyterhub_prefix, "routes", router_alias]
+        )
+
+    def _flatten_jupyterhub_config(self, jupyterhub_config):
+        """Flatten jupyterhub config for the KV store
+
+        Route records are flattened to one key per field,
+        or to a single JSON value per route,
+        according to :attr:`kv_jupyterhub_format`.
+        """
+        if self.kv_jupyterhub_format == "flat":
+            return self.flatten_dict_for_kv(
+                jupyterhub_config, prefix=self.kv_jupyterhub_prefix
+            )
+        jupyterhub_config = dict(jupyterhub_config)
+        routes = jupyterhub_config.pop("routes", {})
+        to_set = self.flatten_dict_for_kv(
+            jupyterhub_config, prefix=self.kv_jupyterhub_prefix
+        )
+        for router_alias, route in routes.items():
+            to_set[self._jupyterhub_route_key(router_alias)] = json.dumps(route)
+        return to_set
+
+    def _load_jupyterhub_route(self, route):
+        """Load a route record read from the KV store, in either format"""
+        if isinstance(route, str):
+            return json.loads(route)
+        return route
+
+    _route_kv_template = Any(allow_none=True)
+
+    @observe(
+        "kv_traefik_prefix",
+        "kv_jupyterhub_prefix",
+        "kv_separator",
+        "kv_jupyterhub_format",
+        "traefik_entrypoint",
+        "traefik_cert_resolver",
+        "is_https",
+    )
+    def _reset_route_kv_template(self, change):
+        self._route_kv_template = None
+
+    def _get_route_kv_template(self):
+        """Return the precompiled key template for routes
+
+        A dict of key prefixes and suffixes, and the (suffix, value) pairs
+        that are the same for every route,
+        with prefixes and the separator already joined.
+        """
+        if self._route_kv_template is not None:
+            return self._route_kv_template
+        sep = self.kv_separator
+        # a route for a placeholder alias, used to discover the per-router constants
+        traefik_config, _ = self._dynamic_config_for_route("/", "", {})
+        router = next(iter(traefik_config["http"]["routers"].values()))
+        router_constants = {
+            sep + key: value
+            for key, value in self.flatten_dict_for_kv(router).items()
+            if key not in {"service", "rule"}
+        }
+        self._route_kv_template = template = {
+            "routers": sep.join([self.kv_traefik_prefix, "http", "routers", ""]),
+            "services": sep.join([self.kv_traefik_prefix, "http", "services", ""]),
+            "routes": sep.join([self.kv_jupyterhub_prefix, "routes", ""]),
+            "service": f"{sep}service",
+            "rule": f"{sep}rule",
+            "router_constants": tuple(router_constants.items()),
+            "url": sep.join(["", "loadBalancer", "servers", "0", "url"]),
+            "pass_host_header": sep.join(["", "loadBalancer", "passHostHeader"]),
+            "json": self.kv_jupyterhub_format == "json",
+            "data": f"{sep}data",
+            "routespec": f"{sep}routespec",
+            "target": f"{sep}target",
+            "router": f"{sep}router",
+        }
+        return template
+
+    def _flat_config_for_route(self, routespec, target, data, jupyterhub=True):
+        """Return the flat key/value pairs to store for a route
+
+        Equivalent to flattening both parts of :meth:`_dynamic_config_for_route`,
+        but built directly from a precompiled template of the keys.
+        The jupyterhub part is left out if `jupyterhub` is False.
+        """
+        if (
+            type(self)._dynamic_config_for_route
+            is not TraefikProxy._dynamic_config_for_route
+        ):
+            # customized route config, can't use the template
+            traefik_config, jupyterhub_config = self._dynamic_config_for_route(
+                routespec, target, data
+            )
+            to_set = self.flatten_dict_for_kv(
+                traefik_config, prefix=self.kv_traefik_prefix
+            )
+            if jupyterhub:
+                to_set.update(self._flatten_jupyterhub_config(jupyterhub_config))
+            return to_set
+
+        template = self._get_route_kv_template()
+        # same as generate_alias(routespec, kind), escaping only once
+        alias = traefik_utils.generate_alias(routespec)
+        service_alias = f"service_{alias}"
+        router_alias = f"router_{alias}"
+        router_key = template["routers"] + router_alias
+        service_key = template["services"] + service_alias
+        to_set = {
+            router_key + template["service"]: service_alias,
+            router_key + template["rule"]: traefik_utils.generate_rule(routespec),
+        }
+        for suffix, value in template["router_constants"]:
+            to_set[router_key + suffix] = value
+        to_set[service_key + template["url"]] = target
+        to_set[service_key + template["pass_host_header"]] = "true"
+        if not jupyterhub:
+            return to_set
+
+        route_key = template["routes"] + router_alias
+        if template["json"]:
+            to_set[route_key] = json.dumps(
+                {
+                    "data": data,
+                    "routespec": routespec,
+                    "target": target,
+                    "router": router_alias,
+                    "service": service_alias,
+                }
+            )
+            return to_set
+
+        data_key = route_key + template["data"]
+        if data:
+            to_set.update(self.flatten_dict_for_kv(data, prefix=data_key))
+        else:
+            self.log.warning(f"Not setting anything for empty dict at {data_key}")
+        to_set[route_key + template["routespec"]] = routespec
+        to_set[route_key + template["target"]] = target
+        to_set[route_key + template["router"]] = router_alias
+        to_set[route_key + template["service"]] = service_alias
+        return to_set
+
+    async def _route_is_current(self, routespec, target, data):
+        """Compare a route with the stored keys, in one KV request
+
+        The route is current if its router, service and jupyterhub record
+        are stored with exactly the keys and values that adding it would write.
+        The record is only compared if it is stored in the provider.
+        """
+        in_provider = self.route_store.in_provider
+        to_set = self._flat_config_for_route(
+            routespec, target, data, jupyterhub=in_provider
+        )
+        sep = self.kv_separator
+        router_alias = traefik_utils.generate_alias(routespec, "router")
+        service_alias = traefik_utils.generate_alias(routespec, "service")
+        route_key = self._jupyterhub_route_key(router_alias)
+        traefik_prefixes = [
+            sep.join([self.kv_traefik_prefix, "http", "routers", router_alias]),
+            sep.join([self.kv_traefik_prefix, "http", "services", service_alias]),
+        ]
+        keys = [prefix + sep for prefix in traefik_prefixes]
+        if in_provider:
+            keys.extend([route_key, route_key + sep])
+        results = await self._kv_get_batch(keys)
+
+        current = {}
+        for prefix, tree in zip(traefik_prefixes, results):
+            if tree:
+                current.update(self.flatten_dict_for_kv(tree, prefix=prefix))
+        if in_provider:
+            json_record, flat_record = results[2:]
+            if json_record:
+                current[route_key] = json_record
+            if flat_record:
+                current.update(self.flatten_dict_for_kv(flat_record, prefix=route_key))
+        return current == to_set
+
+    async def _apply_route_config(self, routespec, target, data):
+        """Store the config for a single route, without building nested dicts"""
+        to_set = self._flat_config_for_route(
+            routespec, target, data, jupyterhub=self.route_store.in_provider
+        )
+        self.log.debug("Setting key-value config %s", to_set)
+        try:
+            await self._kv_set_route_keys(to_set)
+        finally:
+            traefik_utils.clear_coalesced(self)
+
+    def _record_matches(self, record, target, data):
+        # the flat format stores all values as strings
+        return (
+            record is not None
+            and record["target"] == target
+            and self.flatten_dict_for_kv(record["data"])
+            == self.flatten_dict_for_kv(data)
+        )
+
+    async def _apply_routes_config(self, routes):
+        """Store the config of many routes, in as few transactions as the KV store allows
+
+        Routes are grouped into transactions of at most
+        :attr:`_kv_max_txn_ops` keys, never splitting a route.
+        """
+        in_provider = self.route_store.in_provider
+        max_ops = self._kv_max_txn_ops
+        chunk = {}
+        try:
+            for routespec, (target, data) in routes.items():
+                to_set = self._flat_config_for_route(
+                    routespec, target, data, jupyterhub=in_provider
+                )
+                if chunk and max_ops and len(chunk) + len(to_set) > max_ops:
+                    await self._kv_set_route_keys(chunk)
+                    chunk = {}
+                chunk.update(to_set)
+            if chunk:
+                await self._kv_set_route_keys(chunk)
+        finally:
+            traefik_utils.clear_coalesced(self)
+
+    async def _kv_set_route_keys(self, to_set):
+        """Set the keys of one or more routes
+
+        Providers may override this to attach options to route keys only.
+        """
+        await self._kv_atomic_set(to_set)
+
     async def _apply_dynamic_config(self, dynamic_config, jupyterhub_config=None):
         """Apply dynamic config (and optional jupyterhub info) atomically"""
         to_set = self.flatten_dict_for_kv(dynamic_config, prefix=self.kv_traefik_prefix)
         if jupyterhub_config:
-            to_set.update(
-                self.flatten_dict_for_kv(
-                    jupyterhub_config, prefix=self.kv_jupyterhub_prefix
-                )
-            )
+            to_set.update(self._flatten_jupyterhub_config(jupyterhub_config))
         self.log.debug("Setting key-value config %s", to_set)
-        await self._kv_atomic_set(to_set)
+        try:
+            await self._kv_atomic_set(to_set)
+        finally:
+            traefik_utils.clear_coalesced(self)
 
-    async def _delete_dynamic_config(self, traefik_keys, jupyterhub_keys):
-        """Delete keys from dynamic configuration
+    async def _setup_traefik_dynamic_config(self):
+        await super()._setup_traefik_dynamic_config()
+        if self.route_store.in_provider:
+            await self._migrate_jupyterhub_routes()
 
-        Translate key paths to flat kv keys
+    async def _migrate_jupyterhub_routes(self):
+        """Rewrite route records stored in the other format
+
+        Each route is migrated on its own,
+        so routes stay available while the migration is in progress.
         """
+        routes_prefix = self.kv_separator.join([self.kv_jupyterhub_prefix, "routes"])
+        routes = (await self._kv_get_tree(routes_prefix)) or {}
+        want_json = self.kv_jupyterhub_format == "json"
+        migrated = 0
+        for router_alias, route in routes.items():
+            if isinstance(route, str) == want_json:
+                # already in the configured format
+                continue
+            route_key = self._jupyterhub_route_key(router_alias)
+            # a key can't hold both a value and a tree of keys in the same store,
+            # so remove the old layout before writing the new one
+            if want_json:
+                await self._kv_atomic_delete(route_key + self.kv_separator)
+            else:
+                await self._kv_atomic_delete(route_key)
+            # written like other route keys, e.g. with etcd's route lease
+            try:
+                await self._kv_set_route_keys(
+                    self._flatten_jupyterhub_config(
+                        {"routes": {router_alias: self._load_jupyterhub_route(route)}}
+                    )
+                )
+            finally:
+                traefik_utils.clear_coalesced(self)
+            migrated += 1
+        if migrated:
+            self.log.info(
+                "Migrated %i route(s) to %s format",
+                migrated,
+                self.kv_jupyterhub_format,
+            )
+
+    def _keys_to_delete(self, traefik_keys, jupyterhub_keys):
+        """Translate key paths to flat kv keys to delete"""
         to_delete = [
             self.kv_separator.join([self.kv_traefik_prefix] + key_path + [""])
             for key_path in traefik_keys
         ]
-        to_delete.extend(
-            self.kv_separator.join([self.kv_jupyterhub_prefix] + key_path + [""])
-            for key_path in jupyterhub_keys
-        )
+        for key_path in jupyterhub_keys:
+            # delete both layouts of jupyterhub records,
+            # so that records in either format are removed
+            key = self.kv_separator.join([self.kv_jupyterhub_prefix] + key_path)
+            to_delete.extend([key, key + self.kv_separator])
+        return to_delete
+
+    async def _delete_dynamic_config(self, traefik_keys, jupyterhub_keys):
+        """Delete keys from dynamic configuration
+
+        Translate key paths to flat kv keys
+        """
+        to_delete = self._keys_to_delete(traefik_keys, jupyterhub_keys)
         async with self.semaphore:
             try:
                 await self._kv_atomic_delete(*to_delete)
             except Exception as e:
                 self.log.error("Couldn't delete config %s: %s", to_delete, e)
                 raise
+            finally:
+                traefik_utils.clear_coalesced(self)
+
+    async def _delete_routes_config(self, route_keys):
+        """Delete routes in as few transactions as the KV store allows
+
+        Routes are grouped into transactions of at most
+        :attr:`_kv_max_txn_ops` keys, never splitting a route.
+        A failed transaction only fails the routes it contains.
+        """
+        max_ops = self._kv_max_txn_ops
+        chunks = []
+        chunk_routespecs = []
+        chunk_keys = []
+        for routespec, (traefik_keys, jupyterhub_keys) in route_keys.items():
+            keys = self._keys_to_delete(traefik_keys, jupyterhub_keys)
+            if chunk_keys and max_ops and len(chunk_keys) + len(keys) > max_ops:
+                chunks.append((chunk_routespecs, chunk_keys))
+                chunk_routespecs = []
+                chunk_keys = []
+            chunk_routespecs.append(routespec)
+            chunk_keys.extend(keys)
+        chunks.append((chunk_routespecs, chunk_keys))
+
+        results = {}
+        async with self.semaphore:
+            try:
+                for routespecs, keys in chunks:
+                    try:
+                        await self._kv_atomic_delete(*keys)
+                    except Exception as e:
+                        results.update(dict.fromkeys(routespecs, e))
+                    else:
+                        results.update(dict.fromkeys(routespecs))
+            finally:
+                traefik_utils.clear_coalesced(self)
+        return results
 
-    @_one_at_a_time
+    @traefik_utils.coalesce(ttl="kv_read_cache_ttl")
     async def _get_jupyterhub_dynamic_config(self):
         """jupyterhub data is in our kv store"""
-        return await self._kv_get_tree(self.kv_jupyterhub_prefix)
+        jupyterhub_config = await self._kv_read_tree(self.kv_jupyterhub_prefix)
+        routes = jupyterhub_config.get("routes")
+        if routes:
+            # don't modify the (possibly shared) result of the read
+            jupyterhub_config = dict(jupyterhub_config)
+            jupyterhub_config["routes"] = {
+                router_alias: self._load_jupyterhub_route(route)
+                for router_alias, route in routes.items()
+            }
+        return jupyterhub_config
 
+    @traefik_utils.coalesce(ttl="kv_read_cache_ttl")
     async def get_route(self, routespec):
         """Return the route info for a given routespec.
 
@@ -172,15 +650,63 @@ class TKvProxy(TraefikProxy):
             None: if there are no routes matching the given routespec
         """
         routespec = self.validate_routespec(routespec)
+        if not self.route_store.in_provider:
+            return await self.route_store.get(routespec)
         router_alias = traefik_utils.generate_alias(routespec, "router")
-        route_key = self.kv_separator.join(
-            [self.kv_jupyterhub_prefix, "routes", router_alias]
-        )
-        route = await self._kv_get_tree(route_key)
-        if not route:
+        route_key = self._jupyterhub_route_key(router_alias)
+        # try the configured format first,
+        # falling back on routes that haven't been migrated yet
+        readers = [self._kv_read_tree, self._kv_get]
+        if self.kv_jupyterhub_format == "json":
+            readers.reverse()
+        for read in readers:
+            route = await read(route_key)
+            if route:
+                break
+        else:
             return None
+        route = self._load_jupyterhub_route(route)
         return {key: route[key] for key in ("routespec", "data", "target")}
 
+    async def get_routes(self, routespecs):
+        """Return the route info for several routespecs, in one KV request
+
+        Both layouts of each route's record (see :attr:`kv_jupyterhub_format`)
+        are read in the same request.
+
+        Args:
+            routespecs (list): URIs that were used to add routes
+
+        Returns:
+            routes (dict):
+                dict keyed by normalized routespec,
+                with values as returned by :meth:`get_route`
+                (None for routes that don't exist).
+        """
+        if self._start_future and not self._start_future.done():
+            await self._start_future
+        routespecs = [self.validate_routespec(routespec) for routespec in routespecs]
+        if not self.route_store.in_provider:
+            return await self.route_store.get_many(routespecs)
+        keys = []
+        for routespec in routespecs:
+            router_alias = traefik_utils.generate_alias(routespec, "router")
+            route_key = self._jupyterhub_route_key(router_alias)
+            keys.extend([route_key, route_key + self.kv_separator])
+        results = await self._kv_get_batch(keys)
+
+        routes = {}
+        for i, routespec in enumerate(routespecs):
+            # json value or flat tree, whichever is set
+            route = results[2 * i] or results[2 * i + 1]
+            if route:
+                route = self._load_jupyterhub_route(route)
+                route = {key: route[key] for key in ("routespec", "data", "target")}
+            else:
+                route = None
+            routes[routespec] = route
+        return routes
+
     # deep/flat dict translation
 
     def _kv_to_str(self, value):
@@ -238,41 +764,57 @@ class TKvProxy(TraefikProxy):
         Inspired by `this answer on StackOverflow <https://stackoverflow.com/a/6027615>`_
         """
         sep = self.kv_separator
-        # if it's a list, cast to dict of str keys, i.e. ["x"] -> {"0": "x"}
-        # if isinstance(data, list):
-        #     data = {str(i): item for i, item in enumerate(data)}
-
         items = {}
-        for k, v in data.items():
-            if prefix:
-                new_key = f"{prefix}{sep}{k}"
-            else:
-                new_key = k
+        # walk depth-first without recursion,
+        # keeping a stack of (key prefix, iterator over (key, value) pairs)
+        stack = [(prefix, iter(data.items()))]
+        while stack:
+            key_prefix, children = stack[-1]
+            for k, v in children:
+                if key_prefix:
+                    new_key = f"{key_prefix}{sep}{k}"
+                else:
+                    new_key = k
+
+                # three cases:
+                # 1. list (stored with integer keys, i.e. ["x"] -> {"0": "x"})
+                # 2. Mapping (dict)
+                # 3. scalar (cast to str)
+                if isinstance(v, list):
+                    v_children = enumerate(v)
+                elif isinstance(v, Mapping):
+                    v_children = iter(v.items())
+                else:
+                    # cast _known_ types to str
+                    v = self._kv_to_str(v)
+                    # if cast didn't coerce, we can't handle it
+                    if not isinstance(v, str):
+                        raise ValueError(
+                            f"Cannot upload {new_key}: {v} of type {type(v)} to kv store"
+                        )
+                    items[new_key] = v
+                    continue
 
-            if isinstance(v, list):
-                # if it's a list, cast to dict of str keys, i.e. ["x"] -> {"0": "x"}
-                v = {str(i): item for i, item in enumerate(v)}
-
-            # two cases:
-            # 1. Mapping (dict)
-            # 2. scalar (cast to str)
-            if isinstance(v, Mapping):
                 if not v:
                     self.log.warning(
                         f"Not setting anything for empty dict at {new_key}"
                     )
-                items.update(self.flatten_dict_for_kv(v, prefix=new_key))
+                # descend, resuming this level when the child is done
+                stack.append((new_key, v_children))
+                break
             else:
-                # cast _known_ types to str
-                v = self._kv_to_str(v)
-                # if cast didn't coerce, we can't handle it
-                if not isinstance(v, str):
-                    raise ValueError(
-                        f"Cannot upload {new_key}: {v} of type {type(v)} to kv store"
-                    )
-                items[new_key] = v
+                stack.pop()
         return items
 
+    def _kv_tree_builder(self, root_key=""):
+        """Return a builder for reconstructing a tree dict incrementally
+
+        Call `builder.add(kv_pairs)` with each batch of key/value pairs,
+        e.g. each page of a KV store response,
+        and `builder.finish()` to get the tree.
+        """
+        return _KVTreeBuilder(self.kv_separator, root_key=root_key, log=self.log)
+
     def unflatten_dict_from_kv(self, kv_list, root_key=""):
         """Reconstruct tree dict from list of key/value pairs
 
@@ -281,12 +823,15 @@ class TKvProxy(TraefikProxy):
 
         Args:
 
-        kv_list (list):
-            list of (key, value) pairs.
+        kv_list (iterable):
+            (key, value) pairs, in any order.
             keys and values should all be strings.
+            May be a generator, e.g. consuming a KV store response,
+            which is only iterated once.
         root_key (str, optional):
             The key representing the root of the tree,
             if not the root of the key-value store.
+            Keys outside root_key are ignored.
 
         Returns:
 
@@ -295,58 +840,6 @@ class TKvProxy(TraefikProxy):
             All values will still be strings,
             even those that originated as numbers or booleans.
         """
-
-        sep = self.kv_separator
-
-        def by_depth(item):
-            """sort-key function to get shallow items first
-
-            Ensures
-
-            So that we know that we always see an item
-            before its children
-            """
-            key, value = item
-            key_path = key.split(sep)
-            for i, label in enumerate(key_path):
-                # ensure
-                if label.isdigit():
-                    key_path[i] = int(label)
-            return len(key.split(sep))
-
-        tree = {}
-        for key, value in sorted(kv_list, key=by_depth):
-            key_path = key.split(sep)
-            d = tree
-            for parent_key, key in zip(key_path[:-1], key_path[1:]):
-                if parent_key not in d:
-                    # create container
-                    if key.isdigit():
-                        # integer keys mean it's a list
-                        d[parent_key] = []
-                    else:
-                        d[parent_key] = {}
-                # walk down to the next level
-                d = d[parent_key]
-            if isinstance(d, list):
-                # validate list keys
-                if len(d) != int(key):
-                    raise IndexError(
-                        f"Got invalid list key {key_path}, missing previous items in {d}"
-                    )
-                d.append(value)
-            else:
-                d[key] = value
-
-        if root_key:
-            original_tree = tree
-            # get the root of the tree,
-            # rather than starting from root
-            for key in root_key.strip(self.kv_separator).split(self.kv_separator):
-                if key not in tree:
-                    self.log.warning(
-                        f"Root key {root_key!r} not found in {original_tree}"
-                    )
-                    return {}
-                tree = tree[key]
-        return tree
+        builder = self._kv_tree_builder(root_key)
+        builder.add(kv_list)
+        return builder.finish()
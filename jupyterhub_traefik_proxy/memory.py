@@ -0,0 +1,256 @@
+"""Traefik implementation
+
+Custom proxy implementations can subclass :class:`Proxy`
+and register in JupyterHub config:
+
+.. sourcecode:: python
+
+    from mymodule import MyProxy
+    c.JupyterHub.proxy_class = MyProxy
+
+Route Specification:
+
+- A routespec is a URL prefix ([host]/path/), e.g.
+  'host.tld/path/' for host-based routing or '/path/' for default routing.
+- Route paths should be normalized to always start and end with '/'
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import asyncio
+import json
+import random
+from bisect import bisect_left
+from urllib.parse import urlparse
+
+from tornado.httpserver import HTTPServer
+from tornado.web import Application, RequestHandler
+from traitlets import Float, Unicode, validate
+
+from .kv_proxy import TKvProxy
+
+
+class _DynamicConfigHandler(RequestHandler):
+    """Serve traefik's dynamic config to traefik's http provider"""
+
+    def initialize(self, proxy):
+        self.proxy = proxy
+
+    def get(self):
+        body = self.proxy._traefik_config_json()
+        self.set_header("Content-Type", "application/json")
+        self.write(body)
+
+
+def _typed_value(value):
+    """Restore the JSON type of a value flattened to a string
+
+    Key-value stores only hold strings,
+    which traefik parses according to the type of each field.
+    The http provider reads typed JSON instead.
+    """
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+def _typed_config(config):
+    """Recursively restore JSON types in an unflattened config"""
+    if isinstance(config, dict):
+        return {key: _typed_config(value) for key, value in config.items()}
+    if isinstance(config, list):
+        return [_typed_config(value) for value in config]
+    return _typed_value(config)
+
+
+class TraefikMemoryProxy(TKvProxy):
+    """JupyterHub Proxy implementation using traefik and an in-memory key-value store
+
+    The key-value store lives in the Hub process,
+    and traefik polls the routing table from a small HTTP endpoint
+    served by the proxy, via traefik's http provider.
+
+    The store can inject latency and failures into every operation.
+    It is meant for testing and benchmarking the :class:`TKvProxy` layer
+    without the cost of a real key-value store.
+    Routes are lost when the Hub restarts.
+    """
+
+    provider_name = "http"
+
+    memory_latency = Float(
+        0,
+        config=True,
+        help="""Latency (in seconds) to add to every operation on the in-memory store.
+
+        Simulates the round trip to a remote key-value store.
+        """,
+    )
+
+    memory_failure_rate = Float(
+        0,
+        config=True,
+        help="""Fraction (0-1) of operations on the in-memory store that fail.
+
+        Failed operations raise ConnectionError without changing the store.
+        """,
+    )
+
+    @validate("memory_failure_rate")
+    def _validate_failure_rate(self, proposal):
+        value = proposal.value
+        if not 0 <= value <= 1:
+            raise ValueError(
+                f"memory_failure_rate must be between 0 and 1, not {value}"
+            )
+        return value
+
+    memory_http_url = Unicode(
+        "http://127.0.0.1:8097",
+        config=True,
+        help="""URL where the dynamic config is served to traefik's http provider.
+
+        Should only be reachable by traefik.
+        """,
+    )
+
+    memory_poll_interval = Unicode(
+        "200ms",
+        config=True,
+        help="""How often traefik polls the dynamic config from :attr:`memory_http_url`.""",
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # keys, for reading trees by range,
+        # sorted lazily on the first read after keys are added
+        self._memory_keys = []
+        self._memory_keys_sorted = True
+        self._memory_values = {}
+        # bumped on every change, to cache the served config
+        self._memory_revision = 0
+        self._http_cache = (None, None)
+        self._http_server = None
+        self._random = random.Random()
+
+    async def _memory_op(self):
+        """Simulate the cost and failures of a round trip to the store"""
+        if self.memory_latency:
+            await asyncio.sleep(self.memory_latency)
+        if (
+            self.memory_failure_rate
+            and self._random.random() < self.memory_failure_rate
+        ):
+            raise ConnectionError("Injected failure in the in-memory key-value store")
+
+    def _memory_sorted_keys(self):
+        """Return the sorted keys, sorting the keys added since the last read
+
+        Sorting once per read, instead of inserting each key in place,
+        keeps loading many routes linear.
+        """
+        if not self._memory_keys_sorted:
+            self._memory_keys.sort()
+            self._memory_keys_sorted = True
+        return self._memory_keys
+
+    def _memory_range(self, prefix):
+        """Return the (start, end) indices of the sorted keys starting with prefix"""
+        keys = self._memory_sorted_keys()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return start, end
+
+    def _memory_get_tree(self, prefix):
+        if not prefix.endswith(self.kv_separator):
+            prefix += self.kv_separator
+        start, end = self._memory_range(prefix)
+        return self.unflatten_dict_from_kv(
+            ((k, self._memory_values[k]) for k in self._memory_keys[start:end]),
+            root_key=prefix[: -len(self.kv_separator)],
+        )
+
+    # the http endpoint traefik reads
+
+    def _start_http_server(self):
+        if self._http_server is not None:
+            return
+        url = urlparse(self.memory_http_url)
+        app = Application([(r"/", _DynamicConfigHandler, {"proxy": self})])
+        self._http_server = HTTPServer(app)
+        self._http_server.listen(url.port, url.hostname)
+
+    def _traefik_config_json(self):
+        """Serialize the traefik part of the store, cached until it changes"""
+        revision, body = self._http_cache
+        if revision != self._memory_revision:
+            revision = self._memory_revision
+            # traefik reads the store directly, without injected latency or failures
+            config = self._memory_get_tree(self.kv_traefik_prefix)
+            body = json.dumps(_typed_config(config))
+            self._http_cache = (revision, body)
+        return body
+
+    def _setup_traefik_static_config(self):
+        self.log.debug("Setting up the http provider in the static config")
+        self.static_config.update(
+            {
+                "providers": {
+                    "http": {
+                        "endpoint": self.memory_http_url,
+                        "pollInterval": self.memory_poll_interval,
+                    }
+                }
+            }
+        )
+        return super()._setup_traefik_static_config()
+
+    async def _setup_traefik_dynamic_config(self):
+        self._start_http_server()
+        await super()._setup_traefik_dynamic_config()
+
+    async def stop(self):
+        await super().stop()
+        if self._http_server is not None:
+            self._http_server.stop()
+            self._http_server = None
+
+    # key-value generic methods
+
+    async def _kv_atomic_set(self, to_set):
+        await self._memory_op()
+        for key, value in to_set.items():
+            if key not in self._memory_values:
+                self._memory_keys.append(key)
+                self._memory_keys_sorted = False
+            self._memory_values[key] = value
+        self._memory_revision += 1
+
+    async def _kv_atomic_delete(self, *keys):
+        await self._memory_op()
+        for key in keys:
+            if key.endswith(self.kv_separator):
+                start, end = self._memory_range(key)
+                for k in self._memory_keys[start:end]:
+                    del self._memory_values[k]
+                del self._memory_keys[start:end]
+            elif key in self._memory_values:
+                del self._memory_values[key]
+                sorted_keys = self._memory_sorted_keys()
+                del sorted_keys[bisect_left(sorted_keys, key)]
+        self._memory_revision += 1
+
+    async def _kv_get(self, key):
+        await self._memory_op()
+        return self._memory_values.get(key)
+
+    async def _kv_get_tree(self, prefix):
+        await self._memory_op()
+        return self._memory_get_tree(prefix)
@@ -0,0 +1,38 @@
+"""
+Prometheus metrics exported by the traefik proxy
+
+Metrics are registered in prometheus_client's default registry,
+so they are served with JupyterHub's own metrics on /hub/metrics,
+with the same `jupyterhub_` prefix.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from jupyterhub.metrics import metrics_prefix
+from prometheus_client import Counter, Gauge, Histogram
+
+TRAEFIK_UP = Gauge(
+    'traefik_up',
+    'Number of running traefik processes (replicas) started by the Hub',
+    namespace=metrics_prefix,
+)
+
+TRAEFIK_RESTARTS = Counter(
+    'traefik_restarts',
+    'Number of times traefik was restarted after exiting unexpectedly',
+    namespace=metrics_prefix,
+)
+
+TRAEFIK_DOWNTIME_SECONDS = Counter(
+    'traefik_downtime_seconds',
+    'Total time traefik was down, from detecting its exit to being ready again',
+    namespace=metrics_prefix,
+)
+
+TRAEFIK_RECOVERY_DURATION_SECONDS = Histogram(
+    'traefik_recovery_duration_seconds',
+    'Time taken by a successful restart of traefik, until it is ready',
+    buckets=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf")],
+    namespace=metrics_prefix,
+)
@@ -19,19 +19,102 @@ Route Specification:
 # Distributed under the terms of the Modified BSD License.
 
 import asyncio
+import copy
+import hashlib
 import json
 import os
+import signal
 import ssl
+import time
+from contextlib import contextmanager
+from functools import partial
 from os.path import abspath
 from subprocess import Popen, TimeoutExpired
 from urllib.parse import urlparse, urlunparse
 
 from jupyterhub.proxy import Proxy
 from jupyterhub.utils import exponential_backoff, new_token, url_path_join
-from tornado.httpclient import AsyncHTTPClient, HTTPClientError
-from traitlets import Any, Bool, Dict, Integer, Unicode, default, observe, validate
+from traitlets import (
+    Any,
+    Bool,
+    Dict,
+    Enum,
+    Float,
+    Integer,
+    List,
+    Type,
+    Unicode,
+    Union,
+    default,
+    observe,
+    validate,
+)
+
+from . import metrics, traefik_utils
+from .accesslog import AccessLogStats, follow_access_log
+from .routestore import RouteIndex, RouteStore, route_stores
+
+
+class _AdoptedProcess:
+    """Popen-like handle on a traefik process started by a previous Hub
+
+    The process is not a child of this one, so it can only be signaled,
+    and waited for by polling.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def cmdline(self):
+        """The process' arguments, or None if they can't be read (not linux)"""
+        try:
+            with open(f"/proc/{self.pid}/cmdline", "rb") as f:
+                return f.read().decode("utf8", "replace").split("\0")
+        except FileNotFoundError:
+            if os.path.isdir("/proc/self"):
+                # /proc exists, the process doesn't
+                return []
+            return None
+
+    def poll(self):
+        try:
+            # reap it, if it happens to be our child
+            if os.waitpid(self.pid, os.WNOHANG)[0]:
+                return 0
+        except ChildProcessError:
+            pass
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return 0
+        except PermissionError:
+            # alive, but not ours
+            pass
+        return None
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
 
-from . import traefik_utils
+    def kill(self):
+        self._signal(signal.SIGKILL)
+
+    def _signal(self, signum):
+        try:
+            os.kill(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutExpired("traefik", timeout)
+            time.sleep(0.1)
+        return 0
+
+    def communicate(self, timeout=None):
+        self.wait(timeout)
+        return None, None
 
 
 class TraefikProxy(Proxy):
@@ -259,23 +342,390 @@ class TraefikProxy(Proxy):
 
     traefik_api_hashed_password = Unicode()
 
+    traefik_ping = Bool(
+        False,
+        config=True,
+        help="""Enable traefik's ping endpoint on the api entrypoint,
+        and use it to wait for traefik to start.
+
+        `/ping` is unauthenticated and cheap to serve,
+        while every api request checks the (deliberately slow) hash of the api password.
+        The api is only checked once traefik answers pings.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_metrics_url = Unicode(
+        "",
+        config=True,
+        help="""URL of an entrypoint serving traefik's prometheus metrics,
+        e.g. `http://127.0.0.1:8082`.
+
+        When set, traefik collects prometheus metrics with router and service labels,
+        served on `/metrics` of this dedicated entrypoint,
+        which is usually only on localhost.
+        :meth:`get_route_metrics` scrapes them,
+        for request rates and latencies by route.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        Replicas serve their metrics on consecutive ports.
+        """,
+    )
+
+    traefik_metrics_entrypoint = Unicode(
+        "metrics",
+        config=True,
+        help="""The traefik entrypoint name serving prometheus metrics""",
+    )
+
+    traefik_metrics_buckets = List(
+        Float(),
+        [0.1, 0.3, 1.2, 5.0],
+        config=True,
+        help="""Upper bounds, in seconds, of the buckets of traefik's request duration histograms
+
+        Latency quantiles from :meth:`get_route_metrics`
+        are interpolated within these buckets.
+        """,
+    )
+
+    traefik_access_log_file = Unicode(
+        "",
+        config=True,
+        help="""File where traefik writes its access log, in JSON.
+
+        When set, the proxy follows the log, and aggregates per-route request counts,
+        status codes and durations in :attr:`access_log_stats`,
+        e.g. to find slow servers and busy routes.
+        Replicas write to their own file, e.g. `access.replica1.log`.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_access_log_buffering_size = Integer(
+        100,
+        config=True,
+        help="""Number of access log lines traefik buffers before writing them
+
+        (traefik's `accessLog.bufferingSize`)
+        """,
+    )
+
+    traefik_access_log_filters = Dict(
+        config=True,
+        help="""Filters of the requests traefik writes to its access log
+
+        (traefik's `accessLog.filters`), e.g. to only log slow requests and errors::
+
+            {"minDuration": "100ms", "statusCodes": ["500-599"]}
+
+        Requests filtered out are not counted in :attr:`access_log_stats`.
+        """,
+    )
+
+    access_log_max_routes = Integer(
+        1000,
+        config=True,
+        help="""Maximum number of routes with their own access log statistics
+
+        Requests to further routes are counted together, under the routespec `None`.
+        """,
+    )
+
+    access_log_buckets = List(
+        Float(),
+        [0.01, 0.05, 0.1, 0.3, 1.2, 5.0],
+        config=True,
+        help="""Upper bounds, in seconds, of the buckets of access log request durations""",
+    )
+
+    access_log_read_interval = Float(
+        1,
+        config=True,
+        help="""Interval (in seconds) between reads of new access log lines""",
+    )
+
+    access_log_stats = Any(
+        help="""The :class:`AccessLogStats` of requests read from traefik's access log"""
+    )
+
+    @default("access_log_stats")
+    def _default_access_log_stats(self):
+        return AccessLogStats(
+            self.provider_name,
+            buckets=self.access_log_buckets,
+            max_routes=self.access_log_max_routes,
+        )
+
+    preload_routes = Bool(
+        False,
+        config=True,
+        help="""Write the routes the Hub knows about before traefik starts.
+
+        The routes of the Hub, of running servers and services,
+        and :attr:`extra_routes` are written in bulk
+        into traefik's initial dynamic configuration,
+        so traefik serves the full routing table from its first load.
+        Routes already stored unchanged in the provider or route store are not rewritten.
+
+        Without it, traefik starts with the routes persisted in its provider,
+        and JupyterHub's `check_routes` adds any missing route one at a time.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_pid_file = Unicode(
+        "",
+        config=True,
+        help="""File where to record the pid of the traefik process started by the Hub,
+        with a hash of its static configuration.
+
+        If set, a restarted Hub adopts the traefik process left running by the previous one
+        (see `JupyterHub.cleanup_proxy`) instead of starting a new one,
+        as long as its static configuration is unchanged.
+        Only the dynamic configuration is rewritten,
+        so open connections, e.g. to running kernels, are kept.
+        If the static configuration changed, the old traefik is stopped and a new one started.
+
+        traefik is started in its own session,
+        so that it is not interrupted together with the Hub.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_request_accept_grace_timeout = Float(
+        0,
+        config=True,
+        help="""Time (in seconds) traefik keeps accepting requests after it is asked to stop.
+
+        Written to the `lifeCycle.requestAcceptGraceTimeout` of traefik's entrypoints,
+        e.g. to let a load balancer in front of traefik notice it is going away.
+        While it lasts, traefik's ping endpoint answers 503.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_grace_timeout = Float(
+        10,
+        config=True,
+        help="""Time (in seconds) traefik lets active requests finish
+        once it stopped accepting new ones.
+
+        Written to the `lifeCycle.graceTimeOut` of traefik's entrypoints.
+        traefik is killed if it is still running
+        after this and :attr:`traefik_request_accept_grace_timeout`.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_reuse_port = Bool(
+        False,
+        config=True,
+        help="""Set `reusePort` on traefik's entrypoints,
+        so that two traefik processes can listen on the same ports.
+
+        Required by :meth:`rolling_restart`.
+        Needs traefik 3.1 or later, and an OS supporting SO_REUSEPORT (e.g. linux).
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_replicas = Integer(
+        1,
+        config=True,
+        help="""Number of traefik processes to start.
+
+        Replicas load the same dynamic config from the provider,
+        and share the public entrypoint through `reusePort`,
+        so the kernel spreads connections across them,
+        and throughput scales across cores.
+        Each replica has its own api entrypoint,
+        on consecutive ports from the port of :attr:`traefik_api_url`,
+        and its own static config file next to :attr:`static_config_file`.
+        Routes are only ready once every replica has loaded them.
+
+        Needs traefik 3.1 or later, and an OS supporting SO_REUSEPORT (e.g. linux).
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    @validate("traefik_replicas")
+    def _validate_replicas(self, proposal):
+        if proposal.value < 1:
+            raise ValueError(
+                f"traefik_replicas must be at least 1, not {proposal.value}"
+            )
+        return proposal.value
+
+    traefik_processes = List(
+        help="""The traefik processes started by the Hub, by replica.
+
+        :attr:`traefik_process` is the first one.
+        """
+    )
+
+    supervise_traefik = Bool(
+        False,
+        config=True,
+        help="""Watch the traefik process, and restart it if it exits.
+
+        Restarts are retried with exponential backoff,
+        up to :attr:`traefik_restart_max_backoff` seconds apart.
+        traefik reloads the routing table from its provider,
+        so routes are not rewritten, and a restart takes seconds
+        even with a large routing table.
+
+        Restarts, downtime and recovery time are exported as prometheus metrics,
+        next to JupyterHub's.
+
+        Only has an effect when traefik is started by the Hub (should_start=True).
+        """,
+    )
+
+    traefik_supervise_interval = Float(
+        1,
+        config=True,
+        help="""How often (in seconds) to check that traefik is running,
+        with :attr:`supervise_traefik`.
+        """,
+    )
+
+    traefik_restart_max_backoff = Float(
+        30,
+        config=True,
+        help="""Maximum delay (in seconds) between attempts to restart traefik,
+        with :attr:`supervise_traefik`.
+
+        The delay doubles from 1s with each consecutive restart,
+        and is reset once traefik has stayed up for longer than this.
+        """,
+    )
+
+    _supervisor_task = None
+
+    # this proxy's share of the process-global TRAEFIK_UP gauge,
+    # which other proxies (e.g. shards) add to as well
+    _traefik_up = 0
+
+    def _set_traefik_up(self, up):
+        """Record the number of running traefik processes of this proxy"""
+        metrics.TRAEFIK_UP.inc(up - self._traefik_up)
+        self._traefik_up = up
+
+    startup_timings = Dict(
+        help="""Duration (in seconds) of each phase of the last :meth:`start`, by phase.
+
+        Phases may overlap.
+        """
+    )
+
+    # tasks following the access log of each replica
+    _access_log_tasks = ()
+
+    # (time, router metrics) of the previous get_route_metrics, for rates
+    _route_metrics_sample = None
+
+    # decides which of the Hub's routes to preload,
+    # e.g. for a shard of TraefikShardedProxy. None preloads them all.
+    _owns_route = None
+
+    # whether traefik needs its dynamic config before it is launched,
+    # or may load it from its provider while it boots
+    _dynamic_config_before_traefik = True
+
     check_route_timeout = Integer(
         30,
         config=True,
         help="""Timeout (in seconds) when waiting for traefik to register an updated route.""",
     )
 
+    route_store_class = Union(
+        [Enum(list(route_stores)), Type(klass=RouteStore)],
+        default_value="provider",
+        config=True,
+        help="""Where to store jupyterhub's metadata of each route.
+
+        Traefik never reads the jupyterhub part of a route
+        (its routespec, target and data).
+
+        - provider (default): in the traefik provider, next to traefik's configuration,
+          written in the same transaction.
+        - sqlite: in a local SQLite database (see `SQLiteRouteStore.db_file`).
+        - memory: in memory only. Routes are rebuilt from traefik's api on startup,
+          without their data.
+
+        Or a :class:`~jupyterhub_traefik_proxy.routestore.RouteStore` subclass.
+
+        With a store outside the provider, the provider holds less data,
+        and listing routes is a local read,
+        but traefik's config and the metadata are no longer updated atomically.
+
+        When switching away from "provider", the records stored in the provider
+        by previous runs are moved to the new store on startup.
+        """,
+    )
+
+    route_store = Any()
+
+    @default("route_store")
+    def _default_route_store(self):
+        route_store_class = self.route_store_class
+        if isinstance(route_store_class, str):
+            route_store_class = route_stores[route_store_class]
+        return route_store_class(parent=self)
+
+    route_index_data_keys = List(
+        Unicode(),
+        ["user"],
+        config=True,
+        help="""Keys of route data to index, for :meth:`find_routes`.
+
+        Routes are always indexed by the hostname of their target.
+        """,
+    )
+
+    route_index = Any()
+
+    @default("route_index")
+    def _default_route_index(self):
+        return RouteIndex(self.route_index_data_keys)
+
+    skip_unchanged_routes = Bool(
+        False,
+        config=True,
+        help="""Don't rewrite routes that are already stored unchanged.
+
+        JupyterHub re-adds routes on startup and in `check_routes`.
+        When the stored route has the same target and data
+        and the same traefik configuration,
+        `add_route` returns without writing and without waiting for traefik to reload.
+
+        The check reads the route from the provider before every write,
+        so it only pays off when most added routes are already stored.
+        """,
+    )
+
     def _generate_htpassword(self):
         from passlib.hash import apr_md5_crypt
 
         self.traefik_api_hashed_password = apr_md5_crypt.hash(self.traefik_api_password)
 
-    async def _check_for_traefik_service(self, routespec, kind):
+    async def _check_for_traefik_service(self, routespec, kind, api_url=None):
         """Check for an expected router or service in the Traefik API.
 
         This is used to wait for traefik to load configuration
         from a provider
         """
+        from tornado.httpclient import HTTPClientError
+
         # expected e.g. 'service' + '_' + routespec @ file
         routespec = self.validate_routespec(routespec)
         expected = (
@@ -283,7 +733,7 @@ class TraefikProxy(Proxy):
         )
         path = f"/api/http/{kind}s/{expected}"
         try:
-            resp = await self._traefik_api_request(path)
+            resp = await self._traefik_api_request(path, api_url)
             json.loads(resp.body)
         except HTTPClientError as e:
             if e.code == 404:
@@ -300,13 +750,21 @@ class TraefikProxy(Proxy):
 
     async def _wait_for_route(self, routespec):
         self.log.debug("Waiting for %s to register with traefik", routespec)
+        # every replica must load the route
+        pending = [self._replica_api_url(replica) for replica in self._replicas]
 
         async def _check_traefik_dynamic_conf_ready():
             """Check if traefik loaded its dynamic configuration yet"""
-            if not await self._check_for_traefik_service(routespec, "service"):
-                return False
-            if not await self._check_for_traefik_service(routespec, "router"):
-                return False
+            for api_url in list(pending):
+                if not await self._check_for_traefik_service(
+                    routespec, "service", api_url
+                ):
+                    return False
+                if not await self._check_for_traefik_service(
+                    routespec, "router", api_url
+                ):
+                    return False
+                pending.remove(api_url)
 
             return True
 
@@ -317,9 +775,14 @@ class TraefikProxy(Proxy):
             timeout=self.check_route_timeout,
         )
 
-    async def _traefik_api_request(self, path):
-        """Make an API request to traefik"""
-        url = url_path_join(self.traefik_api_url, path)
+    async def _traefik_api_request(self, path, api_url=None):
+        """Make an API request to traefik
+
+        To the api of the first replica, unless another `api_url` is given.
+        """
+        from tornado.httpclient import AsyncHTTPClient
+
+        url = url_path_join(api_url or self.traefik_api_url, path)
         self.log.debug("Fetching traefik api %s", url)
         resp = await AsyncHTTPClient().fetch(
             url,
@@ -333,23 +796,50 @@ class TraefikProxy(Proxy):
             self.log.debug("%s GET %s", resp.code, url)
         return resp
 
-    async def _wait_for_static_config(self):
+    async def _wait_for_ping(self, api_url=None):
+        """Wait for traefik to answer on its ping endpoint"""
+        from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+        api_url = api_url or self.traefik_api_url
+        url = urlunparse(urlparse(api_url)._replace(path="/ping"))
+
+        async def _check_traefik_ping():
+            try:
+                await AsyncHTTPClient().fetch(
+                    url, validate_cert=self.traefik_api_validate_cert
+                )
+            except (HTTPClientError, OSError, ssl.SSLError) as e:
+                self.log.debug(f"traefik not answering at {url} yet: {e}")
+                return False
+            return True
+
+        await exponential_backoff(
+            _check_traefik_ping,
+            "Traefik ping endpoint not available",
+            timeout=self.check_route_timeout,
+        )
+
+    async def _wait_for_static_config(self, api_url=None):
+        from tornado.httpclient import HTTPClientError
+
+        api_url = api_url or self.traefik_api_url
+
         async def _check_traefik_static_conf_ready():
             """Check if traefik loaded its static configuration yet"""
             try:
-                await self._traefik_api_request("/api/overview")
+                await self._traefik_api_request("/api/overview", api_url)
                 await self._traefik_api_request(
-                    f"/api/entrypoints/{self.traefik_entrypoint}"
+                    f"/api/entrypoints/{self.traefik_entrypoint}", api_url
                 )
             except ConnectionRefusedError:
                 self.log.debug(
-                    f"Connection Refused waiting for traefik at {self.traefik_api_url}. It's probably starting up..."
+                    f"Connection Refused waiting for traefik at {api_url}. It's probably starting up..."
                 )
                 return False
             except HTTPClientError as e:
                 if e.code == 599:
                     self.log.debug(
-                        f"Connection error waiting for traefik at {self.traefik_api_url}. It's probably starting up..."
+                        f"Connection error waiting for traefik at {api_url}. It's probably starting up..."
                     )
                     return False
                 if e.code == 404:
@@ -380,24 +870,90 @@ class TraefikProxy(Proxy):
             timeout=self.check_route_timeout,
         )
 
-    def _stop_traefik(self):
-        self.log.info("Cleaning up traefik proxy [pid=%i]...", self.traefik_process.pid)
-        self.traefik_process.terminate()
-        try:
-            self.traefik_process.communicate(timeout=10)
-        except TimeoutExpired:
-            self.traefik_process.kill()
-            self.traefik_process.communicate()
-        finally:
-            self.traefik_process.wait()
+    @property
+    def _replicas(self):
+        """The indices of the traefik replicas"""
+        return range(self.traefik_replicas if self.should_start else 1)
+
+    def _replica_url(self, url, replica):
+        """The url of an entrypoint of a traefik replica, on consecutive ports"""
+        if not replica:
+            return url
+        url = urlparse(url)
+        host = url.netloc.rsplit(":", 1)[0]
+        return urlunparse(url._replace(netloc=f"{host}:{url.port + replica}"))
+
+    def _replica_api_url(self, replica):
+        """The api url of a traefik replica, on consecutive ports"""
+        return self._replica_url(self.traefik_api_url, replica)
+
+    def _replica_file(self, path, replica):
+        """The file of a traefik replica, next to the file of the first replica"""
+        if not replica:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}.replica{replica}{ext}"
+
+    def _replica_static_config_file(self, replica):
+        """The static config file of a traefik replica, next to static_config_file"""
+        return self._replica_file(self.static_config_file, replica)
+
+    def _set_traefik_processes(self, processes):
+        self.traefik_processes = processes
+        self.traefik_process = processes[0]
+
+    def _stop_traefik(self, *processes):
+        """Stop traefik processes, all replicas by default
+
+        They drain their connections concurrently.
+        """
+        if not processes:
+            processes = self.traefik_processes or [self.traefik_process]
+        for process in processes:
+            self.log.info("Cleaning up traefik proxy [pid=%i]...", process.pid)
+            process.terminate()
+        # let traefik drain its connections, with some slack
+        deadline = (
+            time.monotonic()
+            + self.traefik_request_accept_grace_timeout
+            + self.traefik_grace_timeout
+            + 1
+        )
+        for process in processes:
+            try:
+                process.communicate(timeout=max(deadline - time.monotonic(), 0))
+            except TimeoutExpired:
+                process.kill()
+                process.communicate()
+            finally:
+                process.wait()
+
+    async def _stop_traefik_async(self, *processes):
+        """Stop traefik processes in a thread
+
+        Stopping blocks while traefik drains its connections,
+        which must not block the event loop.
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self._stop_traefik, *processes)
+        )
 
     def _start_traefik(self):
+        self._set_traefik_processes(
+            [self._start_traefik_replica(replica) for replica in self._replicas]
+        )
+
+    def _start_traefik_replica(self, replica):
+        """Start the traefik process of one replica, and return it"""
         env = os.environ.copy()
         env.update(self.traefik_env)
+        config_file = abspath(self._replica_static_config_file(replica))
         try:
-            self.traefik_process = Popen(
-                ["traefik", "--configfile", abspath(self.static_config_file)],
+            return Popen(
+                ["traefik", "--configfile", config_file],
                 env=env,
+                # an adoptable traefik must outlive the Hub's process group
+                start_new_session=bool(self.traefik_pid_file),
             )
         except FileNotFoundError:
             self.log.error(
@@ -406,6 +962,77 @@ class TraefikProxy(Proxy):
             )
             raise
 
+    def _static_config_hash(self):
+        """Hash of the static config files, to tell whether traefik can be adopted"""
+        sha = hashlib.sha256()
+        for replica in self._replicas:
+            with open(self._replica_static_config_file(replica), "rb") as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+
+    def _launch_traefik(self):
+        """Start traefik, or adopt the one left running by a previous Hub"""
+        if self.traefik_pid_file and self._adopt_traefik():
+            return
+        self._start_traefik()
+        self._write_traefik_pid_file()
+
+    def _write_traefik_pid_file(self):
+        if self.traefik_pid_file:
+            pid_record = {
+                "pids": [process.pid for process in self.traefik_processes],
+                "static_config_hash": self._static_config_hash(),
+            }
+            tmp_file = self.traefik_pid_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(pid_record, f)
+            os.replace(tmp_file, self.traefik_pid_file)
+
+    def _adopt_traefik(self):
+        """Adopt the traefik processes recorded in traefik_pid_file
+
+        Returns whether they were adopted.
+        Running traefik processes with a different static config,
+        or with a replica missing, are stopped.
+        """
+        try:
+            with open(self.traefik_pid_file) as f:
+                pid_record = json.load(f)
+            processes = [_AdoptedProcess(int(pid)) for pid in pid_record["pids"]]
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError) as e:
+            self.log.warning(
+                "Ignoring invalid traefik pid file %s: %s", self.traefik_pid_file, e
+            )
+            return False
+
+        running = []
+        for replica, process in enumerate(processes):
+            cmdline = process.cmdline()
+            config_file = abspath(self._replica_static_config_file(replica))
+            if process.poll() is None and (cmdline is None or config_file in cmdline):
+                running.append(process)
+            else:
+                self.log.info("traefik [pid=%i] is no longer running", process.pid)
+        pids = ", ".join(str(process.pid) for process in running)
+
+        if (
+            running
+            and len(running) == len(processes)
+            and pid_record.get("static_config_hash") == self._static_config_hash()
+        ):
+            self._set_traefik_processes(running)
+            self.log.info("Adopting running traefik [pid=%s]", pids)
+            return True
+        if running:
+            self.log.info(
+                "traefik's static config or replicas changed, restarting traefik [pid=%s]",
+                pids,
+            )
+            self._stop_traefik(*running)
+        return False
+
     async def _setup_traefik_static_config(self):
         """When should_start=True, we are in control of traefik's static configuration
         file. This sets up the entrypoints and api handler in self.static_config, and
@@ -429,22 +1056,78 @@ class TraefikProxy(Proxy):
                 "address": urlparse(self.traefik_api_url).netloc,
             },
         }
+        if self.traefik_metrics_url:
+            entrypoints[self.traefik_metrics_entrypoint] = {
+                "address": urlparse(self.traefik_metrics_url).netloc,
+            }
+            self.static_config["metrics"] = {
+                "prometheus": {
+                    "entryPoint": self.traefik_metrics_entrypoint,
+                    "addRoutersLabels": True,
+                    "addServicesLabels": True,
+                    "buckets": self.traefik_metrics_buckets,
+                }
+            }
+
+        for entrypoint in entrypoints.values():
+            entrypoint["transport"] = {
+                "lifeCycle": {
+                    "requestAcceptGraceTimeout": f"{self.traefik_request_accept_grace_timeout:g}s",
+                    "graceTimeOut": f"{self.traefik_grace_timeout:g}s",
+                }
+            }
+            if self.traefik_reuse_port or self.traefik_replicas > 1:
+                entrypoint["reusePort"] = True
 
         self.static_config["entryPoints"] = entrypoints
+        if self.traefik_access_log_file:
+            access_log = {
+                "filePath": abspath(self.traefik_access_log_file),
+                "format": "json",
+                "bufferingSize": self.traefik_access_log_buffering_size,
+            }
+            if self.traefik_access_log_filters:
+                access_log["filters"] = self.traefik_access_log_filters
+            self.static_config["accessLog"] = access_log
         self.static_config["api"] = {}
+        if self.traefik_ping:
+            self.static_config["ping"] = {"entryPoint": self.traefik_api_entrypoint}
 
         self.log.info(f"Writing traefik static config: {self.static_config}")
 
         try:
             handler = traefik_utils.TraefikConfigFileHandler(self.static_config_file)
             handler.atomic_dump(self.static_config)
+            for replica in self._replicas[1:]:
+                # replicas only differ by their api and metrics entrypoints,
+                # and access log file
+                replica_config = copy.deepcopy(self.static_config)
+                replica_entrypoints = replica_config["entryPoints"]
+                replica_entrypoints[self.traefik_api_entrypoint]["address"] = urlparse(
+                    self._replica_api_url(replica)
+                ).netloc
+                if self.traefik_metrics_url:
+                    replica_entrypoints[self.traefik_metrics_entrypoint][
+                        "address"
+                    ] = urlparse(
+                        self._replica_url(self.traefik_metrics_url, replica)
+                    ).netloc
+                if self.traefik_access_log_file:
+                    replica_config["accessLog"]["filePath"] = self._replica_file(
+                        abspath(self.traefik_access_log_file), replica
+                    )
+                handler = traefik_utils.TraefikConfigFileHandler(
+                    self._replica_static_config_file(replica)
+                )
+                handler.atomic_dump(replica_config)
         except Exception:
             self.log.error("Couldn't set up traefik's static config.")
             raise
 
     async def _setup_traefik_dynamic_config(self):
         self.log.debug("Setting up traefik's dynamic config...")
-        self._generate_htpassword()
+        if not self.traefik_api_hashed_password:
+            self._generate_htpassword()
         api_url = urlparse(self.traefik_api_url)
         api_path = api_url.path if api_url.path else '/api'
         api_credentials = (
@@ -470,6 +1153,52 @@ class TraefikProxy(Proxy):
                 }
             }
         await self._apply_dynamic_config(self.dynamic_config, None)
+        if not self.route_store.in_provider:
+            await self._migrate_route_records()
+
+    async def _migrate_route_records(self):
+        """Move route records left in the provider to the route store
+
+        Records are left in the provider by previous runs
+        when :attr:`route_store_class` is changed from "provider".
+        Records already in the route store are kept there,
+        and all records are deleted from the provider.
+        """
+        jupyterhub_config = await self._get_jupyterhub_dynamic_config()
+        routes = {
+            router_alias: route
+            for router_alias, route in (jupyterhub_config.get("routes") or {}).items()
+            if route
+        }
+        if not routes:
+            return
+        routespecs = [route["routespec"] for route in routes.values()]
+        stored = await self.route_store.get_many(routespecs)
+        to_add = {
+            route["routespec"]: (route["target"], route.get("data", {}))
+            for route in routes.values()
+            if stored.get(route["routespec"]) is None
+        }
+        if to_add:
+            await self.route_store.add_many(to_add)
+        results = await self._delete_routes_config(
+            {
+                route["routespec"]: ((), [["routes", router_alias]])
+                for router_alias, route in routes.items()
+            }
+        )
+        for routespec, error in results.items():
+            if error is not None:
+                self.log.error(
+                    "Failed to delete the record of %s from the provider: %s",
+                    routespec,
+                    error,
+                )
+        self.log.info(
+            "Moved %i route record(s) from the provider to %s",
+            len(to_add),
+            type(self.route_store).__name__,
+        )
 
     def validate_routespec(self, routespec):
         """Override jupyterhub's default Proxy.validate_routespec method, as traefik
@@ -487,10 +1216,246 @@ class TraefikProxy(Proxy):
         **Subclasses must define this method**
         if the proxy is to be started by the Hub
         """
+        self.startup_timings = {}
+        tic = time.perf_counter()
+
+        def hash_api_password():
+            with self._startup_phase("hash_api_password"):
+                self._generate_htpassword()
+
+        # hashing the api password is deliberately slow,
+        # so do it in a thread while the static config is written
+        hashing = asyncio.get_running_loop().run_in_executor(None, hash_api_password)
+        with self._startup_phase("static_config"):
+            await self._setup_traefik_static_config()
+        await hashing
+
+        if self._dynamic_config_before_traefik or self.preload_routes:
+            with self._startup_phase("dynamic_config"):
+                await self._setup_traefik_dynamic_config()
+            if self.preload_routes:
+                with self._startup_phase("preload_routes"):
+                    await self._preload_routes()
+            with self._startup_phase("launch"):
+                self._launch_traefik()
+        else:
+            # traefik loads the dynamic config from its provider when it's ready,
+            # so write it while traefik boots
+            with self._startup_phase("launch"):
+                self._launch_traefik()
+            with self._startup_phase("dynamic_config"):
+                await self._setup_traefik_dynamic_config()
+
+        with self._startup_phase("wait_ready"):
+            await self._wait_ready()
+        with self._startup_phase("route_store"):
+            await self.route_store.load()
+
+        self.startup_timings["total"] = time.perf_counter() - tic
+        self.log.info(
+            "Started traefik in %.3fs (%s)",
+            self.startup_timings["total"],
+            ", ".join(
+                f"{phase}: {duration:.3f}s"
+                for phase, duration in self.startup_timings.items()
+                if phase != "total"
+            ),
+        )
+        self._set_traefik_up(len(self.traefik_processes))
+        if self.supervise_traefik:
+            self._supervisor_task = asyncio.ensure_future(self._supervise_traefik())
+        if self.traefik_access_log_file:
+            self._access_log_tasks = [
+                asyncio.ensure_future(
+                    follow_access_log(
+                        self._replica_file(self.traefik_access_log_file, replica),
+                        self.access_log_stats,
+                        interval=self.access_log_read_interval,
+                    )
+                )
+                for replica in self._replicas
+            ]
+
+    async def _wait_ready(self, replica=None):
+        """Wait for traefik started by the Hub to be ready, all replicas by default"""
+        replicas = self._replicas if replica is None else [replica]
+
+        async def wait_replica_ready(replica):
+            api_url = self._replica_api_url(replica)
+            if self.traefik_ping:
+                await self._wait_for_ping(api_url)
+            await self._wait_for_static_config(api_url)
+
+        await asyncio.gather(*(wait_replica_ready(replica) for replica in replicas))
+
+    async def _supervise_traefik(self):
+        """Restart traefik replicas whenever they exit, until the proxy stops"""
+        started = time.monotonic()
+        # consecutive restarts of each replica, for the backoff
+        restarts = {}
+        up_since = {}
+        while True:
+            await asyncio.sleep(self.traefik_supervise_interval)
+            # processes may be replaced while restarting, e.g. by rolling_restart
+            for replica in range(len(self.traefik_processes)):
+                process = self.traefik_processes[replica]
+                status = process.poll()
+                if status is None:
+                    continue
+                down_since = time.monotonic()
+                self._set_traefik_up(self._traefik_up - 1)
+                self.log.error(
+                    "traefik replica %i [pid=%i] exited with status %s",
+                    replica,
+                    process.pid,
+                    status,
+                )
+                if (
+                    down_since - up_since.get(replica, started)
+                    > self.traefik_restart_max_backoff
+                ):
+                    restarts[replica] = 0
+                while True:
+                    if restarts.get(replica):
+                        delay = min(
+                            2 ** (restarts[replica] - 1),
+                            self.traefik_restart_max_backoff,
+                        )
+                        self.log.info(
+                            "Restarting traefik replica %i in %.1fs", replica, delay
+                        )
+                        await asyncio.sleep(delay)
+                    restarts[replica] = restarts.get(replica, 0) + 1
+                    metrics.TRAEFIK_RESTARTS.inc()
+                    tic = time.monotonic()
+                    try:
+                        await self._restart_traefik(replica)
+                    except Exception as e:
+                        self.log.error(
+                            "Failed to restart traefik replica %i: %s", replica, e
+                        )
+                    else:
+                        break
+                up_since[replica] = time.monotonic()
+                metrics.TRAEFIK_RECOVERY_DURATION_SECONDS.observe(
+                    up_since[replica] - tic
+                )
+                metrics.TRAEFIK_DOWNTIME_SECONDS.inc(up_since[replica] - down_since)
+                self._set_traefik_up(self._traefik_up + 1)
+                self.log.info(
+                    "Restarted traefik replica %i [pid=%i], down for %.3fs",
+                    replica,
+                    self.traefik_processes[replica].pid,
+                    up_since[replica] - down_since,
+                )
+
+    async def rolling_restart(self):
+        """Replace traefik with new processes, without refusing any connection
+
+        The static config is rewritten, and new traefik processes
+        are started on the same ports, one per replica.
+        Once they are ready, the old ones are stopped,
+        and drain their connections according to
+        :attr:`traefik_request_accept_grace_timeout` and :attr:`traefik_grace_timeout`.
+        Use it to apply changes to the static config,
+        including the number of replicas.
+
+        Requires `reusePort`, set when the old traefik was started,
+        with :attr:`traefik_reuse_port` or several :attr:`traefik_replicas`.
+        """
+        if not self.should_start:
+            raise RuntimeError(
+                "rolling_restart requires traefik to be started by the Hub"
+            )
+        if not (self.traefik_reuse_port or self.traefik_replicas > 1):
+            raise RuntimeError("rolling_restart requires traefik_reuse_port = True")
+        old_processes = list(self.traefik_processes)
+        await self._setup_traefik_static_config()
+        new_processes = []
+        try:
+            for replica in self._replicas:
+                process = self._start_traefik_replica(replica)
+                new_processes.append(process)
+                self.log.info(
+                    "Rolling restart of traefik replica %i [pid=%i]",
+                    replica,
+                    process.pid,
+                )
+                await self._wait_listening(process, replica)
+                await self._wait_ready(replica)
+        except BaseException:
+            self.log.error(
+                "Rolling restart of traefik failed, keeping the old processes"
+            )
+            await self._stop_traefik_async(*new_processes)
+            raise
+        self._set_traefik_processes(new_processes)
+        self._write_traefik_pid_file()
+        self._set_traefik_up(len(new_processes))
+        await self._stop_traefik_async(*old_processes)
+
+    async def _wait_listening(self, process, replica=0):
+        """Wait for a traefik process to listen on its entrypoints
+
+        When two traefik processes share the ports,
+        the api may be answered by either one,
+        so readiness checks alone can't tell whether the new one is up.
+        """
+        ports = {
+            urlparse(self.public_url).port,
+            urlparse(self._replica_api_url(replica)).port,
+        }
+
+        async def _check_listening():
+            status = process.poll()
+            if status is not None:
+                raise RuntimeError(f"traefik exited with status {status}")
+            listening = traefik_utils.listening_ports(process.pid)
+            # can't tell without /proc
+            return listening is None or ports <= listening
+
+        await exponential_backoff(
+            _check_listening,
+            f"traefik [pid={process.pid}] not listening on {ports}",
+            timeout=self.check_route_timeout,
+        )
+
+    async def _restart_traefik(self, replica=0):
+        """Relaunch a traefik replica after it exited, and wait for it to be ready
+
+        The dynamic config, routes included, is still in the provider,
+        so only the static config files are rewritten.
+        """
+        process = self.traefik_processes[replica]
+        if process.poll() is None:
+            # left running by a failed restart
+            await self._stop_traefik_async(process)
         await self._setup_traefik_static_config()
-        await self._setup_traefik_dynamic_config()
-        self._start_traefik()
-        await self._wait_for_static_config()
+        process = self._start_traefik_replica(replica)
+        processes = list(self.traefik_processes)
+        processes[replica] = process
+        self._set_traefik_processes(processes)
+        self._write_traefik_pid_file()
+        ready = asyncio.ensure_future(self._wait_ready(replica))
+        try:
+            # don't wait for the timeout if traefik exits right away
+            while not ready.done():
+                status = process.poll()
+                if status is not None:
+                    raise RuntimeError(f"traefik exited with status {status}")
+                await asyncio.wait([ready], timeout=self.traefik_supervise_interval)
+            ready.result()
+        finally:
+            ready.cancel()
+
+    @contextmanager
+    def _startup_phase(self, phase):
+        """Record the duration of a phase of start in startup_timings"""
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - tic
 
     async def _start_external(self):
         """Startup function called when `not self.should_start`
@@ -499,6 +1464,7 @@ class TraefikProxy(Proxy):
         """
         await self._setup_traefik_dynamic_config()
         await self._wait_for_static_config()
+        await self.route_store.load()
         self._start_future = None
 
     async def stop(self):
@@ -509,21 +1475,38 @@ class TraefikProxy(Proxy):
         **Subclasses must define this method**
         if the proxy is to be started by the Hub
         """
-        self._stop_traefik()
+        if self._supervisor_task is not None:
+            self._supervisor_task.cancel()
+            self._supervisor_task = None
+        for task in self._access_log_tasks:
+            task.cancel()
+        self._access_log_tasks = ()
+        if self.traefik_processes or self.traefik_process:
+            # not when traefik is managed externally
+            await self._stop_traefik_async()
+        self._set_traefik_up(0)
         self._cleanup()
+        await self.route_store.close()
 
     def _cleanup(self):
         """Cleanup after stop
 
         Extend if there's more to cleanup than the static config file
         """
-        if self.should_start:
+        if self.should_start and self.traefik_pid_file:
             try:
-                os.remove(self.static_config_file)
-            except Exception as e:
-                self.log.error(
-                    f"Failed to remove traefik config file {self.static_config_file}: {e}"
-                )
+                os.remove(self.traefik_pid_file)
+            except FileNotFoundError:
+                pass
+        if self.should_start:
+            for replica in self._replicas:
+                config_file = self._replica_static_config_file(replica)
+                try:
+                    os.remove(config_file)
+                except Exception as e:
+                    self.log.error(
+                        f"Failed to remove traefik config file {config_file}: {e}"
+                    )
 
     def _dynamic_config_for_route(self, routespec, target, data):
         """Returns two dicts, which will be used to update traefik configuration for a given route
@@ -581,6 +1564,126 @@ class TraefikProxy(Proxy):
         }
         return traefik_config, jupyterhub_config
 
+    async def _apply_route_config(self, routespec, target, data):
+        """Apply the dynamic config for a single route
+
+        Subclasses may override this to store a route
+        more efficiently than via :meth:`_apply_dynamic_config`.
+        """
+        traefik_config, jupyterhub_config = self._dynamic_config_for_route(
+            routespec, target, data
+        )
+        if not self.route_store.in_provider:
+            jupyterhub_config = None
+        await self._apply_dynamic_config(traefik_config, jupyterhub_config)
+
+    async def _apply_routes_config(self, routes):
+        """Apply the dynamic config of several routes at once
+
+        Args:
+            routes (dict): (target, data) by routespec
+
+        The default merges the config of all routes
+        into a single call to :meth:`_apply_dynamic_config`.
+        """
+        traefik_config = {}
+        jupyterhub_config = {}
+        for routespec, (target, data) in routes.items():
+            (
+                route_traefik_config,
+                route_jupyterhub_config,
+            ) = self._dynamic_config_for_route(routespec, target, data)
+            traefik_utils.deep_merge(traefik_config, route_traefik_config)
+            traefik_utils.deep_merge(jupyterhub_config, route_jupyterhub_config)
+        if not self.route_store.in_provider:
+            jupyterhub_config = None
+        await self._apply_dynamic_config(traefik_config, jupyterhub_config)
+
+    def _hub_known_routes(self):
+        """Return the routes the Hub knows about, as (target, data) by routespec
+
+        These are the routes JupyterHub's `check_routes` would add.
+        """
+        app = self.app
+        if app is None:
+            return {}
+        routes = {}
+        hub = getattr(app, "hub", None)
+        if hub is not None:
+            routes[hub.routespec] = (hub.host, {"hub": True})
+        for user in (getattr(app, "users", None) or {}).values():
+            for name, spawner in user.spawners.items():
+                if spawner.ready:
+                    routes[spawner.proxy_spec] = (
+                        spawner.server.host,
+                        {"user": user.name, "server_name": name},
+                    )
+        for service in (getattr(app, "_service_map", None) or {}).values():
+            if service.server is not None:
+                routes[service.proxy_spec] = (
+                    service.server.host,
+                    {"service": service.name},
+                )
+        for routespec, url in self.extra_routes.items():
+            routes[routespec] = (url, {"extra": True})
+        return routes
+
+    def _record_matches(self, record, target, data):
+        """Whether a route record, as returned by get_route, has this target and data"""
+        return (
+            record is not None and record["target"] == target and record["data"] == data
+        )
+
+    async def _preload_routes(self):
+        """Write all the routes the Hub knows about in bulk"""
+        routes = {
+            self.validate_routespec(routespec): route
+            for routespec, route in self._hub_known_routes().items()
+        }
+        if self._owns_route is not None:
+            routes = {
+                routespec: route
+                for routespec, route in routes.items()
+                if self._owns_route(routespec)
+            }
+        known = len(routes)
+        if self.skip_unchanged_routes and routes:
+            stored = await self.get_all_routes()
+            routes = {
+                routespec: (target, data)
+                for routespec, (target, data) in routes.items()
+                if not self._record_matches(stored.get(routespec), target, data)
+            }
+        if routes:
+            await self._apply_routes_config(routes)
+            if not self.route_store.in_provider:
+                await self.route_store.add_many(routes)
+                traefik_utils.clear_coalesced(self)
+            for routespec, (target, data) in routes.items():
+                self.route_index.add(routespec, target, data)
+        self.log.info(
+            "Preloaded %i route(s), %i already stored", len(routes), known - len(routes)
+        )
+
+    async def _route_is_current(self, routespec, target, data):
+        """Whether a route is already stored exactly as it would be added
+
+        Subclasses should override this with a cheap check
+        of the traefik configuration of the route in the provider,
+        and of the jupyterhub configuration too if :attr:`route_store` is the provider.
+        The default always returns False, i.e. always writes.
+        """
+        return False
+
+    async def _route_is_unchanged(self, routespec, target, data):
+        """Whether a route is stored unchanged, in the provider and the route store"""
+        if not await self._route_is_current(routespec, target, data):
+            return False
+        if self.route_store.in_provider:
+            return True
+        record = await self.route_store.get(routespec)
+        return record == {"routespec": routespec, "target": target, "data": data}
+
     async def add_route(self, routespec, target, data):
         """Add a route to the proxy.
 
@@ -603,13 +1706,21 @@ class TraefikProxy(Proxy):
             await self._start_future
         routespec = self.validate_routespec(routespec)
 
-        traefik_config, jupyterhub_config = self._dynamic_config_for_route(
-            routespec, target, data
-        )
-
         try:
             async with self.semaphore:
-                await self._apply_dynamic_config(traefik_config, jupyterhub_config)
+                if self.skip_unchanged_routes and await self._route_is_unchanged(
+                    routespec, target, data
+                ):
+                    self.log.debug("Route %s is unchanged, not updating", routespec)
+                    self.route_index.add(routespec, target, data)
+                    return
+                await self._apply_route_config(routespec, target, data)
+                if not self.route_store.in_provider:
+                    await self.route_store.add(routespec, target, data)
+                    # reads since the config was written may have cached
+                    # the record from before this add
+                    traefik_utils.clear_coalesced(self)
+                self.route_index.add(routespec, target, data)
                 await self._wait_for_route(routespec)
         except TimeoutError:
             self.log.error(f"Traefik route for {routespec} never appeared.")
@@ -647,9 +1758,168 @@ class TraefikProxy(Proxy):
         """Delete a route with a given routespec if it exists."""
         routespec = self.validate_routespec(routespec)
         traefik_keys, jupyterhub_keys = self._keys_for_route(routespec)
+        if not self.route_store.in_provider:
+            # delete the metadata first, so the route isn't listed
+            # if deleting the traefik config fails
+            await self.route_store.delete(routespec)
+            jupyterhub_keys = ()
         await self._delete_dynamic_config(traefik_keys, jupyterhub_keys)
+        self.route_index.remove(routespec)
         self.log.debug("Route %s was deleted.", routespec)
 
+    async def _delete_routes_config(self, route_keys):
+        """Delete the dynamic config of several routes
+
+        Args:
+            route_keys (dict): (traefik_keys, jupyterhub_keys) by routespec,
+                as returned by :meth:`_keys_for_route`
+
+        Returns:
+            results (dict): None, or the exception that prevented deleting the route,
+                by routespec
+
+        The default implementation deletes all keys
+        with a single call to :meth:`_delete_dynamic_config`.
+        """
+        traefik_keys = []
+        jupyterhub_keys = []
+        for route_traefik_keys, route_jupyterhub_keys in route_keys.values():
+            traefik_keys.extend(route_traefik_keys)
+            jupyterhub_keys.extend(route_jupyterhub_keys)
+        try:
+            await self._delete_dynamic_config(traefik_keys, jupyterhub_keys)
+        except Exception as e:
+            return dict.fromkeys(route_keys, e)
+        return dict.fromkeys(route_keys)
+
+    async def delete_routes(self, routespecs):
+        """Delete several routes at once, e.g. when culling idle servers
+
+        Much cheaper than calling :meth:`delete_route` for each route:
+        the file provider is written once,
+        and key-value stores delete routes in as few transactions as they allow.
+
+        Args:
+            routespecs (list): URIs that were used to add routes
+
+        Returns:
+            results (dict):
+                dict keyed by normalized routespec,
+                with None if the route was deleted (or didn't exist),
+                or the exception that prevented deleting it.
+        """
+        routespecs = list(
+            dict.fromkeys(
+                self.validate_routespec(routespec) for routespec in routespecs
+            )
+        )
+        if not routespecs:
+            return {}
+        route_keys = {}
+        for routespec in routespecs:
+            traefik_keys, jupyterhub_keys = self._keys_for_route(routespec)
+            if not self.route_store.in_provider:
+                jupyterhub_keys = ()
+            route_keys[routespec] = (traefik_keys, jupyterhub_keys)
+        if not self.route_store.in_provider:
+            # delete the metadata first, like delete_route
+            await self.route_store.delete(*routespecs)
+
+        results = await self._delete_routes_config(route_keys)
+        failed = {}
+        for routespec, error in results.items():
+            if error is None:
+                self.route_index.remove(routespec)
+            else:
+                failed[routespec] = error
+        if failed:
+            self.log.error(
+                "Failed to delete %i route(s): %s",
+                len(failed),
+                "; ".join(f"{routespec}: {e}" for routespec, e in failed.items()),
+            )
+        self.log.debug("Deleted %i route(s).", len(results) - len(failed))
+        return results
+
+    @traefik_utils.coalesce()
+    async def _load_route_index(self):
+        """Index all routes, once, before the first query"""
+        routes = await self.get_all_routes()
+        for routespec, route in routes.items():
+            self.route_index.add(routespec, route["target"], route.get("data"))
+        self.route_index.loaded = True
+        self.log.debug("Indexed %i routes", len(routes))
+
+    async def find_routes(self, target_host=None, **data):
+        """Find routes by target host and/or values in their data
+
+        e.g. `find_routes(user="name")` or `find_routes(target_host="10.0.0.1")`.
+        Routes must match all filters.
+
+        Routes are looked up in in-memory indexes,
+        built from :meth:`get_all_routes` on the first call
+        and updated by :meth:`add_route` and :meth:`delete_route`.
+        At least one filter must be indexed,
+        i.e. `target_host` or a key in :attr:`route_index_data_keys`.
+
+        Returns:
+            routes (dict):
+                dict keyed by routespec,
+                with values as returned by :meth:`get_route`.
+        """
+        filters = {f"data.{key}": value for key, value in data.items()}
+        if target_host is not None:
+            filters["target_host"] = target_host
+        index = self.route_index
+        indexed = {
+            field: value for field, value in filters.items() if index.is_indexed(field)
+        }
+        if not indexed:
+            raise ValueError(
+                f"Can't find routes by {', '.join(filters) or 'nothing'}."
+                f" Filter by target_host or by one of route_index_data_keys={index.data_keys}"
+            )
+        if self._start_future and not self._start_future.done():
+            await self._start_future
+        if not index.loaded:
+            await self._load_route_index()
+
+        routespecs = index.find(indexed)
+        if not routespecs:
+            return {}
+        found = {}
+        # read the matching routes, in case they were changed by another process
+        for routespec, route in (await self.get_routes(sorted(routespecs))).items():
+            if route is None:
+                index.remove(routespec)
+            elif index.matches(route, filters):
+                found[routespec] = route
+            else:
+                index.add(routespec, route["target"], route.get("data"))
+        return found
+
+    async def get_routes(self, routespecs):
+        """Return the route info for several routespecs at once
+
+        Args:
+            routespecs (list): URIs that were used to add routes
+
+        Returns:
+            routes (dict):
+                dict keyed by normalized routespec,
+                with values as returned by :meth:`get_route`
+                (None for routes that don't exist).
+
+        Subclasses should override this to fetch all routes in one request.
+        """
+        routespecs = [self.validate_routespec(routespec) for routespec in routespecs]
+        if not self.route_store.in_provider:
+            return await self.route_store.get_many(routespecs)
+        routes = await asyncio.gather(
+            *(self.get_route(routespec) for routespec in routespecs)
+        )
+        return dict(zip(routespecs, routes))
+
     async def _get_jupyterhub_dynamic_config(self):
         """Get the jupyterhub part of our dynamic config
 
@@ -680,6 +1950,9 @@ class TraefikProxy(Proxy):
         if self._start_future and not self._start_future.done():
             await self._start_future
 
+        if not self.route_store.in_provider:
+            return await self.route_store.get_all()
+
         jupyterhub_config = await self._get_jupyterhub_dynamic_config()
 
         all_routes = {}
@@ -690,3 +1963,81 @@ class TraefikProxy(Proxy):
                 "target": route["target"],
             }
         return all_routes
+
+    async def get_route_metrics(self, quantiles=(0.5, 0.9, 0.99)):
+        """Scrape traefik's prometheus metrics, and aggregate them by route
+
+        Requires :attr:`traefik_metrics_url`.
+        Metrics are summed over the replicas.
+
+        Returns a dict by routespec of routes that received requests, with:
+
+        - `requests`: the total number of requests since traefik started
+        - `request_rate`: requests per second since the previous call,
+          None on the first call
+        - `duration_quantiles`: estimated request duration in seconds by quantile,
+          over the requests since the previous call
+          (or since traefik started, on the first call).
+          None for a quantile when there were no requests.
+        """
+        from tornado.httpclient import AsyncHTTPClient
+
+        if not self.traefik_metrics_url:
+            raise ValueError(
+                f"{self.__class__.__name__}.traefik_metrics_url must be set to scrape metrics"
+            )
+
+        urls = [
+            url_path_join(
+                self._replica_url(self.traefik_metrics_url, replica), "/metrics"
+            )
+            for replica in self._replicas
+        ]
+        responses = await asyncio.gather(
+            *(
+                AsyncHTTPClient().fetch(
+                    url, validate_cert=self.traefik_api_validate_cert
+                )
+                for url in urls
+            )
+        )
+        now = time.monotonic()
+        routers = traefik_utils.router_metrics(
+            resp.body.decode("utf8") for resp in responses
+        )
+        previous_time, previous_routers = self._route_metrics_sample or (None, {})
+        # counters restart from zero when traefik restarts
+        if any(
+            counters["requests"] < previous_routers.get(router, {}).get("requests", 0)
+            for router, counters in routers.items()
+        ):
+            previous_time, previous_routers = None, {}
+        self._route_metrics_sample = (now, routers)
+
+        route_metrics = {}
+        for router, counters in routers.items():
+            name, _, provider = router.rpartition("@")
+            if provider != self.provider_name or not name.startswith("router_"):
+                # e.g. the api
+                continue
+            routespec = traefik_utils.routespec_from_alias(name, "router")
+            previous = previous_routers.get(router, {})
+            previous_buckets = dict(previous.get("duration_buckets", []))
+            buckets = [
+                (le, count - previous_buckets.get(le, 0))
+                for le, count in counters["duration_buckets"]
+            ]
+            if previous_time is None:
+                request_rate = None
+            else:
+                request_rate = (counters["requests"] - previous.get("requests", 0)) / (
+                    now - previous_time
+                )
+            route_metrics[routespec] = {
+                "requests": counters["requests"],
+                "request_rate": request_rate,
+                "duration_quantiles": {
+                    q: traefik_utils.histogram_quantile(q, buckets) for q in quantiles
+                },
+            }
+        return route_metrics
@@ -0,0 +1,231 @@
+"""Traefik implementation
+
+Custom proxy implementations can subclass :class:`Proxy`
+and register in JupyterHub config:
+
+.. sourcecode:: python
+
+    from mymodule import MyProxy
+    c.JupyterHub.proxy_class = MyProxy
+
+Route Specification:
+
+- A routespec is a URL prefix ([host]/path/), e.g.
+  'host.tld/path/' for host-based routing or '/path/' for default routing.
+- Route paths should be normalized to always start and end with '/'
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from urllib.parse import urlparse
+
+from traitlets import Any, Integer, Unicode, default
+
+from .kv_proxy import TKvProxy
+
+
+class TraefikRedisProxy(TKvProxy):
+    """JupyterHub Proxy implementation using traefik and redis
+
+    Redis has no notion of key prefixes,
+    so every key we write is also recorded in an index set
+    for each of its parent prefixes, stored under :attr:`redis_index_prefix`.
+    Reading or deleting a tree (e.g. a route) reads the index set of its prefix,
+    instead of scanning the whole keyspace.
+    """
+
+    provider_name = "redis"
+
+    redis_url = Unicode(
+        "redis://127.0.0.1:6379",
+        config=True,
+        help="""URL for the redis endpoint.
+
+        Use the `rediss://` scheme to connect with TLS.
+        A database other than 0 can be selected with a path, e.g. `redis://host:6379/1`.
+        """,
+    )
+    redis_username = Unicode(
+        "",
+        config=True,
+        help="Username for accessing redis.",
+    )
+    redis_password = Unicode(
+        "",
+        config=True,
+        help="Password for accessing redis.",
+    )
+
+    redis_client_ca_cert = Unicode(
+        config=True,
+        allow_none=True,
+        default_value=None,
+        help="""Redis client root certificates""",
+    )
+
+    redis_max_connections = Integer(
+        16,
+        config=True,
+        help="""The maximum number of connections in the redis connection pool.""",
+    )
+
+    redis_index_prefix = Unicode(
+        "jupyterhub_traefik_proxy_index",
+        config=True,
+        help="""Prefix for the index sets of keys under each key prefix.
+
+        Must be outside :attr:`kv_traefik_prefix`,
+        because traefik reads everything under its root key as configuration.
+        """,
+    )
+
+    redis = Any()
+
+    @default("redis")
+    def _default_client(self):
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise ImportError(
+                "Please install redis package to use traefik-proxy with redis"
+            )
+        kwargs = {
+            "max_connections": self.redis_max_connections,
+            "decode_responses": True,
+        }
+        if self.redis_username:
+            kwargs["username"] = self.redis_username
+        if self.redis_password:
+            kwargs["password"] = self.redis_password
+        if self.redis_client_ca_cert:
+            kwargs["ssl_ca_certs"] = self.redis_client_ca_cert
+        pool = redis.asyncio.ConnectionPool.from_url(self.redis_url, **kwargs)
+        return redis.asyncio.Redis(connection_pool=pool)
+
+    async def stop(self):
+        await super().stop()
+        await self.redis.aclose()
+
+    def _setup_traefik_static_config(self):
+        self.log.debug("Setting up the redis provider in the static config")
+        url = urlparse(self.redis_url)
+        provider_config = {
+            "endpoints": [url.netloc.rpartition("@")[2]],
+            "rootKey": self.kv_traefik_prefix,
+        }
+        db = url.path.strip("/")
+        if db:
+            provider_config["db"] = int(db)
+        if url.scheme == "rediss":
+            tls_conf = {}
+            if self.redis_client_ca_cert:
+                tls_conf["ca"] = self.redis_client_ca_cert
+            provider_config["tls"] = tls_conf
+        if self.redis_username:
+            provider_config["username"] = self.redis_username
+        if self.redis_password:
+            provider_config["password"] = self.redis_password
+        self.static_config.update({"providers": {"redis": provider_config}})
+        return super()._setup_traefik_static_config()
+
+    # key index
+
+    def _index_key(self, prefix):
+        """The key of the index set of all keys under `prefix`"""
+        return f"{self.redis_index_prefix}:{prefix}"
+
+    def _key_prefixes(self, key):
+        """Yield every parent prefix of a key, each ending with the separator"""
+        sep = self.kv_separator
+        end = key.find(sep)
+        while end != -1:
+            end += len(sep)
+            yield key[:end]
+            end = key.find(sep, end)
+
+    # key-value generic methods
+
+    async def _kv_atomic_set(self, to_set):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key, value in to_set.items():
+                pipe.set(key, value)
+                for prefix in self._key_prefixes(key):
+                    pipe.sadd(self._index_key(prefix), key)
+            await pipe.execute()
+
+    async def _kv_atomic_delete(self, *to_delete):
+        sep = self.kv_separator
+        trees = [key for key in to_delete if key.endswith(sep)]
+        tree_keys = []
+        if trees:
+            # list the keys of all trees in one round trip
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for prefix in trees:
+                    pipe.smembers(self._index_key(prefix))
+                tree_keys = await pipe.execute()
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for prefix, keys in zip(trees, tree_keys):
+                for key in keys:
+                    self._delete_indexed_key(pipe, key, deleted_prefix=prefix)
+            for key in to_delete:
+                if not key.endswith(sep):
+                    self._delete_indexed_key(pipe, key)
+            await pipe.execute()
+
+    def _delete_indexed_key(self, pipe, key, deleted_prefix=None):
+        """Queue deleting a key and removing it from its parents' index sets
+
+        Index sets of prefixes inside a deleted tree are deleted entirely.
+        """
+        pipe.delete(key)
+        for prefix in self._key_prefixes(key):
+            index_key = self._index_key(prefix)
+            if deleted_prefix and prefix.startswith(deleted_prefix):
+                pipe.delete(index_key)
+            else:
+                pipe.srem(index_key, key)
+
+    async def _kv_get(self, key):
+        return await self.redis.get(key)
+
+    async def _kv_get_tree(self, prefix):
+        (tree,) = await self._kv_get_batch([prefix + self.kv_separator])
+        return tree
+
+    async def _kv_get_batch(self, keys):
+        """Read several keys or trees in two pipelined round trips
+
+        The first lists the keys of each tree from its index,
+        the second reads all values with a single MGET.
+        """
+        sep = self.kv_separator
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                if key.endswith(sep):
+                    pipe.smembers(self._index_key(key))
+                else:
+                    pipe.get(key)
+            first = await pipe.execute()
+
+        listed = [
+            list(result) if key.endswith(sep) else None
+            for key, result in zip(keys, first)
+        ]
+        all_keys = [k for members in listed if members for k in members]
+        values = iter(await self.redis.mget(all_keys) if all_keys else [])
+
+        results = []
+        for key, result, members in zip(keys, first, listed):
+            if members is None:
+                results.append(result)
+                continue
+            # a key may have been deleted since it was listed
+            kv_list = [(k, v) for k, v in zip(members, values) if v is not None]
+            if kv_list:
+                root_key = key[: -len(sep)]
+                results.append(self.unflatten_dict_from_kv(kv_list, root_key=root_key))
+            else:
+                results.append({})
+        return results
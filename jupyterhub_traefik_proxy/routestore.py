@@ -0,0 +1,365 @@
+"""Stores for jupyterhub's route metadata
+
+Traefik only reads the routers and services of each route.
+The jupyterhub part of a route (its routespec, target and data)
+can be stored with traefik's configuration in the provider,
+or separately, in a :class:`RouteStore`.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from numbers import Number
+from urllib.parse import urlparse
+
+from tornado.concurrent import run_on_executor
+from traitlets import Any, Unicode, default
+from traitlets.config import LoggingConfigurable
+
+from . import traefik_utils
+
+
+class RouteStore(LoggingConfigurable):
+    """Base class for stores of jupyterhub route records
+
+    Records are dicts with the keys `routespec`, `target` and `data`,
+    as returned by :meth:`TraefikProxy.get_route`,
+    keyed by normalized routespec.
+
+    The proxy using the store is its `parent`.
+    """
+
+    # whether records are stored in the traefik provider,
+    # together with traefik's config
+    in_provider = False
+
+    async def load(self):
+        """Called once the proxy has started, before routes are read"""
+        pass
+
+    async def close(self):
+        """Called when the proxy stops"""
+        pass
+
+    async def add(self, routespec, target, data):
+        raise NotImplementedError()
+
+    async def add_many(self, routes):
+        """Add several routes, given as (target, data) by routespec"""
+        for routespec, (target, data) in routes.items():
+            await self.add(routespec, target, data)
+
+    async def delete(self, *routespecs):
+        raise NotImplementedError()
+
+    async def get(self, routespec):
+        """Return the record of a route, or None"""
+        return (await self.get_many([routespec]))[routespec]
+
+    async def get_many(self, routespecs):
+        """Return a dict of records by routespec (None for missing routes)"""
+        raise NotImplementedError()
+
+    async def get_all(self):
+        """Return a dict of all records by routespec"""
+        raise NotImplementedError()
+
+
+class ProviderRouteStore(RouteStore):
+    """Store route records in the traefik provider, next to traefik's config
+
+    Records are written in the same transaction as the traefik config,
+    by the proxy itself.
+    This is the default.
+    """
+
+    in_provider = True
+
+
+class MemoryRouteStore(RouteStore):
+    """Store route records in memory only
+
+    When the proxy starts, records are rebuilt from the routers and services
+    traefik has loaded from the provider.
+    The data of rebuilt routes is lost, and is empty until the route is re-added.
+    """
+
+    records = Any()
+
+    @default("records")
+    def _default_records(self):
+        return {}
+
+    async def load(self):
+        proxy = self.parent
+        routers = await self._traefik_api_list("routers")
+        services = {
+            service["name"]: service
+            for service in await self._traefik_api_list("services")
+        }
+        suffix = "@" + proxy.provider_name
+        loaded = 0
+        for router in routers:
+            name = router["name"]
+            if not (name.startswith("router_") and name.endswith(suffix)):
+                continue
+            routespec = traefik_utils.routespec_from_alias(
+                name[: -len(suffix)], "router"
+            )
+            service = services.get(router.get("service", "") + suffix, {})
+            servers = service.get("loadBalancer", {}).get("servers")
+            if not servers or routespec in self.records:
+                continue
+            self.records[routespec] = {
+                "routespec": routespec,
+                "target": servers[0]["url"],
+                "data": {},
+            }
+            loaded += 1
+        self.log.info("Loaded %i route(s) from traefik", loaded)
+
+    async def _traefik_api_list(self, kind):
+        """List all http routers or services in the traefik api, one page at a time"""
+        items = []
+        page = 1
+        while True:
+            resp = await self.parent._traefik_api_request(
+                f"/api/http/{kind}?per_page=1000&page={page}"
+            )
+            items.extend(json.loads(resp.body))
+            # traefik sets X-Next-Page to 1 on the last page
+            next_page = int(resp.headers.get("X-Next-Page") or 1)
+            if next_page <= page:
+                break
+            page = next_page
+        return items
+
+    async def add(self, routespec, target, data):
+        self.records[routespec] = {
+            "routespec": routespec,
+            "target": target,
+            "data": data,
+        }
+
+    async def delete(self, *routespecs):
+        for routespec in routespecs:
+            self.records.pop(routespec, None)
+
+    async def get_many(self, routespecs):
+        return {routespec: self.records.get(routespec) for routespec in routespecs}
+
+    async def get_all(self):
+        return dict(self.records)
+
+
+class SQLiteRouteStore(RouteStore):
+    """Store route records in a local SQLite database
+
+    Records survive restarts, without storing them in the traefik provider.
+    """
+
+    db_file = Unicode(
+        "jupyterhub-traefik-routes.sqlite",
+        config=True,
+        help="""Path of the SQLite database to store route records in.""",
+    )
+
+    executor = Any()
+
+    @default("executor")
+    def _default_executor(self):
+        # sqlite connections must be used from one thread at a time
+        return ThreadPoolExecutor(1)
+
+    db = Any()
+
+    @default("db")
+    def _default_db(self):
+        import sqlite3
+
+        self.log.debug("Opening route store %s", os.path.abspath(self.db_file))
+        db = sqlite3.connect(self.db_file, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS routes"
+            " (routespec TEXT PRIMARY KEY, target TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        db.commit()
+        return db
+
+    @run_on_executor
+    def load(self):
+        # open the database outside the event loop
+        self.db
+
+    @run_on_executor
+    def close(self):
+        self.db.close()
+
+    @run_on_executor
+    def add(self, routespec, target, data):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?)",
+                (routespec, target, json.dumps(data)),
+            )
+
+    @run_on_executor
+    def add_many(self, routes):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?)",
+                [
+                    (routespec, target, json.dumps(data))
+                    for routespec, (target, data) in routes.items()
+                ],
+            )
+
+    @run_on_executor
+    def delete(self, *routespecs):
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM routes WHERE routespec = ?",
+                [(routespec,) for routespec in routespecs],
+            )
+
+    def _records(self, rows):
+        return {
+            routespec: {
+                "routespec": routespec,
+                "target": target,
+                "data": json.loads(data),
+            }
+            for routespec, target, data in rows
+        }
+
+    @run_on_executor
+    def get_many(self, routespecs):
+        routes = dict.fromkeys(routespecs)
+        # stay below sqlite's limit on the number of parameters
+        chunk_size = 500
+        for start in range(0, len(routespecs), chunk_size):
+            chunk = routespecs[start : start + chunk_size]
+            rows = self.db.execute(
+                "SELECT routespec, target, data FROM routes"
+                f" WHERE routespec IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            routes.update(self._records(rows))
+        return routes
+
+    @run_on_executor
+    def get_all(self):
+        return self._records(
+            self.db.execute("SELECT routespec, target, data FROM routes")
+        )
+
+
+class RouteIndex:
+    """In-memory secondary indexes of routes
+
+    Routes are indexed by the hostname of their target (field `target_host`),
+    and by the value of chosen keys of their data (fields `data.<key>`).
+    Only scalar values are indexed.
+    Values are compared as strings, the way key-value stores store them,
+    so that e.g. `1` and `"1"` are the same value.
+    """
+
+    def __init__(self, data_keys=()):
+        self.data_keys = list(data_keys)
+        # (field, value): routespecs
+        self._index = defaultdict(set)
+        # routespec: indexed (field, value) pairs, for removal
+        self._entries = {}
+        self.loaded = False
+
+    @staticmethod
+    def _index_value(value):
+        """Normalize a value to a string, or None if it can't be indexed"""
+        if isinstance(value, str):
+            return value
+        if isinstance(value, bool):
+            return str(value).lower()
+        if isinstance(value, Number):
+            return str(value)
+        return None
+
+    def is_indexed(self, field):
+        if field == "target_host":
+            return True
+        prefix, _, key = field.partition(".")
+        return prefix == "data" and key in self.data_keys
+
+    def _fields(self, target, data):
+        """Yield the (field, value) pairs to index for a route"""
+        yield ("target_host", urlparse(target).hostname)
+        for key in self.data_keys:
+            value = self._index_value(data.get(key))
+            if value is not None:
+                yield (f"data.{key}", value)
+
+    def add(self, routespec, target, data):
+        """Index a route, replacing its previous entries"""
+        self.remove(routespec)
+        entries = tuple(self._fields(target, data or {}))
+        for entry in entries:
+            self._index[entry].add(routespec)
+        self._entries[routespec] = entries
+
+    def remove(self, routespec):
+        for entry in self._entries.pop(routespec, ()):
+            routespecs = self._index[entry]
+            routespecs.discard(routespec)
+            if not routespecs:
+                del self._index[entry]
+
+    def find(self, filters):
+        """Return the routespecs matching all indexed filters
+
+        Args:
+            filters (dict): values by field, for indexed fields only
+        """
+        result = None
+        # start from the smallest set
+        candidates = sorted(
+            (
+                self._index.get((field, self._index_value(value)), set())
+                for field, value in filters.items()
+            ),
+            key=len,
+        )
+        for routespecs in candidates:
+            result = set(routespecs) if result is None else result & routespecs
+            if not result:
+                break
+        return result or set()
+
+    def matches(self, route, filters):
+        """Whether a route record matches all filters
+
+        Scalar values are compared like indexed values.
+        Other values (e.g. dicts, lists, or missing) only match if they are equal.
+        """
+        for field, value in filters.items():
+            if field == "target_host":
+                actual = urlparse(route["target"]).hostname
+            else:
+                actual = (route.get("data") or {}).get(field.partition(".")[2])
+            actual_value = self._index_value(actual)
+            expected_value = self._index_value(value)
+            if actual_value is None or expected_value is None:
+                if actual != value:
+                    return False
+            elif actual_value != expected_value:
+                return False
+        return True
+
+
+route_stores = {
+    "provider": ProviderRouteStore,
+    "memory": MemoryRouteStore,
+    "sqlite": SQLiteRouteStore,
+}
@@ -0,0 +1,284 @@
+"""Split the routing table across several traefik instances
+
+Each shard is a complete :class:`TraefikProxy`,
+with its own traefik, entrypoints and provider
+(e.g. its own dynamic config file, or key-value root key),
+so each traefik only loads and reloads its own part of the routing table.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import asyncio
+import zlib
+from collections import defaultdict
+from functools import partial
+
+from jupyterhub.proxy import Proxy
+from traitlets import Dict, Enum, Integer, List, Type, default, validate
+
+from .proxy import TraefikProxy
+
+
+class TraefikShardedProxy(Proxy):
+    """JupyterHub Proxy implementation splitting routes across several traefik proxies
+
+    Each route is assigned to a shard by a stable hash,
+    and only written to the provider of that shard.
+    Reads are merged across shards.
+    Default routes (`/`, the fallback to the Hub) are written to every shard
+    that requests for them may reach.
+
+    Requests must reach the traefik of their route's shard.
+    This proxy doesn't route requests to shards itself:
+    something in front of the shards must, and agree on where each route is.
+
+    - With `shard_by = "host"` (default) and host routing
+      (`JupyterHub.subdomain_host`), all routes of a host are in one shard,
+      so DNS or a load balancer can send requests by host,
+      to the shard of `crc32(host) % len(shards)`, or of :attr:`shard_hosts`.
+      Routes without a host are written to every shard,
+      so without host routing, each shard has all routes.
+    - With `shard_by = "routespec"`, the front must find the route
+      of a request (its longest matching routespec, with a trailing slash)
+      and send it to the shard of `crc32(routespec) % len(shards)`,
+      e.g. from the first path segments of `/user/<name>/`.
+
+    :meth:`route_shards` tells where a route is.
+    """
+
+    shard_class = Type(
+        "jupyterhub_traefik_proxy.fileprovider.TraefikFileProviderProxy",
+        klass=TraefikProxy,
+        config=True,
+        help="""The TraefikProxy class of every shard.
+
+        Config of this class, e.g. `c.TraefikFileProviderProxy.traefik_api_password`,
+        applies to all shards.
+        """,
+    )
+
+    shards = List(
+        Dict(),
+        config=True,
+        help="""Trait values of each shard, overriding the config of :attr:`shard_class`.
+
+        Each shard needs its own entrypoints and provider, e.g.::
+
+            c.TraefikShardedProxy.shards = [
+                {
+                    "public_url": "http://10.0.0.1:8000",
+                    "traefik_api_url": "http://127.0.0.1:8099",
+                    "static_config_file": "traefik-0.toml",
+                    "dynamic_config_file": "rules-0.toml",
+                },
+                {
+                    "public_url": "http://10.0.0.2:8000",
+                    "traefik_api_url": "http://127.0.0.1:8199",
+                    "static_config_file": "traefik-1.toml",
+                    "dynamic_config_file": "rules-1.toml",
+                },
+            ]
+
+        Key-value store shards need distinct `kv_traefik_prefix` and `kv_jupyterhub_prefix`.
+        The number of shards must not change while routes are stored,
+        or routes would be looked up in the wrong shard.
+        """,
+    )
+
+    @validate("shards")
+    def _validate_shards(self, proposal):
+        if not proposal.value:
+            raise ValueError("TraefikShardedProxy.shards needs at least one shard")
+        return proposal.value
+
+    shard_by = Enum(
+        ["routespec", "host"],
+        "host",
+        config=True,
+        help="""What to hash to assign a route to a shard.
+
+        - host (default): the host of host-based routes,
+          so that all routes of a host are in the same shard,
+          and DNS or a load balancer can send requests by host.
+          Routes without a host are written to every shard.
+        - routespec: the whole routespec, for the most even split,
+          also without host routing.
+          The load balancer in front of the shards must send each request
+          to the shard of its route's hash (see :class:`TraefikShardedProxy`).
+        """,
+    )
+
+    shard_hosts = Dict(
+        value_trait=Integer(),
+        config=True,
+        help="""Shard index by host, for host-based routes, instead of the hash.""",
+    )
+
+    shard_proxies = List(help="""The TraefikProxy of each shard""")
+
+    @default("shard_proxies")
+    def _default_shard_proxies(self):
+        proxies = []
+        for index, shard in enumerate(self.shards):
+            kwargs = dict(
+                parent=self,
+                log=self.log,
+                db_factory=self.db_factory,
+                app=self.app,
+                hub=self.hub,
+                host_routing=self.host_routing,
+                ssl_cert=self.ssl_cert,
+                ssl_key=self.ssl_key,
+                should_start=self.should_start,
+                extra_routes=self.extra_routes,
+            )
+            if self.public_url:
+                kwargs["public_url"] = self.public_url
+            kwargs.update(shard)
+            proxy = self.shard_class(**kwargs)
+            # only preload the Hub's routes of this shard
+            proxy._owns_route = partial(self._shard_owns_route, index)
+            proxies.append(proxy)
+        return proxies
+
+    def validate_routespec(self, routespec):
+        """Like TraefikProxy, only add the trailing slash"""
+        if not routespec.endswith("/"):
+            routespec = routespec + "/"
+        return routespec
+
+    def _hash(self, key):
+        # a stable hash, unlike hash()
+        return zlib.crc32(key.encode("utf8")) % len(self.shards)
+
+    def route_shards(self, routespec):
+        """Return the indices of the shards a route is written to
+
+        A single shard, except for the default routes
+        that requests may reach on every shard.
+        Requests for the route must be sent to one of these shards:
+        `crc32(host) % len(shards)` with `shard_by = "host"`,
+        or `crc32(routespec) % len(shards)` with `shard_by = "routespec"`,
+        unless the host is in :attr:`shard_hosts`.
+        """
+        routespec = self.validate_routespec(routespec)
+        host, _, path = routespec.partition("/")
+        if host in self.shard_hosts:
+            return [self.shard_hosts[host]]
+        if self.shard_by == "host":
+            return [self._hash(host)] if host else list(range(len(self.shards)))
+        if not path:
+            # the fallback of every traefik
+            return list(range(len(self.shards)))
+        return [self._hash(routespec)]
+
+    def _shard_owns_route(self, index, routespec):
+        return index in self.route_shards(routespec)
+
+    def _group_by_shard(self, routespecs):
+        """Return lists of routespecs by shard index"""
+        groups = defaultdict(list)
+        for routespec in routespecs:
+            for index in self.route_shards(routespec):
+                groups[index].append(routespec)
+        return groups
+
+    async def start(self):
+        if self.shard_by == "host" and not self.host_routing:
+            self.log.warning(
+                "TraefikShardedProxy.shard_by = 'host' without host routing"
+                " writes every route to every shard."
+                " Use host routing, or shard_by = 'routespec'"
+                " with a load balancer sending requests to their route's shard."
+            )
+        await asyncio.gather(*(proxy.start() for proxy in self.shard_proxies))
+
+    async def stop(self):
+        await asyncio.gather(*(proxy.stop() for proxy in self.shard_proxies))
+
+    async def add_route(self, routespec, target, data):
+        routespec = self.validate_routespec(routespec)
+        await asyncio.gather(
+            *(
+                self.shard_proxies[index].add_route(routespec, target, data)
+                for index in self.route_shards(routespec)
+            )
+        )
+
+    async def delete_route(self, routespec):
+        routespec = self.validate_routespec(routespec)
+        await asyncio.gather(
+            *(
+                self.shard_proxies[index].delete_route(routespec)
+                for index in self.route_shards(routespec)
+            )
+        )
+
+    async def delete_routes(self, routespecs):
+        """Delete several routes, with one :meth:`TraefikProxy.delete_routes` per shard
+
+        Returns:
+            results (dict): None, or the exception that prevented deleting the route
+                from one of its shards, by normalized routespec
+        """
+        routespecs = [self.validate_routespec(routespec) for routespec in routespecs]
+        groups = self._group_by_shard(routespecs)
+        results = dict.fromkeys(routespecs)
+        for shard_results in await asyncio.gather(
+            *(
+                self.shard_proxies[index].delete_routes(shard_routespecs)
+                for index, shard_routespecs in groups.items()
+            )
+        ):
+            for routespec, error in shard_results.items():
+                if error is not None:
+                    results[routespec] = error
+        return results
+
+    async def get_route(self, routespec):
+        routespec = self.validate_routespec(routespec)
+        index = self.route_shards(routespec)[0]
+        return await self.shard_proxies[index].get_route(routespec)
+
+    async def get_routes(self, routespecs):
+        """Return the route info for several routespecs, with one request per shard"""
+        routespecs = [self.validate_routespec(routespec) for routespec in routespecs]
+        groups = defaultdict(list)
+        for routespec in routespecs:
+            groups[self.route_shards(routespec)[0]].append(routespec)
+        routes = dict.fromkeys(routespecs)
+        for shard_routes in await asyncio.gather(
+            *(
+                self.shard_proxies[index].get_routes(shard_routespecs)
+                for index, shard_routespecs in groups.items()
+            )
+        ):
+            routes.update(shard_routes)
+        return routes
+
+    async def get_all_routes(self):
+        all_routes = {}
+        for shard_routes in await asyncio.gather(
+            *(proxy.get_all_routes() for proxy in self.shard_proxies)
+        ):
+            for routespec, route in shard_routes.items():
+                # routes in several shards are the same
+                all_routes.setdefault(routespec, route)
+        return all_routes
+
+    async def find_routes(self, target_host=None, **data):
+        """Find routes by target host and/or values in their data, in all shards
+
+        See :meth:`TraefikProxy.find_routes`.
+        """
+        found = {}
+        for shard_routes in await asyncio.gather(
+            *(
+                proxy.find_routes(target_host=target_host, **data)
+                for proxy in self.shard_proxies
+            )
+        ):
+            for routespec, route in shard_routes.items():
+                found.setdefault(routespec, route)
+        return found
@@ -1,6 +1,8 @@
+import asyncio
 import os
 import string
 from contextlib import contextmanager
+from functools import wraps
 from tempfile import NamedTemporaryFile
 from urllib.parse import unquote
 
@@ -47,6 +49,13 @@ def generate_alias(routespec, kind=""):
     return alias
 
 
+def routespec_from_alias(alias, kind=""):
+    """The routespec of an alias from :func:`generate_alias`"""
+    if kind:
+        alias = alias[len(kind) + 1 :]
+    return escapism.unescape(alias)
+
+
 # atomic writing adapted from jupyter/notebook 5.7
 # unlike atomic writing there, which writes the canonical path
 # and only use the temp file for recovery,
@@ -133,3 +142,172 @@ def deep_merge(a, b):
         else:
             a[k] = v
     return a
+
+
+def coalesce(ttl=None, max_entries=1024):
+    """Decorator coalescing calls to an async method
+
+    Concurrent calls with the same arguments on the same instance
+    share a single outstanding call, instead of queuing
+    or letting requests pile up.
+
+    If `ttl` is given, it is the name of an attribute of the instance,
+    holding a number of seconds for which a successful result
+    is reused by later calls with the same arguments.
+    Failures are never reused.
+    Expired results are dropped, and at most `max_entries` calls and results
+    are kept per instance, dropping the oldest first.
+
+    Results are shared between callers, and must not be modified.
+    Use :func:`clear_coalesced` to drop outstanding calls and reused results,
+    e.g. after a write.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        async def coalesced(self, *args, **kwargs):
+            entries = self.__dict__.setdefault("_coalesced", {})
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            loop = asyncio.get_running_loop()
+            entry = entries.get(key)
+            if entry is not None:
+                f, expires = entry
+                if not f.done() or loop.time() < expires:
+                    # shield, so a cancelled caller doesn't cancel the others
+                    return await asyncio.shield(f)
+                del entries[key]
+
+            if len(entries) >= max_entries:
+                now = loop.time()
+                for old_key, (old_f, expires) in list(entries.items()):
+                    if old_f.done() and now >= expires:
+                        del entries[old_key]
+                # still full: drop the oldest, in-progress calls still complete
+                excess = len(entries) - max_entries + 1
+                for old_key in list(entries)[: max(excess, 0)]:
+                    del entries[old_key]
+
+            f = asyncio.ensure_future(method(self, *args, **kwargs))
+            entries[key] = (f, float("inf"))
+
+            def done(f):
+                if entries.get(key, (None,))[0] is not f:
+                    # cleared while in progress
+                    return
+                seconds = getattr(self, ttl) if ttl else 0
+                if f.cancelled() or f.exception() is not None or not seconds:
+                    del entries[key]
+                else:
+                    entries[key] = (f, loop.time() + seconds)
+
+            f.add_done_callback(done)
+            return await asyncio.shield(f)
+
+        return coalesced
+
+    return decorator
+
+
+def clear_coalesced(obj):
+    """Forget all outstanding calls and results of :func:`coalesce` methods of obj
+
+    Calls in progress still complete for their callers,
+    but their results are not reused.
+    """
+    obj.__dict__.get("_coalesced", {}).clear()
+
+
+def listening_ports(pid):
+    """Return the set of TCP ports a process is listening on
+
+    Reads /proc, so returns None where it is not available (not linux).
+    """
+    try:
+        fds = os.listdir(f"/proc/{pid}/fd")
+    except FileNotFoundError:
+        return None if not os.path.isdir("/proc/self") else set()
+    inodes = set()
+    for fd in fds:
+        try:
+            link = os.readlink(f"/proc/{pid}/fd/{fd}")
+        except OSError:
+            # closed since listed
+            continue
+        if link.startswith("socket:["):
+            inodes.add(link[len("socket:[") : -1])
+
+    ports = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                lines = f.readlines()[1:]
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            fields = line.split()
+            local_address, state, inode = fields[1], fields[3], fields[9]
+            # 0A: LISTEN
+            if state == "0A" and inode in inodes:
+                ports.add(int(local_address.rsplit(":", 1)[1], 16))
+    return ports
+
+
+def router_metrics(texts):
+    """Aggregate traefik's per-router prometheus metrics
+
+    texts: the prometheus text exposition of each traefik (replica),
+    with router labels (`addRoutersLabels`).
+
+    Returns a dict by traefik router name, with the total `requests`,
+    and the cumulative `duration_buckets` of request durations: a sorted list
+    of (upper bound in seconds, number of requests), summed over status codes,
+    methods and replicas.
+    """
+    from prometheus_client.parser import text_string_to_metric_families
+
+    routers = {}
+    for text in texts:
+        for family in text_string_to_metric_families(text):
+            for sample in family.samples:
+                router = sample.labels.get("router")
+                if router is None:
+                    continue
+                metrics = routers.setdefault(
+                    router, {"requests": 0, "duration_buckets": {}}
+                )
+                if sample.name == "traefik_router_requests_total":
+                    metrics["requests"] += sample.value
+                elif sample.name == "traefik_router_request_duration_seconds_bucket":
+                    le = float(sample.labels["le"])
+                    buckets = metrics["duration_buckets"]
+                    buckets[le] = buckets.get(le, 0) + sample.value
+    for metrics in routers.values():
+        metrics["duration_buckets"] = sorted(metrics["duration_buckets"].items())
+    return routers
+
+
+def histogram_quantile(q, buckets):
+    """Estimate the q-quantile of a prometheus histogram
+
+    buckets: a sorted list of (upper bound, cumulative count), ending with +Inf.
+
+    Interpolates linearly within the bucket of the quantile,
+    like prometheus' histogram_quantile.
+    Returns None if the histogram is empty.
+    """
+    if not buckets or not buckets[-1][1]:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if upper_bound == float("inf"):
+                # can't interpolate, return the highest finite bound
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (
+                count - lower_count
+            )
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
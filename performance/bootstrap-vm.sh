@@ -1,7 +1,7 @@
 #!/bin/bash
 set -exuo pipefail
 # script to setup a VM to prepare for running benchmarks
-# installs python, this package, etcd, consul, traefik, chp
+# installs python, this package, etcd, consul, redis, traefik, chp
 
 # gcloud compute instances create proxy-bench \
     # --project=binderhub-288415 \
@@ -16,7 +16,7 @@ set -exuo pipefail
     # --create-disk=auto-delete=yes,boot=yes,device-name=proxy-bench,image=projects/ubuntu-os-cloud/global/images/ubuntu-2204-jammy-v20230302,mode=rw,size=10,type=projects/binderhub-288415/zones/us-central1-a/diskTypes/pd-balanced
 
 apt update
-apt -y install etcd python3 python3-pip nodejs npm
+apt -y install etcd redis-server python3 python3-pip nodejs npm
 npm install --global configurable-http-proxy
 python3 -m pip install -e .. -r requirements.txt
 
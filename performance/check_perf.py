@@ -131,8 +131,9 @@ async def measure_methods_performance(
     proxy_class,
     routes,
     stdout_print=True,
+    proxy_kwargs=None,
 ):
-    async with perf_utils.get_proxy(proxy_class) as proxy:
+    async with perf_utils.get_proxy(proxy_class, **(proxy_kwargs or {})) as proxy:
         run = partial(
             run_methods_concurrent,
             concurrency=concurrency,
@@ -178,6 +179,7 @@ async def measure_proxy_throughput(
     request_size,
     backend_port,
     stdout_print=True,
+    proxy_kwargs=None,
 ):
     """
     Makes 'total_requests' GET http/websocket requests
@@ -187,7 +189,7 @@ async def measure_proxy_throughput(
     """
     pool = ProcessPoolExecutor(concurrent_no)
 
-    async with perf_utils.get_proxy(proxy_class) as proxy:
+    async with perf_utils.get_proxy(proxy_class, **(proxy_kwargs or {})) as proxy:
         routespec = "/some_routespec/"
         target = "http://127.0.0.1:" + str(backend_port)
         data = {"test": "test1", "user": "username"}
@@ -235,8 +237,16 @@ async def main():
     total_requests = int(args.total_requests)
     csv_filename = args.csv_filename
     test_iterations = int(args.test_iterations)
+    replicas = int(args.replicas)
     print(args)
 
+    proxy_kwargs = {}
+    # results with several traefik replicas are stored as another proxy
+    proxy_label = proxy_class
+    if replicas > 1:
+        proxy_kwargs["traefik_replicas"] = replicas
+        proxy_label = f"{proxy_class}x{replicas}"
+
     loop = asyncio.get_running_loop()
     if not csv:
         loop.set_debug(True)  # Enable debug if we're just printing the results
@@ -248,14 +258,14 @@ async def main():
                 f"Starting {metric} {concurrency=} measurement number {i} for {proxy_class} ...\n"
             )
             results[i] = await measure_methods_performance(
-                concurrency, proxy_class, routes, csv_filename is None
+                concurrency, proxy_class, routes, csv_filename is None, proxy_kwargs
             )
 
         if csv_filename:
             with open(csv_filename, mode="a+") as csv_file:
                 samples = perf_utils.logspace_samples(routes)
                 const_fields = {
-                    "proxy": proxy_class,
+                    "proxy": proxy_label,
                     "concurrency": concurrency,
                     "total_routes": routes,
                 }
@@ -295,6 +305,7 @@ async def main():
                     size,
                     backend_port,
                     not csv_filename,
+                    proxy_kwargs,
                 )
 
             print(f"Request throughput {size} {kind} requests: {results}")
@@ -306,7 +317,7 @@ async def main():
                     "throughput",
                 ]
                 const_fields = {
-                    "proxy": proxy_class,
+                    "proxy": proxy_label,
                     "kind": kind,
                     "size": size,
                     "total_requests": total_requests,
@@ -0,0 +1,121 @@
+"""Import time of the proxy modules, measured with `python -X importtime`
+
+Each module is imported in a fresh interpreter.
+JupyterHub's own import time (jupyterhub.proxy, the base class) is reported separately,
+since we can't avoid it.
+Client libraries of the providers (etcd3/grpc, consul, redis, passlib, toml, ruamel.yaml)
+and tornado's http client are only imported on first use,
+and are listed if they are imported anyway.
+
+Usage:
+
+    python3 import_time.py
+    python3 import_time.py jupyterhub_traefik_proxy.etcd --runs 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+proxy_modules = [
+    "jupyterhub_traefik_proxy.proxy",
+    "jupyterhub_traefik_proxy.fileprovider",
+    "jupyterhub_traefik_proxy.etcd",
+    "jupyterhub_traefik_proxy.consul",
+    "jupyterhub_traefik_proxy.redis",
+    "jupyterhub_traefik_proxy.memory",
+    "jupyterhub_traefik_proxy.sharded",
+]
+
+# imported on first use, not when the proxy classes are imported
+deferred_modules = [
+    "etcd3",
+    "grpc",
+    "consul",
+    "redis",
+    "passlib",
+    "toml",
+    "ruamel",
+    "tornado.httpclient",
+]
+
+
+def import_times(module):
+    """Import `module` in a new interpreter
+
+    Returns a dict of (self, cumulative) import time in seconds, by imported module name.
+    """
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return times
+
+
+def own_time(times):
+    """Total self import time of jupyterhub_traefik_proxy's modules"""
+    return sum(
+        self_time
+        for name, (self_time, _) in times.items()
+        if name.split(".")[0] == "jupyterhub_traefik_proxy"
+    )
+
+
+def deferred_imports(times):
+    """Return the deferred modules that were imported"""
+    return sorted(
+        name
+        for name in times
+        if any(
+            name == deferred or name.startswith(deferred + ".")
+            for deferred in deferred_modules
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        default=proxy_modules,
+        help="The modules to import",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="The number of imports of each module (the median is reported)",
+    )
+    args = parser.parse_args()
+
+    print(f"{'module':40} {'total':>9} {'jupyterhub':>11} {'own':>9}")
+    for module in args.modules:
+        totals = []
+        hub = []
+        own = []
+        for _ in range(args.runs):
+            times = import_times(module)
+            totals.append(sum(self_time for self_time, _ in times.values()))
+            hub.append(times.get("jupyterhub.proxy", (0, 0))[1])
+            own.append(own_time(times))
+        print(
+            f"{module:40} {statistics.median(totals):8.3f}s"
+            f" {statistics.median(hub):10.3f}s {statistics.median(own):8.3f}s"
+        )
+        imported = deferred_imports(times)
+        if imported:
+            print(f"  imported on import: {', '.join(imported)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Microbenchmark of TKvProxy's translation between route configs and flat key/value pairs
+
+This measures only the Python cost of the KV layer,
+without running traefik or any key-value store.
+
+Usage:
+
+    python3 kv_microbench.py --routes 100000
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+
+from jupyterhub_traefik_proxy.kv_proxy import TKvProxy
+
+
+@contextmanager
+def measure_time(message, routes):
+    real_time = time.perf_counter()
+    cpu_time = time.process_time()
+    yield
+    real_time = time.perf_counter() - real_time
+    cpu_time = time.process_time() - cpu_time
+    print(
+        f"{message:40} CPU {cpu_time:7.3f} s  REAL {real_time:7.3f} s"
+        f"  ({1e6 * real_time / routes:6.2f} µs/route)"
+    )
+
+
+def route_args(routes):
+    target = "http://127.0.0.1:9000"
+    for i in range(routes):
+        yield f"/user/user-{i}/", target, {"user": f"user-{i}", "server_name": ""}
+
+
+def bench_flatten(proxy, routes):
+    with measure_time("flatten _dynamic_config_for_route", routes):
+        for routespec, target, data in route_args(routes):
+            traefik_config, jupyterhub_config = proxy._dynamic_config_for_route(
+                routespec, target, data
+            )
+            proxy.flatten_dict_for_kv(traefik_config, prefix=proxy.kv_traefik_prefix)
+            proxy._flatten_jupyterhub_config(jupyterhub_config)
+
+    to_set = {}
+    with measure_time("_flat_config_for_route (template)", routes):
+        for routespec, target, data in route_args(routes):
+            to_set.update(proxy._flat_config_for_route(routespec, target, data))
+    return to_set
+
+
+def bench_unflatten(proxy, routes, to_set):
+    kv_list = list(to_set.items())
+    with measure_time("unflatten jupyterhub routes", routes):
+        proxy.unflatten_dict_from_kv(kv_list, root_key=proxy.kv_jupyterhub_prefix)
+    with measure_time("unflatten everything", routes):
+        proxy.unflatten_dict_from_kv(kv_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--routes",
+        type=int,
+        default=100_000,
+        help="Number of routes to flatten and unflatten (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    for kv_jupyterhub_format in ("flat", "json"):
+        proxy = TKvProxy(kv_jupyterhub_format=kv_jupyterhub_format)
+        print(f"\n{args.routes} routes, kv_jupyterhub_format={kv_jupyterhub_format!r}")
+        to_set = bench_flatten(proxy, args.routes)
+        print(f"{len(to_set)} keys")
+        bench_unflatten(proxy, args.routes, to_set)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,8 @@ from jupyterhub.utils import wait_for_http_server
 from jupyterhub_traefik_proxy.consul import TraefikConsulProxy
 from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
 from jupyterhub_traefik_proxy.fileprovider import TraefikFileProviderProxy
+from jupyterhub_traefik_proxy.memory import TraefikMemoryProxy
+from jupyterhub_traefik_proxy.redis import TraefikRedisProxy
 
 aiohttp.TCPConnector.__init__.__kwdefaults__['limit'] = 10
 
@@ -79,6 +81,8 @@ def configure_argument_parser():
             - file
             - etcd
             - consul
+            - redis
+            - memory (in-process store, no key-value store cost)
             - chp
             If no proxy is provided, it defaults to:
             --- %(default)s ---
@@ -127,6 +131,20 @@ def configure_argument_parser():
         ),
     )
 
+    parser.add_argument(
+        "--replicas",
+        dest="replicas",
+        default=1,
+        help=textwrap.dedent(
+            """\
+            Number of traefik processes (TraefikProxy.traefik_replicas),
+            sharing the public port. Not supported with chp.
+            If no number is provided, it defaults to:
+            --- %(default)s ---
+            """
+        ),
+    )
+
     parser.add_argument(
         "--iterations",
         dest="test_iterations",
@@ -186,6 +204,22 @@ def consul():
                 print(f"Error stopping {p}: {e}", file=sys.stderr)
 
 
+@contextmanager
+def redis():
+    """Context manager for running redis"""
+    with TemporaryDirectory() as td:
+        p = Popen(['redis-server', '--save', '', '--appendonly', 'no'], cwd=td)
+        # wait for it to start
+        time.sleep(2)
+        try:
+            yield
+        finally:
+            try:
+                p.terminate()
+            except Exception as e:
+                print(f"Error stopping {p}: {e}", file=sys.stderr)
+
+
 @asynccontextmanager
 async def backend(concurrency=4):
     port = 9000
@@ -230,7 +264,7 @@ def measure_time(print_message, stdout_print, time_taken):
     time_taken["real"] = real_time
 
 
-async def no_auth_consul_proxy():
+async def no_auth_consul_proxy(**kwargs):
     """
     Function returning a configured TraefikEtcdProxy.
     No etcd authentication.
@@ -242,12 +276,13 @@ async def no_auth_consul_proxy():
         traefik_api_username="admin",
         should_start=True,
         # traefik_log_level="DEBUG",
+        **kwargs,
     )
     await proxy.start()
     return proxy
 
 
-async def no_auth_etcd_proxy():
+async def no_auth_etcd_proxy(**kwargs):
     """
     Function returning a configured TraefikEtcdProxy.
     No etcd authentication.
@@ -257,12 +292,47 @@ async def no_auth_etcd_proxy():
         traefik_api_password="admin",
         traefik_api_username="admin",
         should_start=True,
+        **kwargs,
+    )
+    await proxy.start()
+    return proxy
+
+
+async def no_auth_redis_proxy(**kwargs):
+    """
+    Function returning a configured TraefikRedisProxy.
+    No redis authentication.
+    """
+    proxy = TraefikRedisProxy(
+        public_url="http://127.0.0.1:8000",
+        traefik_api_password="admin",
+        traefik_api_username="admin",
+        should_start=True,
+        **kwargs,
+    )
+    await proxy.start()
+    return proxy
+
+
+async def memory_proxy(**kwargs):
+    """
+    Function returning a configured TraefikMemoryProxy.
+
+    Measures the cost of the TKvProxy layer itself,
+    without the network and storage cost of a real key-value store.
+    """
+    proxy = TraefikMemoryProxy(
+        public_url="http://127.0.0.1:8000",
+        traefik_api_password="admin",
+        traefik_api_username="admin",
+        should_start=True,
+        **kwargs,
     )
     await proxy.start()
     return proxy
 
 
-async def file_proxy():
+async def file_proxy(**kwargs):
     """Function returning a configured TraefikFileProviderProxy"""
     proxy = TraefikFileProviderProxy(
         public_url="http://127.0.0.1:8000",
@@ -270,6 +340,7 @@ async def file_proxy():
         traefik_api_username="admin",
         should_start=True,
         # traefik_log_level="DEBUG",
+        **kwargs,
     )
 
     await proxy.start()
@@ -295,7 +366,7 @@ async def configurable_http_proxy():
 
 
 @asynccontextmanager
-async def get_proxy(proxy_class):
+async def get_proxy(proxy_class, **proxy_kwargs):
     logging.basicConfig(level=logging.INFO)
     parent_context = nullcontext
     if proxy_class == "file":
@@ -306,14 +377,21 @@ async def get_proxy(proxy_class):
     elif proxy_class == "consul":
         proxy_f = no_auth_consul_proxy
         parent_context = consul
+    elif proxy_class == "redis":
+        proxy_f = no_auth_redis_proxy
+        parent_context = redis
+    elif proxy_class == "memory":
+        proxy_f = memory_proxy
     elif proxy_class == "chp":
+        if proxy_kwargs:
+            raise ValueError(f"chp doesn't support {', '.join(proxy_kwargs)}")
         proxy_f = configurable_http_proxy
     else:
         raise ValueError(f"Proxy {proxy_class} not supported")
         return
 
     with parent_context():
-        proxy = await proxy_f()
+        proxy = await proxy_f(**proxy_kwargs)
         try:
             yield proxy
         finally:
@@ -9,7 +9,7 @@ export PYTHONPATH="$PWD/.."
 iterations=${iterations:-3}
 routes=${routes:-500}
 
-proxies="${proxies:-chp file etcd consul}"
+proxies="${proxies:-chp file etcd consul redis}"
 # add/remove route API performance
 for proxy in $proxies; do
   for concurrency in 1 10 20 50; do
@@ -29,3 +29,11 @@ for metric in http_throughput_small http_throughput_large ws_throughput_small ws
     done
   done
 done
+
+# Throughput with several traefik replicas sharing the public port (traefik >= 3.1)
+for replicas in ${replicas:-1 2 4}; do
+  for metric in http_throughput_small ws_throughput_small; do
+    sleep 5
+    python3 check_perf.py $metric --proxy=file --replicas=$replicas --iterations=$iterations --concurrency=50 --output=./results/file-replicas-${metric}.csv
+  done
+done
@@ -45,6 +45,9 @@ setup(
             "traefik_consul = jupyterhub_traefik_proxy.consul:TraefikConsulProxy",
             "traefik_etcd = jupyterhub_traefik_proxy.etcd:TraefikEtcdProxy",
             "traefik_file = jupyterhub_traefik_proxy.fileprovider:TraefikFileProviderProxy",
+            "traefik_memory = jupyterhub_traefik_proxy.memory:TraefikMemoryProxy",
+            "traefik_redis = jupyterhub_traefik_proxy.redis:TraefikRedisProxy",
+            "traefik_sharded = jupyterhub_traefik_proxy.sharded:TraefikShardedProxy",
             "traefik_toml = jupyterhub_traefik_proxy.toml:TraefikTomlProxy",
         ]
     },
@@ -19,6 +19,8 @@ from traitlets.log import get_logger
 from jupyterhub_traefik_proxy.consul import TraefikConsulProxy
 from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
 from jupyterhub_traefik_proxy.fileprovider import TraefikFileProviderProxy
+from jupyterhub_traefik_proxy.memory import TraefikMemoryProxy
+from jupyterhub_traefik_proxy.redis import TraefikRedisProxy
 
 HERE = Path(__file__).parent.resolve()
 config_files = os.path.join(HERE, "config_files")
@@ -46,6 +48,9 @@ class Config:
     consul_port = 8500
     consul_auth_port = 8501
 
+    # Redis port
+    redis_port = 6379
+
     # Traefik api auth login credentials
     traefik_api_user = "api_admin"
     traefik_api_pass = "admin"
@@ -154,6 +159,42 @@ async def auth_etcd_proxy(launch_etcd_auth):
     await proxy.stop()
 
 
+@pytest.fixture
+async def redis_proxy(launch_redis):
+    """
+    Fixture returning a configured TraefikRedisProxy.
+    No redis authentication.
+    """
+    proxy = TraefikRedisProxy(
+        public_url=Config.public_url,
+        redis_url=f"redis://127.0.0.1:{Config.redis_port}",
+        traefik_api_password=Config.traefik_api_pass,
+        traefik_api_username=Config.traefik_api_user,
+        check_route_timeout=45,
+        should_start=True,
+        traefik_log_level="DEBUG",
+    )
+    await proxy.start()
+    yield proxy
+    await proxy.stop()
+
+
+@pytest.fixture
+async def memory_proxy():
+    """Fixture returning a configured TraefikMemoryProxy"""
+    proxy = TraefikMemoryProxy(
+        public_url=Config.public_url,
+        traefik_api_password=Config.traefik_api_pass,
+        traefik_api_username=Config.traefik_api_user,
+        check_route_timeout=45,
+        should_start=True,
+        traefik_log_level="DEBUG",
+    )
+    await proxy.start()
+    yield proxy
+    await proxy.stop()
+
+
 def _make_etcd_proxy(auth=False, **extra_kwargs):
     kwargs = dict(
         public_url=Config.public_url,
@@ -205,6 +246,21 @@ async def file_proxy_toml(dynamic_config_dir):
     await proxy.stop()
 
 
+@pytest.fixture
+async def file_proxy_ping(dynamic_config_dir):
+    """Fixture returning a TraefikFileProviderProxy waiting for traefik with ping"""
+    dynamic_config_file = str(dynamic_config_dir / "rules.toml")
+    proxy = _file_proxy(
+        dynamic_config_file,
+        static_config_file="traefik.toml",
+        should_start=True,
+        traefik_ping=True,
+    )
+    await proxy.start()
+    yield proxy
+    await proxy.stop()
+
+
 @pytest.fixture
 async def file_proxy_yaml(dynamic_config_dir):
     dynamic_config_file = str(dynamic_config_dir / "rules.yaml")
@@ -217,6 +273,25 @@ async def file_proxy_yaml(dynamic_config_dir):
     await proxy.stop()
 
 
+@pytest.fixture
+def file_proxy_factory(dynamic_config_dir):
+    """Fixture returning a function to make file proxies started by the Hub
+
+    For tests starting and stopping proxies themselves
+    """
+    dynamic_config_file = str(dynamic_config_dir / "rules.toml")
+
+    def make_proxy(**kwargs):
+        return _file_proxy(
+            dynamic_config_file,
+            static_config_file="traefik.toml",
+            should_start=True,
+            **kwargs,
+        )
+
+    return make_proxy
+
+
 def _file_proxy(dynamic_config_file, **kwargs):
     return TraefikFileProviderProxy(
         public_url=Config.public_url,
@@ -297,12 +372,15 @@ async def auth_external_etcd_proxy(
         "auth_etcd_proxy",
         "file_proxy_toml",
         "file_proxy_yaml",
+        "file_proxy_ping",
         "external_consul_proxy",
         "auth_external_consul_proxy",
         "external_etcd_proxy",
         "auth_external_etcd_proxy",
         "external_file_proxy_toml",
         "external_file_proxy_yaml",
+        "redis_proxy",
+        "memory_proxy",
     ]
 )
 def proxy(request):
@@ -636,6 +714,51 @@ def _config_consul(secret=None, port=8500):
             time.sleep(3)
 
 
+# Redis Launchers #
+###################
+
+
+@pytest.fixture
+async def launch_redis():
+    with TemporaryDirectory() as redis_path:
+        redis_proc = subprocess.Popen(
+            [
+                "redis-server",
+                "--port",
+                str(Config.redis_port),
+                # no persistence, every test starts empty
+                "--save",
+                "",
+                "--appendonly",
+                "no",
+            ],
+            cwd=redis_path,
+        )
+        try:
+            await _wait_for_redis(port=Config.redis_port)
+            yield redis_proc
+        finally:
+            terminate_process(redis_proc)
+
+
+async def _wait_for_redis(port):
+    """Make sure redis accepts connections before running tests against it"""
+    from redis.asyncio import Redis
+
+    async def _check_redis():
+        client = Redis(port=port)
+        try:
+            await client.ping()
+        except Exception as e:
+            print(f"Redis not up: {e}")
+            return False
+        finally:
+            await client.aclose()
+        return True
+
+    await exponential_backoff(_check_redis, "Redis not available", timeout=10)
+
+
 #########################################################################
 # Teardown functions                                                    #
 #########################################################################
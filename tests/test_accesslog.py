@@ -0,0 +1,89 @@
+"""Tests for aggregating traefik's access log"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from jupyterhub_traefik_proxy import traefik_utils
+from jupyterhub_traefik_proxy.accesslog import AccessLogStats, follow_access_log
+
+
+def _entry(routespec, duration=0.01, status=200, provider="file"):
+    router = traefik_utils.generate_alias(routespec, "router") + "@" + provider
+    return {
+        "RouterName": router,
+        "Duration": int(duration * 1e9),
+        "DownstreamStatus": status,
+    }
+
+
+def test_access_log_stats():
+    stats = AccessLogStats("file", buckets=[0.1, 1], max_routes=2)
+    for i in range(10):
+        stats.add(_entry("/user/a/", duration=0.05))
+    stats.add(_entry("/user/a/", duration=2, status=502))
+    stats.add(_entry("/user/b/", duration=0.5))
+    # beyond max_routes
+    stats.add(_entry("/user/c/"))
+    stats.add(_entry("/user/d/"))
+    # not a route
+    stats.add({"RouterName": "route_api@file", "Duration": 1})
+    stats.add(_entry("/user/a/", provider="http"))
+    stats.add_line("not json")
+
+    summary = stats.summary()
+    assert sorted(summary, key=str) == sorted(["/user/a/", "/user/b/", None], key=str)
+    a = summary["/user/a/"]
+    assert a["requests"] == 11
+    assert a["status"] == {"2xx": 10, "5xx": 1}
+    assert a["duration_quantiles"][0.5] < 0.1
+    assert a["duration_quantiles"][0.99] == 1
+    assert summary[None]["requests"] == 2
+    assert stats.skipped == 3
+
+    stats.reset()
+    assert stats.summary() == {}
+
+
+async def test_follow_access_log(tmp_path):
+    path = tmp_path / "access.log"
+    stats = AccessLogStats("file", buckets=[0.1])
+
+    def write(*entries, mode="a"):
+        with open(path, mode) as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    async def wait_requests(n):
+        for _ in range(100):
+            requests = sum(s["requests"] for s in stats.summary().values())
+            if requests >= n:
+                return requests
+            await asyncio.sleep(0.01)
+        return requests
+
+    task = asyncio.ensure_future(follow_access_log(str(path), stats, interval=0.01))
+    try:
+        await asyncio.sleep(0.05)
+        # the file is created after following it
+        write(_entry("/user/a/"))
+        assert await wait_requests(1) == 1
+        # partial lines are counted once complete
+        with open(path, "a") as f:
+            f.write(json.dumps(_entry("/user/a/"))[:10])
+        await asyncio.sleep(0.05)
+        with open(path, "a") as f:
+            f.write(json.dumps(_entry("/user/a/"))[10:] + "\n")
+        assert await wait_requests(2) == 2
+        # rotated
+        os.rename(path, tmp_path / "access.log.1")
+        write(_entry("/user/b/"), _entry("/user/b/"))
+        assert await wait_requests(4) == 4
+        assert stats.summary()["/user/b/"]["requests"] == 2
+        assert stats.skipped == 0
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
@@ -0,0 +1,26 @@
+"""Guard against regressions in the import time of the proxy modules"""
+
+import pytest
+
+from performance.import_time import deferred_imports, import_times, own_time
+
+# self import time of all jupyterhub_traefik_proxy modules,
+# with a lot of margin for slow CI machines
+own_import_budget = 0.5
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "jupyterhub_traefik_proxy.fileprovider",
+        "jupyterhub_traefik_proxy.etcd",
+        "jupyterhub_traefik_proxy.consul",
+        "jupyterhub_traefik_proxy.redis",
+        "jupyterhub_traefik_proxy.sharded",
+    ],
+)
+def test_import_time(module):
+    times = import_times(module)
+    assert module in times
+    assert deferred_imports(times) == []
+    assert own_time(times) < own_import_budget
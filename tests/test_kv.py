@@ -1,6 +1,24 @@
+import base64
+import json
+from types import SimpleNamespace
+from unittest.mock import Mock
+
 import pytest
+from jupyterhub.utils import random_port
+from tornado.httpclient import AsyncHTTPClient
+from traitlets.config import Config
 
+from jupyterhub_traefik_proxy import traefik_utils
 from jupyterhub_traefik_proxy.kv_proxy import TKvProxy
+from jupyterhub_traefik_proxy.memory import TraefikMemoryProxy
+from jupyterhub_traefik_proxy.routestore import RouteIndex
+
+
+class MemoryKvProxy(TraefikMemoryProxy):
+    """In-memory proxy that doesn't wait for traefik, for testing the KV layer"""
+
+    async def _wait_for_route(self, routespec):
+        pass
 
 
 @pytest.mark.parametrize(
@@ -35,6 +53,44 @@ def test_flatten_dict(orig, expected):
     assert flat == expected
 
 
+def test_flatten_dict_deep():
+    proxy = TKvProxy()
+    depth = 5000
+    orig = value = {}
+    for i in range(depth):
+        value["key"] = value = {}
+    value["key"] = "value"
+    flat = proxy.flatten_dict_for_kv(orig)
+    assert flat == {"/".join(["key"] * (depth + 1)): "value"}
+
+
+@pytest.mark.parametrize(
+    "proxy_kwargs",
+    [
+        {},
+        {"kv_jupyterhub_format": "json"},
+        {"public_url": "https://127.0.0.1:8443"},
+        {"public_url": "https://127.0.0.1:8443", "traefik_cert_resolver": "acme"},
+        {"kv_separator": ".", "kv_traefik_prefix": "tr", "kv_jupyterhub_prefix": "jh"},
+    ],
+)
+def test_flat_config_for_route(proxy_kwargs):
+    proxy = TKvProxy(**proxy_kwargs)
+    for routespec, data in [
+        ("/user/name/", {"user": "name", "server_name": ""}),
+        ("host.tld/user/other/", {"nested": {"list": [1, 2.5, True]}}),
+    ]:
+        target = "http://127.0.0.1:9000"
+        traefik_config, jupyterhub_config = proxy._dynamic_config_for_route(
+            routespec, target, data
+        )
+        expected = proxy.flatten_dict_for_kv(
+            traefik_config, prefix=proxy.kv_traefik_prefix
+        )
+        expected.update(proxy._flatten_jupyterhub_config(jupyterhub_config))
+        assert proxy._flat_config_for_route(routespec, target, data) == expected
+
+
 @pytest.mark.parametrize(
     "orig, expected",
     [
@@ -81,6 +137,21 @@ def test_flatten_dict_error(orig, expected):
             "key/deeper",
             {"anddeeper": "false"},
         ),
+        (
+            [("key/1", "b"), ("other/x", "y"), ("key/0", "a")],
+            "",
+            {"key": ["a", "b"], "other": {"x": "y"}},
+        ),
+        (
+            [("key/1/0", "c"), ("key/0/x", "a"), ("key/1/1", "d"), ("key/0/y", "b")],
+            "",
+            {"key": [{"x": "a", "y": "b"}, ["c", "d"]]},
+        ),
+        (
+            [("key/deeper/anddeeper", "false"), ("keys/deeper/x", "y")],
+            "key",
+            {"deeper": {"anddeeper": "false"}},
+        ),
     ],
 )
 def test_unflatten_dict(flat, root_key, expected):
@@ -96,9 +167,683 @@ def test_unflatten_dict(flat, root_key, expected):
             [("key/1", "value")],
             IndexError,
         ),
+        (
+            [("key/0", "a"), ("key/2", "c")],
+            IndexError,
+        ),
     ],
 )
 def test_unflatten_dict_error(flat, expected):
     proxy = TKvProxy()
     with pytest.raises(expected):
         proxy.unflatten_dict_from_kv(flat)
+
+
+def test_unflatten_dict_iterator():
+    proxy = TKvProxy()
+    kv_iter = ((f"root/routes/{i}/target", str(i)) for i in range(3))
+    assert proxy.unflatten_dict_from_kv(kv_iter, root_key="root/routes") == [
+        {"target": "0"},
+        {"target": "1"},
+        {"target": "2"},
+    ]
+
+
+def test_kv_tree_builder_pages():
+    proxy = TKvProxy()
+    builder = proxy._kv_tree_builder(root_key="root")
+    # pages may split a list and arrive out of order
+    builder.add([("root/a/1/x", "1"), ("root/b", "b")])
+    builder.add([("root/a/0/x", "0"), ("other/c", "c")])
+    assert builder.finish() == {"a": [{"x": "0"}, {"x": "1"}], "b": "b"}
+
+
+async def test_json_format():
+    proxy = MemoryKvProxy(kv_jupyterhub_format="json")
+    data = {"user": "username", "count": 1}
+    await proxy.add_route("/user/username/", "http://127.0.0.1:9000", data)
+    jupyterhub_keys = [
+        key for key in proxy._memory_values if key.startswith("jupyterhub/")
+    ]
+    assert jupyterhub_keys == ["jupyterhub/routes/router__2Fuser_2Fusername_2F"]
+    expected = {
+        "routespec": "/user/username/",
+        "target": "http://127.0.0.1:9000",
+        "data": data,
+    }
+    assert await proxy.get_route("/user/username/") == expected
+    assert await proxy.get_all_routes() == {"/user/username/": expected}
+    await proxy.delete_route("/user/username/")
+    assert await proxy.get_route("/user/username/") is None
+    assert not [key for key in proxy._memory_values if key.startswith("jupyterhub/")]
+
+
+@pytest.mark.parametrize("from_format, to_format", [("flat", "json"), ("json", "flat")])
+async def test_format_migration(from_format, to_format):
+    proxy = MemoryKvProxy(kv_jupyterhub_format=from_format)
+    routes = {}
+    for name in ("a", "b"):
+        routespec = f"/user/{name}/"
+        routes[routespec] = {
+            "routespec": routespec,
+            "target": "http://127.0.0.1:9000",
+            "data": {"user": name},
+        }
+        await proxy.add_route(routespec, "http://127.0.0.1:9000", {"user": name})
+
+    # reading the other format is transparent
+    proxy.kv_jupyterhub_format = to_format
+    assert await proxy.get_all_routes() == routes
+    assert await proxy.get_route("/user/a/") == routes["/user/a/"]
+
+    # migrated records are written as route keys (e.g. leased with etcd)
+    set_route_keys = proxy._kv_set_route_keys
+    route_keys = []
+
+    async def record_route_keys(to_set):
+        route_keys.extend(to_set)
+        await set_route_keys(to_set)
+
+    proxy._kv_set_route_keys = record_route_keys
+    await proxy._migrate_jupyterhub_routes()
+    assert route_keys and all(
+        key.startswith("jupyterhub/routes/") for key in route_keys
+    )
+    route_key = "jupyterhub/routes/router__2Fuser_2Fa_2F"
+    if to_format == "json":
+        assert json.loads(proxy._memory_values[route_key])["data"] == {"user": "a"}
+        assert not any(key.startswith(route_key + "/") for key in proxy._memory_values)
+    else:
+        assert route_key not in proxy._memory_values
+        assert proxy._memory_values[route_key + "/data/user"] == "a"
+    assert await proxy.get_all_routes() == routes
+
+
+async def test_get_routes():
+    proxy = MemoryKvProxy()
+    target = "http://127.0.0.1:9000"
+    await proxy.add_route("/user/flat/", target, {"user": "flat"})
+    proxy.kv_jupyterhub_format = "json"
+    await proxy.add_route("/user/json/", target, {"user": "json"})
+
+    routes = await proxy.get_routes(["/user/flat", "/user/json/", "/user/missing/"])
+    assert routes == {
+        "/user/flat/": {
+            "routespec": "/user/flat/",
+            "target": target,
+            "data": {"user": "flat"},
+        },
+        "/user/json/": {
+            "routespec": "/user/json/",
+            "target": target,
+            "data": {"user": "json"},
+        },
+        "/user/missing/": None,
+    }
+
+
+async def test_memory_failure_injection():
+    proxy = MemoryKvProxy(memory_failure_rate=1)
+    with pytest.raises(ConnectionError):
+        await proxy.add_route("/user/a/", "http://127.0.0.1:9000", {"user": "a"})
+    assert proxy._memory_values == {}
+    proxy.memory_failure_rate = 0
+    await proxy.add_route("/user/a/", "http://127.0.0.1:9000", {"user": "a"})
+    assert await proxy.get_route("/user/a/")
+
+
+async def test_memory_http_provider():
+    url = f"http://127.0.0.1:{random_port()}"
+    proxy = MemoryKvProxy(memory_http_url=url)
+    proxy._start_http_server()
+    try:
+        await proxy.add_route("/user/a/", "http://127.0.0.1:9000", {"user": "a"})
+        resp = await AsyncHTTPClient().fetch(url)
+        config = json.loads(resp.body)
+        service = config["http"]["services"]["service__2Fuser_2Fa_2F"]
+        assert service == {
+            "loadBalancer": {
+                "servers": [{"url": "http://127.0.0.1:9000"}],
+                "passHostHeader": True,
+            }
+        }
+        assert "jupyterhub" not in config
+    finally:
+        proxy._http_server.stop()
+
+
+async def test_read_cache_ttl():
+    proxy = MemoryKvProxy(kv_read_cache_ttl=60)
+    target = "http://127.0.0.1:9000"
+    await proxy.add_route("/user/a/", target, {"user": "a"})
+    routes = await proxy.get_all_routes()
+    assert list(routes) == ["/user/a/"]
+    route = await proxy.get_route("/user/a/")
+    # reads are reused...
+    proxy._memory_values.clear()
+    proxy._memory_keys.clear()
+    assert await proxy.get_all_routes() == routes
+    assert await proxy.get_route("/user/a/") is route
+    # ...until the next write
+    await proxy.add_route("/user/b/", target, {"user": "b"})
+    assert list(await proxy.get_all_routes()) == ["/user/b/"]
+    await proxy.delete_route("/user/b/")
+    assert await proxy.get_route("/user/b/") is None
+
+
+async def test_read_cache_route_store():
+    proxy = MemoryKvProxy(kv_read_cache_ttl=60, route_store_class="memory")
+    target = "http://127.0.0.1:9000"
+    store_add = proxy.route_store.add
+
+    async def add_after_read(routespec, target, data):
+        # a read between writing the config and storing the record
+        assert await proxy.get_route(routespec) is None
+        await store_add(routespec, target, data)
+
+    proxy.route_store.add = add_after_read
+    await proxy.add_route("/user/a/", target, {"user": "a"})
+    route = await proxy.get_route("/user/a/")
+    assert route == {"routespec": "/user/a/", "target": target, "data": {"user": "a"}}
+
+
+@pytest.mark.parametrize("kv_jupyterhub_format", ["flat", "json"])
+async def test_skip_unchanged_route(kv_jupyterhub_format):
+    proxy = MemoryKvProxy(
+        kv_jupyterhub_format=kv_jupyterhub_format, skip_unchanged_routes=True
+    )
+    target = "http://127.0.0.1:9000"
+    data = {"user": "a", "count": 1}
+    await proxy.add_route("/user/a/", target, data)
+    revision = proxy._memory_revision
+    await proxy.add_route("/user/a/", target, dict(data))
+    assert proxy._memory_revision == revision
+
+    await proxy.add_route("/user/a/", target, {"user": "a", "count": 2})
+    assert proxy._memory_revision == revision + 1
+
+    # a route stored in the other format is rewritten
+    proxy.kv_jupyterhub_format = "json" if kv_jupyterhub_format == "flat" else "flat"
+    assert not await proxy._route_is_current("/user/a/", target, data)
+
+    proxy.skip_unchanged_routes = False
+    await proxy.add_route("/user/a/", target, {"user": "a", "count": 2})
+    assert proxy._memory_revision == revision + 2
+
+
+@pytest.mark.parametrize("route_store_class", ["provider", "memory"])
+async def test_delete_routes(route_store_class, monkeypatch):
+    proxy = MemoryKvProxy(route_store_class=route_store_class)
+    target = "http://127.0.0.1:9000"
+    routespecs = [f"/user/{i}/" for i in range(10)]
+    for routespec in routespecs:
+        await proxy.add_route(routespec, target, {"user": routespec})
+    await proxy.add_route("/user/keep/", target, {"user": "keep"})
+
+    deletes = []
+    kv_atomic_delete = proxy._kv_atomic_delete
+
+    async def counting_delete(*keys):
+        deletes.append(keys)
+        await kv_atomic_delete(*keys)
+
+    proxy._kv_atomic_delete = counting_delete
+    # at most 3 routes per transaction: routes are never split
+    monkeypatch.setattr(MemoryKvProxy, "_kv_max_txn_ops", 13)
+    results = await proxy.delete_routes(routespecs)
+    assert results == dict.fromkeys(routespecs)
+    assert len(deletes) == (4 if route_store_class == "provider" else 2)
+    assert sorted(await proxy.get_all_routes()) == ["/user/keep/"]
+    assert [key for key in proxy._memory_values if key.startswith("traefik/")]
+
+    # failed transactions are reported per route
+    proxy.memory_failure_rate = 1
+    results = await proxy.delete_routes(["/user/keep/"])
+    assert isinstance(results["/user/keep/"], ConnectionError)
+    # the route stays indexed
+    assert proxy.route_index.find({"data.user": "keep"}) == {"/user/keep/"}
+
+
+@pytest.mark.parametrize("route_store_class", ["provider", "sqlite"])
+async def test_preload_routes(route_store_class, tmp_path, monkeypatch):
+    config = Config()
+    config.SQLiteRouteStore.db_file = str(tmp_path / "routes.sqlite")
+    proxy = MemoryKvProxy(
+        route_store_class=route_store_class,
+        skip_unchanged_routes=True,
+        config=config,
+    )
+    target = "http://127.0.0.1:9000"
+    ready = SimpleNamespace(ready=True, proxy_spec="/user/a/", server=Mock(host=target))
+    stopped = SimpleNamespace(ready=False, proxy_spec="/user/b/")
+    proxy.app = SimpleNamespace(
+        hub=Mock(routespec="/", host="http://127.0.0.1:8081"),
+        users={
+            1: SimpleNamespace(name="a", spawners={"": ready}),
+            2: SimpleNamespace(name="b", spawners={"": stopped}),
+        },
+        _service_map={},
+        subdomain_host="",
+    )
+    proxy.extra_routes = {"/extra/": target}
+
+    writes = []
+    kv_atomic_set = proxy._kv_atomic_set
+
+    async def counting_set(to_set):
+        writes.append(to_set)
+        await kv_atomic_set(to_set)
+
+    proxy._kv_atomic_set = counting_set
+    monkeypatch.setattr(MemoryKvProxy, "_kv_max_txn_ops", 1000)
+    await proxy._preload_routes()
+    assert len(writes) == 1
+    routes = await proxy.get_all_routes()
+    # stopped servers aren't routed
+    assert sorted(routes) == ["/", "/extra/", "/user/a/"]
+    assert routes["/user/a/"] == {
+        "routespec": "/user/a/",
+        "target": target,
+        "data": {"user": "a", "server_name": ""},
+    }
+
+    # unchanged routes aren't written again
+    await proxy._preload_routes()
+    assert len(writes) == 1
+
+
+@pytest.mark.parametrize("route_store_class", ["memory", "sqlite"])
+async def test_route_store(route_store_class, tmp_path):
+    config = Config()
+    config.SQLiteRouteStore.db_file = str(tmp_path / "routes.sqlite")
+    proxy = MemoryKvProxy(route_store_class=route_store_class, config=config)
+    target = "http://127.0.0.1:9000"
+    await proxy.add_route("/user/a/", target, {"user": "a"})
+    await proxy.add_route("/user/b/", target, {"user": "b"})
+    # only traefik's config is in the provider
+    assert not [key for key in proxy._memory_values if key.startswith("jupyterhub/")]
+    assert [key for key in proxy._memory_values if key.startswith("traefik/")]
+
+    route_a = {"routespec": "/user/a/", "target": target, "data": {"user": "a"}}
+    assert await proxy.get_route("/user/a/") == route_a
+    assert await proxy.get_routes(["/user/a/", "/user/c/"]) == {
+        "/user/a/": route_a,
+        "/user/c/": None,
+    }
+    assert sorted(await proxy.get_all_routes()) == ["/user/a/", "/user/b/"]
+
+    # unchanged routes are detected with the store
+    proxy.skip_unchanged_routes = True
+    revision = proxy._memory_revision
+    await proxy.add_route("/user/a/", target, {"user": "a"})
+    assert proxy._memory_revision == revision
+    await proxy.add_route("/user/a/", target, {"user": "changed"})
+    assert (await proxy.get_route("/user/a/"))["data"] == {"user": "changed"}
+
+    await proxy.delete_route("/user/a/")
+    assert await proxy.get_route("/user/a/") is None
+    assert list(await proxy.get_all_routes()) == ["/user/b/"]
+    await proxy.route_store.close()
+
+
+@pytest.mark.parametrize("route_store_class", ["memory", "sqlite"])
+async def test_route_store_migration(route_store_class, tmp_path):
+    config = Config()
+    config.SQLiteRouteStore.db_file = str(tmp_path / "routes.sqlite")
+    proxy = MemoryKvProxy(
+        route_store_class="provider",
+        memory_http_url=f"http://127.0.0.1:{random_port()}",
+        config=config,
+    )
+    target = "http://127.0.0.1:9000"
+    await proxy.add_route("/user/a/", target, {"user": "a"})
+    await proxy.add_route("/user/b/", target, {"user": "b"})
+
+    proxy.route_store_class = route_store_class
+    proxy.route_store = proxy._default_route_store()
+    await proxy.route_store.add("/user/b/", target, {"user": "stored"})
+    try:
+        await proxy._setup_traefik_dynamic_config()
+    finally:
+        proxy._http_server.stop()
+    # records are moved from the provider to the store
+    assert not [key for key in proxy._memory_values if key.startswith("jupyterhub/")]
+    routes = await proxy.get_all_routes()
+    assert routes == {
+        "/user/a/": {"routespec": "/user/a/", "target": target, "data": {"user": "a"}},
+        "/user/b/": {
+            "routespec": "/user/b/",
+            "target": target,
+            "data": {"user": "stored"},
+        },
+    }
+    await proxy.route_store.close()
+
+
+class MockResponse:
+    def __init__(self, body, next_page=1):
+        self.body = json.dumps(body).encode()
+        self.headers = {"X-Next-Page": str(next_page)}
+
+
+async def test_memory_route_store_load():
+    proxy = MemoryKvProxy(route_store_class="memory")
+    pages = {
+        "/api/http/routers?per_page=1000&page=1": MockResponse(
+            [
+                {"name": "route_api@http", "service": "api@internal"},
+                {
+                    "name": "router__2Fuser_2Fa_2F@http",
+                    "service": "service__2Fuser_2Fa_2F",
+                },
+            ],
+            next_page=2,
+        ),
+        "/api/http/routers?per_page=1000&page=2": MockResponse(
+            [
+                {
+                    "name": "router__2Fuser_2Fb_2F@file",
+                    "service": "service__2Fuser_2Fb_2F",
+                }
+            ]
+        ),
+        "/api/http/services?per_page=1000&page=1": MockResponse(
+            [
+                {
+                    "name": "service__2Fuser_2Fa_2F@http",
+                    "loadBalancer": {"servers": [{"url": "http://127.0.0.1:9000"}]},
+                }
+            ]
+        ),
+    }
+
+    async def traefik_api_request(path):
+        return pages[path]
+
+    proxy._traefik_api_request = traefik_api_request
+    await proxy.route_store.load()
+    # only routes from our own provider are loaded
+    assert await proxy.get_all_routes() == {
+        "/user/a/": {
+            "routespec": "/user/a/",
+            "target": "http://127.0.0.1:9000",
+            "data": {},
+        }
+    }
+
+
+async def test_find_routes():
+    proxy = MemoryKvProxy(route_index_data_keys=["user", "count"])
+    await proxy.add_route("/user/a/", "http://10.0.0.1:9000", {"user": "a", "count": 1})
+    await proxy.add_route(
+        "/user/a/x/", "http://10.0.0.2:9000", {"user": "a", "count": 2}
+    )
+    await proxy.add_route("/user/b/", "http://10.0.0.1:9001", {"user": "b", "count": 1})
+
+    async def find(**filters):
+        return sorted(await proxy.find_routes(**filters))
+
+    # rebuilt from get_all_routes, where flat values are strings
+    proxy.route_index = RouteIndex(proxy.route_index_data_keys)
+    assert await find(user="a") == ["/user/a/", "/user/a/x/"]
+    assert await find(target_host="10.0.0.1") == ["/user/a/", "/user/b/"]
+    assert await find(count=1, target_host="10.0.0.1") == ["/user/a/", "/user/b/"]
+    assert await find(user="a", count="1") == ["/user/a/"]
+    # unindexed filters narrow indexed results
+    assert await find(user="a", server_name="") == []
+    assert await find(user="nobody") == []
+    with pytest.raises(ValueError):
+        await proxy.find_routes(server_name="")
+
+    # kept up to date by add_route and delete_route
+    await proxy.add_route("/user/c/", "http://10.0.0.3:9000", {"user": "a"})
+    await proxy.delete_route("/user/a/")
+    assert await find(user="a") == ["/user/a/x/", "/user/c/"]
+
+    # stale entries are dropped
+    await proxy._kv_atomic_delete("jupyterhub/routes/")
+    assert await find(user="a") == []
+
+
+def test_route_index_matches():
+    index = RouteIndex(["user"])
+    route = {
+        "target": "http://10.0.0.1:9000",
+        "data": {"user": "a", "count": 1, "tags": ["x"], "extra": {"a": 1}},
+    }
+    assert index.matches(route, {"data.count": "1", "target_host": "10.0.0.1"})
+    assert index.matches(route, {"data.extra": {"a": 1}, "data.tags": ["x"]})
+    # values that can't be normalized only match if they are equal
+    assert not index.matches(route, {"data.extra": {"a": 2}})
+    assert not index.matches(route, {"data.tags": {"a": 1}})
+    assert not index.matches(route, {"data.missing": {"a": 1}})
+    assert not index.matches(route, {"data.extra": "a"})
+    assert not index.matches(route, {"data.user": None})
+    assert index.matches(route, {"data.missing": None})
+
+
+class FakeConsul:
+    """consul client answering kv gets and get-tree transactions from a dict"""
+
+    def __init__(self, data):
+        self.data = data
+        self.returned = []
+        self.kv = SimpleNamespace(get=self._get)
+        self.txn = SimpleNamespace(put=self._txn)
+
+    async def _get(self, key):
+        if key not in self.data:
+            return 0, None
+        self.returned.append(key)
+        return 0, {"Key": key, "Value": self.data[key].encode("utf8")}
+
+    async def _txn(self, payload):
+        results = []
+        for op in payload:
+            assert op["KV"]["Verb"] == "get-tree"
+            prefix = op["KV"]["Key"]
+            for key, value in sorted(self.data.items()):
+                if key.startswith(prefix):
+                    self.returned.append(key)
+                    value = base64.b64encode(value.encode("utf8")).decode("ascii")
+                    results.append({"KV": {"Key": key, "Value": value}})
+        return {"Results": results}
+
+
+async def test_consul_get_batch_exact_keys():
+    from jupyterhub_traefik_proxy.consul import TraefikConsulProxy
+
+    proxy = TraefikConsulProxy()
+    target = "http://127.0.0.1:9000"
+    data = {}
+    for routespec in ["/", "/user/a/", "/user/a/b/", "/user/ab/"]:
+        data.update(proxy._flat_config_for_route(routespec, target, {"a": "1"}))
+    proxy.kv_jupyterhub_format = "json"
+    data.update(proxy._flat_config_for_route("/user/json/", target, {"a": "1"}))
+    proxy.consul = FakeConsul(data)
+
+    routes = await proxy.get_routes(["/", "/user/a/", "/user/json/", "/missing/"])
+    assert routes == {
+        "/": {"routespec": "/", "target": target, "data": {"a": "1"}},
+        "/user/a/": {"routespec": "/user/a/", "target": target, "data": {"a": "1"}},
+        "/user/json/": {
+            "routespec": "/user/json/",
+            "target": target,
+            "data": {"a": "1"},
+        },
+        "/missing/": None,
+    }
+    # no other route's records are read
+    route_keys = {
+        proxy._jupyterhub_route_key(traefik_utils.generate_alias(routespec, "router"))
+        for routespec in ["/", "/user/a/", "/user/json/"]
+    }
+    assert proxy.consul.returned
+    for key in proxy.consul.returned:
+        assert any(
+            key == route_key or key.startswith(route_key + "/")
+            for route_key in route_keys
+        )
+
+
+async def test_etcd_endpoints(tmp_path):
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy, _latest_reads
+
+    proxy = TraefikEtcdProxy(
+        etcd_urls=["http://10.0.0.1:2379", "http://10.0.0.2:2379"],
+        etcd_read_consistency="serializable",
+        static_config_file=str(tmp_path / "traefik.toml"),
+    )
+    try:
+        assert sorted(proxy.etcd.endpoints) == ["10.0.0.1:2379", "10.0.0.2:2379"]
+        assert proxy.etcd.failover
+        await proxy._setup_traefik_static_config()
+        endpoints = proxy.static_config["providers"]["etcd"]["endpoints"]
+        assert endpoints == ["10.0.0.1:2379", "10.0.0.2:2379"]
+
+        assert proxy._etcd_read_kwargs() == {"serializable": True}
+        # reads for writes are linearizable
+        token = _latest_reads.set(True)
+        assert proxy._etcd_read_kwargs() == {}
+        _latest_reads.reset(token)
+    finally:
+        proxy.etcd.close()
+
+
+async def test_etcd_preload_linearizable(monkeypatch):
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+    from jupyterhub_traefik_proxy.proxy import TraefikProxy
+
+    proxy = TraefikEtcdProxy(etcd_read_consistency="serializable")
+    read_kwargs = []
+
+    async def preload_routes(self):
+        read_kwargs.append(self._etcd_read_kwargs())
+
+    monkeypatch.setattr(TraefikProxy, "_preload_routes", preload_routes)
+    try:
+        await proxy._preload_routes()
+        # routes are read to decide which to write
+        assert read_kwargs == [{}]
+        assert proxy._etcd_read_kwargs() == {"serializable": True}
+    finally:
+        proxy.etcd.close()
+
+
+class CountingKVStub:
+    """etcd KV stub answering range reads in transactions from a dict"""
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def Range(self, request, *args, **kwargs):
+        self.requests.append(request)
+        raise AssertionError("batch reads must use transactions")
+
+    def Txn(self, request, *args, **kwargs):
+        from etcd3.etcdrpc import RangeResponse, ResponseOp, TxnResponse
+        from etcd3.etcdrpc.kv_pb2 import KeyValue
+
+        self.requests.append(request)
+        responses = []
+        for op in request.success:
+            key, range_end = op.request_range.key, op.request_range.range_end
+            kvs = [
+                KeyValue(key=k, value=v)
+                for k, v in sorted(self.data.items())
+                if (key <= k < range_end if range_end else k == key)
+            ]
+            responses.append(ResponseOp(response_range=RangeResponse(kvs=kvs)))
+        return TxnResponse(succeeded=True, responses=responses)
+
+
+async def test_etcd_serializable_batch(monkeypatch):
+    from etcd3 import Etcd3Client
+
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+
+    proxy = TraefikEtcdProxy(etcd_read_consistency="serializable", etcd_max_txn_ops=4)
+    data = {f"routes/{i}/target".encode(): f"{i}".encode() for i in range(10)}
+    data[b"single"] = b"value"
+    stub = CountingKVStub(data)
+    monkeypatch.setattr(Etcd3Client, "kvstub", stub)
+    try:
+        keys = ["single", "missing"] + [f"routes/{i}/" for i in range(8)]
+        results = await proxy._kv_get_batch(keys)
+        assert results[:2] == ["value", None]
+        assert results[2:] == [{"target": f"{i}"} for i in range(8)]
+        # one serializable transaction per etcd_max_txn_ops keys
+        assert len(stub.requests) == 3
+        for request in stub.requests:
+            assert all(op.request_range.serializable for op in request.success)
+    finally:
+        proxy.etcd.close()
+
+
+class FlakyLeaseStub:
+    """etcd lease stub failing the first keepalive while it is sent"""
+
+    def __init__(self):
+        self.keepalives = 0
+        self.ttl_requests = []
+
+    def LeaseKeepAlive(self, requests, *args, **kwargs):
+        import grpc
+        from etcd3.etcdrpc import LeaseKeepAliveResponse
+
+        class Unavailable(grpc.RpcError):
+            def code(self):
+                return grpc.StatusCode.UNAVAILABLE
+
+        self.keepalives += 1
+        if self.keepalives == 1:
+
+            def fail():
+                raise Unavailable()
+                yield
+
+            return fail()
+        return iter([LeaseKeepAliveResponse(ID=next(requests).ID, TTL=30)])
+
+    def LeaseTimeToLive(self, request, *args, **kwargs):
+        from etcd3.etcdrpc import LeaseTimeToLiveResponse
+
+        self.ttl_requests.append(request)
+        return LeaseTimeToLiveResponse(ID=request.ID, TTL=10)
+
+
+async def test_etcd_lease_requests(monkeypatch):
+    from etcd3 import MultiEndpointEtcd3Client
+
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+
+    proxy = TraefikEtcdProxy(
+        etcd_urls=["http://10.0.0.1:2379", "http://10.0.0.2:2379"],
+        etcd_route_lease_ttl=30,
+    )
+    stub = FlakyLeaseStub()
+    monkeypatch.setattr(MultiEndpointEtcd3Client, "leasestub", stub)
+    try:
+        # a keepalive failing on one endpoint is retried on the other
+        assert await proxy._etcd_refresh_lease(5) == 30
+        assert stub.keepalives == 2
+        assert proxy._etcd_lease_ttl(5) == 10
+        assert not stub.ttl_requests[0].keys
+    finally:
+        proxy.etcd.close()
+
+
+async def test_etcd_stop_keepalive():
+    import asyncio
+
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+
+    proxy = TraefikEtcdProxy(should_start=False, etcd_route_lease_ttl=30)
+    # no etcd to set up the dynamic config in
+    proxy._start_future.cancel()
+    task = proxy._etcd_keepalive_task = asyncio.ensure_future(proxy._etcd_keepalive())
+    await proxy.stop()
+    assert proxy._etcd_keepalive_task is None
+    await asyncio.sleep(0)
+    assert task.cancelled()
@@ -8,7 +8,7 @@ import ssl
 import subprocess
 import sys
 from contextlib import contextmanager
-from os.path import abspath, dirname, join
+from os.path import abspath, dirname, exists, join
 from random import randint
 from unittest.mock import Mock
 from urllib.parse import quote, urlparse
@@ -21,6 +21,7 @@ from jupyterhub.user import User
 from jupyterhub.utils import exponential_backoff, url_path_join
 from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
 
+from jupyterhub_traefik_proxy import traefik_utils
 from jupyterhub_traefik_proxy.proxy import TraefikProxy
 
 # Mark all tests in this file as slow
@@ -156,6 +157,52 @@ def test_default_port():
         TraefikProxy(public_url="ftp://127.0.0.1:23/")
 
 
+async def test_replica_static_config(tmp_path):
+    from jupyterhub_traefik_proxy.fileprovider import TraefikFileProviderProxy
+
+    proxy = TraefikFileProviderProxy(
+        should_start=True,
+        static_config_file=str(tmp_path / "traefik.toml"),
+        dynamic_config_file=str(tmp_path / "rules.toml"),
+        traefik_api_url="http://127.0.0.1:8099",
+        traefik_replicas=3,
+    )
+    await proxy._setup_traefik_static_config()
+    assert proxy._replica_api_url(2) == "http://127.0.0.1:8101"
+    for replica in range(3):
+        config_file = proxy._replica_static_config_file(replica)
+        handler = traefik_utils.TraefikConfigFileHandler(config_file)
+        entrypoints = handler.load()["entryPoints"]
+        api_entrypoint = entrypoints[proxy.traefik_api_entrypoint]
+        assert api_entrypoint["address"] == f"127.0.0.1:{8099 + replica}"
+        assert entrypoints[proxy.traefik_entrypoint]["reusePort"]
+    proxy._cleanup()
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_metrics_static_config(tmp_path):
+    from jupyterhub_traefik_proxy.fileprovider import TraefikFileProviderProxy
+
+    proxy = TraefikFileProviderProxy(
+        should_start=True,
+        static_config_file=str(tmp_path / "traefik.toml"),
+        dynamic_config_file=str(tmp_path / "rules.toml"),
+        traefik_api_url="http://127.0.0.1:8099",
+        traefik_metrics_url="http://127.0.0.1:8082",
+        traefik_replicas=2,
+    )
+    await proxy._setup_traefik_static_config()
+    for replica in range(2):
+        config_file = proxy._replica_static_config_file(replica)
+        static_config = traefik_utils.TraefikConfigFileHandler(config_file).load()
+        prometheus = static_config["metrics"]["prometheus"]
+        assert prometheus["entryPoint"] == "metrics"
+        assert prometheus["addRoutersLabels"]
+        metrics_entrypoint = static_config["entryPoints"]["metrics"]
+        assert metrics_entrypoint["address"] == f"127.0.0.1:{8082 + replica}"
+    proxy._cleanup()
+
+
 @pytest.mark.parametrize(
     "routespec, existing_routes",
     [
@@ -504,3 +551,317 @@ async def test_websockets(proxy, launch_backends):
         port = await websocket.recv()
 
     assert port == str(default_backend_port)
+
+
+async def test_get_routes(proxy, launch_backends):
+    routespecs = ["/proxy/batch1/", "/proxy/batch2/"]
+    targets = await launch_backends(len(routespecs))
+    for routespec, target in zip(routespecs, targets):
+        await proxy.add_route(routespec, target, {"test": routespec})
+
+    expected = {
+        routespec: {
+            "routespec": routespec,
+            "target": target,
+            "data": {"test": routespec},
+        }
+        for routespec, target in zip(routespecs, targets)
+    }
+    expected["/proxy/missing/"] = None
+    routes = await proxy.get_routes(routespecs + ["/proxy/missing/"])
+    assert_equal(routes, expected)
+
+    for routespec in routespecs:
+        await proxy.delete_route(routespec)
+
+
+async def test_add_unchanged_route(proxy, launch_backends):
+    routespec = "/proxy/unchanged/"
+    target, other_target = await launch_backends(2)
+    data = {"test": "unchanged"}
+    await proxy.add_route(routespec, target, data)
+
+    apply_route_config = proxy._apply_route_config
+    calls = []
+
+    async def counting_apply_route_config(*args):
+        calls.append(args)
+        await apply_route_config(*args)
+
+    proxy._apply_route_config = counting_apply_route_config
+    try:
+        # same route: no write
+        await proxy.add_route(routespec, target, dict(data))
+        assert calls == []
+        # changed target or data: written
+        await proxy.add_route(routespec, other_target, data)
+        await proxy.add_route(routespec, other_target, {"test": "changed"})
+        assert len(calls) == 2
+    finally:
+        del proxy._apply_route_config
+        await proxy.delete_route(routespec)
+
+
+async def test_delete_routes(proxy, launch_backends):
+    routespecs = ["/proxy/cull1/", "/proxy/cull2/", "/proxy/keep/"]
+    targets = await launch_backends(len(routespecs))
+    for routespec, target in zip(routespecs, targets):
+        await proxy.add_route(routespec, target, {"test": routespec})
+
+    results = await proxy.delete_routes(
+        ["/proxy/cull1", "/proxy/cull2/", "/proxy/missing/"]
+    )
+    assert results == {
+        "/proxy/cull1/": None,
+        "/proxy/cull2/": None,
+        "/proxy/missing/": None,
+    }
+    routes = await proxy.get_all_routes()
+    assert sorted(routes) == ["/proxy/keep/"]
+
+    await proxy.delete_route("/proxy/keep/")
+
+
+async def test_etcd_compare_and_swap(proxy, launch_backends):
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+
+    if not isinstance(proxy, TraefikEtcdProxy):
+        pytest.skip("etcd only")
+    proxy.etcd_compare_and_swap = True
+    routespec = "/proxy/cas/"
+    target, other_target = await launch_backends(2)
+    await proxy.add_route(routespec, target, {"test": "cas"})
+
+    # a key left by another writer is removed by the next write
+    router_alias = proxy._keys_for_route(routespec)[0][0][-1]
+    stray_key = proxy.kv_separator.join(
+        [proxy.kv_traefik_prefix, "http", "routers", router_alias, "priority"]
+    )
+    await proxy._kv_atomic_set({stray_key: "1"})
+    await proxy.add_route(routespec, other_target, {"test": "cas"})
+    assert await proxy._kv_get(stray_key) is None
+    route = await proxy.get_route(routespec)
+    assert route["target"] == other_target
+
+    await proxy.delete_route(routespec)
+
+
+async def test_etcd_route_lease(proxy, launch_backends):
+    from jupyterhub_traefik_proxy.etcd import TraefikEtcdProxy
+
+    if not isinstance(proxy, TraefikEtcdProxy):
+        pytest.skip("etcd only")
+    proxy.etcd_route_lease_ttl = 30
+    routespec = "/proxy/lease/"
+    (target,) = await launch_backends(1)
+    try:
+        await proxy.add_route(routespec, target, {"test": "lease"})
+        lease_id = proxy._etcd_lease_id
+        assert lease_id
+        # all routes share the lease
+        await proxy.add_route("/proxy/lease2/", target, {})
+        assert proxy._etcd_lease_id == lease_id
+        info = proxy.etcd.get_lease_info(lease_id)
+        assert 0 < info.TTL <= 30
+        keys = [key.decode("utf8") for key in info.keys]
+        assert any("lease2" in key for key in keys)
+        assert not any(key.endswith(proxy._etcd_lease_key) for key in keys)
+    finally:
+        proxy.etcd_route_lease_ttl = 0
+        await proxy.delete_routes([routespec, "/proxy/lease2/"])
+
+
+async def test_startup_timings(proxy):
+    if not proxy.should_start:
+        pytest.skip("only when the Hub starts traefik")
+    phases = {
+        "hash_api_password",
+        "static_config",
+        "launch",
+        "dynamic_config",
+        "wait_ready",
+        "route_store",
+        "total",
+    }
+    assert set(proxy.startup_timings) == phases
+    assert all(duration >= 0 for duration in proxy.startup_timings.values())
+
+
+async def test_adopt_traefik(file_proxy_factory, tmp_path, launch_backends):
+    pid_file = str(tmp_path / "traefik.pid")
+    proxy = file_proxy_factory(traefik_pid_file=pid_file)
+    await proxy.start()
+    pid = proxy.traefik_process.pid
+    routespec = "/proxy/adopted/"
+    (target,) = await launch_backends(1)
+    await proxy.add_route(routespec, target, {"test": "adopt"})
+
+    # a restarted Hub, which didn't stop the proxy (JupyterHub.cleanup_proxy = False)
+    proxy = file_proxy_factory(traefik_pid_file=pid_file)
+    try:
+        await proxy.start()
+        assert proxy.traefik_process.pid == pid
+        route = await proxy.get_route(routespec)
+        assert route["target"] == target
+        resp = await AsyncHTTPClient().fetch(proxy.public_url.rstrip("/") + routespec)
+        assert resp.code == 200
+
+        # a changed static config restarts traefik
+        proxy = file_proxy_factory(
+            traefik_pid_file=pid_file, traefik_providers_throttle_duration="1s"
+        )
+        await proxy.start()
+        assert proxy.traefik_process.pid != pid
+    finally:
+        await proxy.stop()
+    assert not exists(pid_file)
+
+
+async def test_supervise_traefik(file_proxy_factory, launch_backends):
+    proxy = file_proxy_factory(supervise_traefik=True, traefik_supervise_interval=0.1)
+    await proxy.start()
+    try:
+        routespec = "/proxy/supervised/"
+        (target,) = await launch_backends(1)
+        await proxy.add_route(routespec, target, {})
+        pid = proxy.traefik_process.pid
+        proxy.traefik_process.kill()
+
+        async def _restarted():
+            return proxy.traefik_process.pid != pid
+
+        await exponential_backoff(_restarted, "traefik not restarted", timeout=30)
+        await proxy._wait_ready()
+        url = proxy.public_url.rstrip("/") + routespec
+
+        async def _routed():
+            try:
+                resp = await AsyncHTTPClient().fetch(url)
+            except (HTTPClientError, OSError):
+                return False
+            return resp.code == 200
+
+        await exponential_backoff(_routed, "route not restored", timeout=30)
+    finally:
+        await proxy.stop()
+
+
+def test_traefik_up_shared():
+    from jupyterhub_traefik_proxy import metrics
+
+    before = metrics.TRAEFIK_UP._value.get()
+    a = TraefikProxy()
+    b = TraefikProxy()
+    a._set_traefik_up(2)
+    b._set_traefik_up(3)
+    a._set_traefik_up(1)
+    # each proxy only changes its own share, e.g. shards of TraefikShardedProxy
+    assert metrics.TRAEFIK_UP._value.get() - before == 4
+    a._set_traefik_up(0)
+    b._set_traefik_up(0)
+    assert metrics.TRAEFIK_UP._value.get() == before
+
+
+def _traefik_version():
+    out = subprocess.check_output(["traefik", "version"], text=True)
+    for line in out.splitlines():
+        if line.startswith("Version:"):
+            return tuple(int(part) for part in line.split()[1].split(".")[:2])
+
+
+async def test_rolling_restart(file_proxy_factory, launch_backends):
+    if _traefik_version() < (3, 1):
+        pytest.skip("reusePort needs traefik 3.1")
+    proxy = file_proxy_factory(traefik_reuse_port=True, traefik_grace_timeout=2)
+    await proxy.start()
+    try:
+        routespec = "/proxy/rolling/"
+        (target,) = await launch_backends(1)
+        await proxy.add_route(routespec, target, {})
+        url = proxy.public_url.rstrip("/") + routespec
+        await AsyncHTTPClient().fetch(url)
+        old_pid = proxy.traefik_process.pid
+
+        # requests keep succeeding while traefik is replaced
+        restart = asyncio.ensure_future(proxy.rolling_restart())
+        while not restart.done():
+            resp = await AsyncHTTPClient().fetch(url)
+            assert resp.code == 200
+        await restart
+        assert proxy.traefik_process.pid != old_pid
+        resp = await AsyncHTTPClient().fetch(url)
+        assert resp.code == 200
+    finally:
+        await proxy.stop()
+
+
+async def test_route_metrics(file_proxy_factory, launch_backends):
+    proxy = file_proxy_factory(traefik_metrics_url="http://127.0.0.1:8082")
+    await proxy.start()
+    try:
+        routespec = "/proxy/metrics/"
+        (target,) = await launch_backends(1)
+        await proxy.add_route(routespec, target, {})
+        assert routespec not in await proxy.get_route_metrics()
+        url = proxy.public_url.rstrip("/") + routespec
+        for _ in range(5):
+            resp = await AsyncHTTPClient().fetch(url)
+            assert resp.code == 200
+        route_metrics = (await proxy.get_route_metrics())[routespec]
+        assert route_metrics["requests"] == 5
+        assert route_metrics["request_rate"] > 0
+        assert route_metrics["duration_quantiles"][0.5] > 0
+    finally:
+        await proxy.stop()
+
+
+async def test_access_log(file_proxy_factory, launch_backends, tmp_path):
+    proxy = file_proxy_factory(
+        traefik_access_log_file=str(tmp_path / "access.log"),
+        access_log_read_interval=0.1,
+    )
+    await proxy.start()
+    try:
+        static_config = traefik_utils.TraefikConfigFileHandler(
+            proxy.static_config_file
+        ).load()
+        assert static_config["accessLog"]["format"] == "json"
+        routespec = "/proxy/logged/"
+        (target,) = await launch_backends(1)
+        await proxy.add_route(routespec, target, {})
+        url = proxy.public_url.rstrip("/") + routespec
+        for _ in range(5):
+            resp = await AsyncHTTPClient().fetch(url)
+            assert resp.code == 200
+
+        async def logged():
+            route_stats = proxy.access_log_stats.summary().get(routespec)
+            return route_stats is not None and route_stats["requests"] == 5
+
+        await exponential_backoff(logged, "requests not in the access log", timeout=10)
+        assert proxy.access_log_stats.summary()[routespec]["status"] == {"2xx": 5}
+    finally:
+        await proxy.stop()
+
+
+async def test_traefik_replicas(file_proxy_factory, launch_backends):
+    if _traefik_version() < (3, 1):
+        pytest.skip("reusePort needs traefik 3.1")
+    proxy = file_proxy_factory(traefik_replicas=2)
+    await proxy.start()
+    try:
+        assert len(proxy.traefik_processes) == 2
+        routespec = "/proxy/replicated/"
+        (target,) = await launch_backends(1)
+        await proxy.add_route(routespec, target, {})
+        # every replica has loaded the route once it is added
+        for replica in range(2):
+            assert await proxy._check_for_traefik_service(
+                routespec, "router", proxy._replica_api_url(replica)
+            )
+        url = proxy.public_url.rstrip("/") + routespec
+        for _ in range(10):
+            resp = await AsyncHTTPClient().fetch(url)
+            assert resp.code == 200
+    finally:
+        await proxy.stop()
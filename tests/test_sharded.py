@@ -0,0 +1,83 @@
+"""Tests for TraefikShardedProxy, with in-memory shards"""
+
+from types import SimpleNamespace
+
+from jupyterhub_traefik_proxy.memory import TraefikMemoryProxy
+from jupyterhub_traefik_proxy.sharded import TraefikShardedProxy
+
+
+class MemoryShardProxy(TraefikMemoryProxy):
+    """In-memory proxy that doesn't wait for traefik"""
+
+    async def _wait_for_route(self, routespec):
+        pass
+
+
+def _sharded_proxy(n=3, **kwargs):
+    return TraefikShardedProxy(
+        shard_class=MemoryShardProxy,
+        shards=[{"route_index_data_keys": ["user"]} for _ in range(n)],
+        **kwargs,
+    )
+
+
+async def test_sharded_routes():
+    proxy = _sharded_proxy(shard_by="routespec")
+    target = "http://127.0.0.1:9000"
+    routespecs = [f"/user/{i}/" for i in range(30)]
+    for i, routespec in enumerate(routespecs):
+        await proxy.add_route(routespec, target, {"user": str(i)})
+    # the default route is in every shard
+    await proxy.add_route("/", target, {"hub": True})
+    assert proxy.route_shards("/") == [0, 1, 2]
+
+    for routespec in routespecs:
+        shards = proxy.route_shards(routespec)
+        assert len(shards) == 1
+        # stable, and only written to its shard
+        assert shards == proxy.route_shards(routespec.rstrip("/"))
+        for index, shard in enumerate(proxy.shard_proxies):
+            route = await shard.get_route(routespec)
+            assert (route is not None) == (index in shards)
+    # every shard has some of the routes
+    assert all([len(await shard.get_all_routes()) > 1 for shard in proxy.shard_proxies])
+
+    all_routes = await proxy.get_all_routes()
+    assert sorted(all_routes) == sorted(routespecs + ["/"])
+    assert (await proxy.get_route("/user/3/"))["data"] == {"user": "3"}
+    routes = await proxy.get_routes(["/user/1", "/user/missing/"])
+    assert routes["/user/1/"]["target"] == target
+    assert routes["/user/missing/"] is None
+    assert list(await proxy.find_routes(user="4")) == ["/user/4/"]
+
+    results = await proxy.delete_routes(routespecs[:10] + ["/"])
+    assert set(results) == set(routespecs[:10] + ["/"])
+    assert not any(results.values())
+    await proxy.delete_route(routespecs[10])
+    assert sorted(await proxy.get_all_routes()) == sorted(routespecs[11:])
+
+
+async def test_shard_by_host():
+    proxy = _sharded_proxy(shard_by="host", shard_hosts={"pinned.example": 1})
+    assert proxy.route_shards("a.example/user/x/") == proxy.route_shards(
+        "a.example/user/y/"
+    )
+    assert proxy.route_shards("pinned.example/") == [1]
+    # routes without a host may be reached on any shard
+    assert proxy.route_shards("/hub/") == [0, 1, 2]
+
+
+async def test_sharded_preload():
+    hub = SimpleNamespace(routespec="/", host="http://127.0.0.1:8081")
+    app = SimpleNamespace(hub=hub, users={}, subdomain_host="")
+    proxy = _sharded_proxy(
+        shard_by="routespec",
+        app=app,
+        extra_routes={f"/extra/{i}/": "http://127.0.0.1:9000" for i in range(10)},
+    )
+    for shard in proxy.shard_proxies:
+        await shard._preload_routes()
+    for index, shard in enumerate(proxy.shard_proxies):
+        for routespec in await shard.get_all_routes():
+            assert index in proxy.route_shards(routespec)
+    assert len(await proxy.get_all_routes()) == 11
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import os
+import socket
 
 import pytest
 
@@ -76,3 +78,139 @@ def test_atomic_writing_recovery(tmpdir):
 
     # didn't leave any residue
     assert tmpdir.listdir() == [testfile]
+
+
+class Coalesced:
+    ttl = 0
+
+    def __init__(self):
+        self.calls = 0
+
+    @traefik_utils.coalesce(ttl="ttl")
+    async def read(self, key):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if key == "fail":
+            raise ValueError(key)
+        return {"key": key, "call": self.calls}
+
+
+async def test_coalesce_concurrent():
+    a = Coalesced()
+    b = Coalesced()
+    results = await asyncio.gather(a.read("x"), a.read("x"), a.read("y"), b.read("x"))
+    assert results[0] is results[1]
+    # one call per instance and key
+    assert a.calls == 2
+    assert b.calls == 1
+    # no ttl: finished calls aren't reused
+    await a.read("x")
+    assert a.calls == 3
+
+
+async def test_coalesce_ttl():
+    obj = Coalesced()
+    obj.ttl = 60
+    first = await obj.read("x")
+    assert await obj.read("x") is first
+    with pytest.raises(ValueError):
+        await obj.read("fail")
+    # failures are not reused
+    with pytest.raises(ValueError):
+        await obj.read("fail")
+    assert obj.calls == 3
+    traefik_utils.clear_coalesced(obj)
+    assert await obj.read("x") is not first
+
+
+class Bounded:
+    ttl = 60
+
+    def __init__(self):
+        self.calls = 0
+
+    @traefik_utils.coalesce(ttl="ttl", max_entries=4)
+    async def read(self, key):
+        self.calls += 1
+        return key
+
+
+async def test_coalesce_bounded():
+    obj = Bounded()
+    for key in "abcde":
+        await obj.read(key)
+    # the oldest result was dropped for the new one
+    assert [key[1][0] for key in obj._coalesced] == list("bcde")
+    await obj.read("a")
+    assert obj.calls == 6
+
+    # expired results are dropped before live ones
+    obj = Bounded()
+    obj.ttl = 0.01
+    await obj.read("a")
+    await obj.read("b")
+    obj.ttl = 60
+    await obj.read("c")
+    await obj.read("d")
+    await asyncio.sleep(0.02)
+    await obj.read("e")
+    assert [key[1][0] for key in obj._coalesced] == list("cde")
+
+
+async def test_coalesce_cancel():
+    obj = Coalesced()
+    cancelled = asyncio.ensure_future(obj.read("x"))
+    other = asyncio.ensure_future(obj.read("x"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    assert (await other)["key"] == "x"
+    assert obj.calls == 1
+
+
+def test_listening_ports():
+    ports = traefik_utils.listening_ports(os.getpid())
+    if ports is None:
+        pytest.skip("needs /proc")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        assert port not in traefik_utils.listening_ports(os.getpid())
+        sock.listen()
+        assert port in traefik_utils.listening_ports(os.getpid())
+
+
+def test_routespec_from_alias():
+    for routespec in ["/", "/user/has space/", "host.name/path/"]:
+        alias = traefik_utils.generate_alias(routespec, "router")
+        assert traefik_utils.routespec_from_alias(alias, "router") == routespec
+
+
+def _router_metrics_text(router, requests, buckets):
+    labels = f'code="200",method="GET",protocol="http",router="{router}",service="s"'
+    lines = [f"traefik_router_requests_total{{{labels}}} {requests}"]
+    for le, count in buckets:
+        lines.append(
+            f'traefik_router_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+def test_router_metrics():
+    router = traefik_utils.generate_alias("/user/a/", "router") + "@file"
+    buckets = [("0.1", 6), ("0.3", 8), ("1.2", 10), ("+Inf", 10)]
+    replicas = [
+        _router_metrics_text(router, 10, buckets),
+        _router_metrics_text(router, 10, buckets),
+    ]
+    routers = traefik_utils.router_metrics(replicas)
+    assert routers[router]["requests"] == 20
+    buckets = routers[router]["duration_buckets"]
+    assert buckets == [(0.1, 12), (0.3, 16), (1.2, 20), (float("inf"), 20)]
+    assert traefik_utils.histogram_quantile(0.5, buckets) == pytest.approx(
+        0.1 * 10 / 12
+    )
+    assert traefik_utils.histogram_quantile(0.7, buckets) == pytest.approx(0.2)
+    assert traefik_utils.histogram_quantile(0.99, buckets) == pytest.approx(1.155)
+    assert traefik_utils.histogram_quantile(0.5, [(0.1, 0), (float("inf"), 0)]) is None
+    # beyond the last finite bucket
+    assert traefik_utils.histogram_quantile(0.9, [(0.1, 1), (float("inf"), 2)]) == 0.1